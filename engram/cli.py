@@ -21,9 +21,15 @@ def main(version: bool = typer.Option(False, "--version", "-V", callback=_versio
     pass
 
 @app.command()
-def sync(verbose: bool = typer.Option(False, "--verbose", "-v")):
+def sync(verbose: bool = typer.Option(False, "--verbose", "-v"),
+         batch_size: int = typer.Option(200, "--batch-size", help="每批提交的会话数"),
+         full: bool = typer.Option(False, "--full", help="忽略变更清单，全量重建（也会恢复 prune 删掉的会话）"),
+         jobs: int = typer.Option(1, "--jobs", "-j", help="并行解析进程数（>1 启用流水线模式）"),
+         queue_depth: int = typer.Option(64, "--queue-depth", help="流水线各级队列上限（控制内存）"),
+         embed: bool = typer.Option(True, "--embed/--no-embed", help="同步后计算向量（--no-embed 留给 engram embed）")):
     """Sync conversations from all available AI tools."""
-    from .storage.db import init_db, upsert_session
+    from .storage.db import init_db, upsert_sessions
+    from .storage.sync_state import SyncManifest
     from .extractors import get_available_extractors
     
     init_db()
@@ -36,22 +42,57 @@ def sync(verbose: bool = typer.Option(False, "--verbose", "-v")):
     
     console.print(f"[green]Found {len(extractors)} tool(s):[/green] {', '.join(e.name for e in extractors)}")
     
+    def _echo(sessions):
+        for session in sessions:
+            if verbose:
+                console.print(f"  [dim]{session['title'][:60]}[/dim]")
+            yield session
+
+    manifest = SyncManifest(full=full)
     total = 0
+    if jobs > 1:
+        from .pipeline import run_pipeline
+        with console.status(f"Syncing with {jobs} workers..."):
+            result = run_pipeline(extractors, manifest, jobs=jobs, queue_depth=queue_depth,
+                                  batch_size=batch_size, force=full,
+                                  on_session=(lambda s: console.print(f"  [dim]{s['title'][:60]}[/dim]"))
+                                  if verbose else None)
+        for name, count in result["parsed"].items():
+            console.print(f"  ✅ {name}: {count} sessions parsed")
+        stats = result["write"]
+        total = stats["sessions"]
+        console.print(f"  [dim]{stats['messages']} messages written, {stats['rows_per_sec']:.0f} rows/s, "
+                      f"{result['embedded']} embedded, {result['errors']} source errors[/dim]")
+        for failure in result["failures"]:
+            console.print(f"  [red]⚠️ {failure['tool']} 出错（已跳过）: {failure['source']}: {failure['error']}[/red]")
+        extractors = []
     for extractor in extractors:
         count = 0
         try:
             with console.status(f"Syncing {extractor.name}..."):
-                for session in extractor.extract_sessions():
-                    upsert_session(session)
-                    count += 1
-                    if verbose:
-                        console.print(f"  [dim]{session['title'][:60]}[/dim]")
-            console.print(f"  ✅ {extractor.name}: {count} sessions")
+                stats = upsert_sessions(_echo(extractor.extract_sessions(manifest)), batch_size=batch_size,
+                                        manifest=manifest, force=full)
+            count = stats["sessions"]
+            console.print(f"  ✅ {extractor.name}: {count} sessions "
+                          f"[dim]({stats['messages']} messages, {stats['rows_per_sec']:.0f} rows/s)[/dim]")
         except Exception as e:
             console.print(f"  [red]⚠️ {extractor.name} 出错（已跳过）: {e}[/red]")
         total += count
+    for failure in manifest.failures:
+        console.print(f"  [red]⚠️ {failure['tool']} 出错（已跳过）: {failure['source']}: {failure['error']}[/red]")
     
     console.print(f"\n[bold green]✨ Done! Imported {total} sessions total.[/bold green]")
+    if manifest.skipped:
+        console.print(f"[dim]{manifest.skipped} unchanged source files skipped (use --full to rebuild)[/dim]")
+    if embed:
+        from .storage.embed_queue import drain
+        with console.status("Embedding new sessions..."):
+            emb = drain()
+        if emb["embedded"]:
+            console.print(f"[dim]🧬 {emb['embedded']} sessions embedded ({emb['per_sec']:.1f}/s)[/dim]")
+        if emb["remaining"]:
+            console.print(f"[yellow]{emb['remaining']} sessions waiting for embeddings"
+                          f"{' (' + emb['error'] + ')' if emb['error'] else ''}; run [bold]engram embed[/bold] later[/yellow]")
     console.print("Run [bold]engram search <query>[/bold] to find anything.")
 
     # 自动提炼 facts + 更新 context.md
@@ -70,16 +111,318 @@ def sync(verbose: bool = typer.Option(False, "--verbose", "-v")):
     results = update_context_files()
     console.print(f"📄 context.md 已更新（{len(results)} 个文件）")
 
+    from .storage import maintenance
+    reason = maintenance.due()
+    if reason:
+        with console.status("Optimizing databases..."):
+            reports = maintenance.optimize(full=False)
+        console.print(f"[dim]🧹 自动维护（{reason}）：{sum(r['seconds'] for r in reports):.1f}s；"
+                      f"engram optimize 可做完整整理[/dim]")
+
     # 注意：sync 不上传任何文件（engram.db 可能几十MB）
     # 用 `engram push` 显式推送 memory.db + core.md + context.md
 
 @app.command()
-def search(query: str, tool: str = typer.Option(None, "--tool", "-t"), limit: int = 10):
+def embed(
+    rebuild: bool = typer.Option(False, "--rebuild", help="重新计算所有会话的向量"),
+    batch_size: int = typer.Option(None, "--batch-size", help="每次送入模型的文本数（默认取 config.json 的 embedding_batch_size）"),
+    threads: int = typer.Option(None, "--threads", help="ONNX 推理线程数（默认由 onnxruntime 决定）"),
+):
+    """为待嵌入队列中的会话计算向量（补齐无模型时入库的会话）。"""
+    from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn
+    from .storage.db import init_db
+    from .storage.embed_queue import drain, pending_count, requeue_all
+
+    init_db()
+    total = requeue_all() if rebuild else pending_count()
+    if not total:
+        console.print("[green]✅ 没有待嵌入的会话[/green]")
+        return
+
+    with Progress(TextColumn("🧬 Embedding"), BarColumn(), TextColumn("{task.completed}/{task.total}"),
+                  TimeRemainingColumn(), console=console) as progress:
+        task = progress.add_task("embed", total=total)
+        stats = drain(batch_size=batch_size, threads=threads,
+                      on_progress=lambda done, _: progress.update(task, completed=done))
+
+    console.print(f"[green]✅ {stats['embedded']} sessions embedded[/green] "
+                  f"[dim]({stats['per_sec']:.1f}/s, {stats['seconds']:.1f}s, {stats['skipped']} empty skipped)[/dim]")
+    if stats["error"]:
+        console.print(f"[red]⚠️ 模型不可用，{stats['remaining']} 个会话仍在队列中: {stats['error']}[/red]")
+        raise typer.Exit(1)
+
+@app.command("embed-server")
+def embed_server(
+    batch_size: int = typer.Option(None, "--batch-size", help="每次送入模型的文本数（默认取 config.json 的 embedding_batch_size）"),
+    threads: int = typer.Option(None, "--threads", help="ONNX 推理线程数"),
+):
+    """常驻嵌入服务：模型只加载一次，CLI / MCP 进程通过 Unix socket 共享。"""
+    import signal
+    from .embed_server import EmbedServer, SOCKET_PATH
+
+    def _terminate(*_):
+        raise KeyboardInterrupt  # SIGTERM: shut down cleanly and remove the socket
+    signal.signal(signal.SIGTERM, _terminate)
+
+    with console.status("Loading embedding model..."):
+        try:
+            server = EmbedServer(batch_size=batch_size, threads=threads)
+        except (ImportError, RuntimeError, OSError) as e:
+            console.print(f"[red]❌ {e}[/red]")
+            raise typer.Exit(1)
+    console.print(f"[green]🧬 Embedding server on {SOCKET_PATH}[/green] [dim]({server.model_name}，Ctrl-C 退出)[/dim]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        console.print(f"\n[dim]served {server.batcher.requests} requests in {server.batcher.batches} model batches[/dim]")
+
+@app.command()
+def reindex(
+    nlist: int = typer.Option(None, "--nlist", help="IVF 聚类数（默认 4·√N）"),
+):
+    """重建向量 ANN 索引（IVF-flat），语料变化较大后运行。"""
+    import time
+    from .storage.db import init_db, transaction
+    from .storage.vector_index import get_index, ignored_settings
+
+    init_db()
+    for name in ("sessions", "chunks"):
+        index = get_index(name)
+        if not hasattr(index, "train"):
+            # sqlite-vec 本身就是精确检索：没有要训练的东西，不算失败
+            with transaction() as conn:
+                ignored = ignored_settings(conn)
+            console.print(f"[dim]{index.engine} 引擎始终精确检索，没有需要重建的 ANN 索引，跳过。[/dim]")
+            if ignored:
+                console.print(f"[yellow]config.json 中的 {', '.join(ignored)} 对 {index.engine} 引擎无效。[/yellow]")
+            console.print("[dim]要用 IVF：config.json 设置 \"vector_engine\": \"numpy\"，"
+                          "或在 \"auto\" 下配置 ann_nprobe / ann_min_rows[/dim]")
+            return
+        start = time.perf_counter()
+        with transaction() as conn:
+            built = index.train(conn, nlist=nlist)
+            st = index.stats(conn)
+        elapsed = time.perf_counter() - start
+        mode = "ANN" if st["ann_active"] else f"exact (< {index.ann_min_rows} vectors)"
+        recall = f", recall@10 {st['recall']:.2f} @ nprobe={index.nprobe}" if st["recall"] is not None else ""
+        console.print(f"  ✅ {name}: {built['vectors']} vectors → {built['nlist']} lists "
+                      f"[dim]({elapsed:.1f}s, search: {mode}{recall})[/dim]")
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MB"
+
+@app.command()
+def compact(
+    retrain: bool = typer.Option(False, "--retrain", help="重新训练压缩字典（语料变化较大后）"),
+    level: int = typer.Option(None, "--level", help="zstd 压缩级别（默认 9）"),
+    decompress: bool = typer.Option(False, "--decompress", help="还原为明文存储并关闭压缩"),
+):
+    """用语料训练的 zstd 字典压缩消息正文，并对新消息开启压缩。"""
+    from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn
+    from .config import get_config, save_config
+    from .storage import compression
+    from .storage.db import init_db
+
+    init_db()
+    cfg = get_config()
+    if decompress:
+        stats = compression.decompress_all()
+        cfg.pop("message_compression", None)
+        save_config(cfg)
+        console.print(f"[green]✅ {stats['rows']} 条消息已还原为明文[/green] "
+                      f"[dim]({_mb(stats['bytes_before'])} → {_mb(stats['bytes_after'])}, {stats['seconds']:.1f}s)[/dim]")
+        return
+    if not compression.available():
+        console.print("[red]❌ 需要 zstandard：pip install 'engram-mcp[compress]'[/red]")
+        raise typer.Exit(1)
+
+    with Progress(TextColumn("🗜️  Compacting"), BarColumn(), TextColumn("{task.completed}/{task.total}"),
+                  TimeRemainingColumn(), console=console) as progress:
+        task = progress.add_task("compact", total=None)
+        try:
+            stats = compression.compact(retrain=retrain, level=level,
+                                        on_progress=lambda done, total: progress.update(task, completed=done, total=total))
+        except ValueError as e:
+            console.print(f"[yellow]⚠️ {e}[/yellow]")
+            raise typer.Exit(1)
+    cfg["message_compression"] = "zstd"
+    save_config(cfg)
+
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    ratio = stats["bytes_before"] / stats["bytes_after"] if stats["bytes_after"] else 1.0
+    console.print(f"[green]✅ {stats['rows']} 条消息已压缩[/green] "
+                  f"[dim](字典 {stats['dict_id']}, {stats['seconds']:.1f}s)[/dim]")
+    console.print(f"  消息正文 {_mb(stats['bytes_before'])} → {_mb(stats['bytes_after'])}，"
+                  f"节省 {_mb(saved)}（{ratio:.1f}×）")
+    console.print("[dim]  新消息入库时自动压缩；释放的页面在 VACUUM 后归还磁盘[/dim]")
+
+@app.command()
+def shards(
+    enable: bool = typer.Option(False, "--enable", help="切换到按月分片存储，并迁移已有消息"),
+    freeze: bool = typer.Option(False, "--freeze", help="冷分片 checkpoint 并退出 WAL，之后只读 + mmap 打开"),
+):
+    """按 created_at 月份分片存储消息：写入分散到各月 WAL，搜索并行扇出。"""
+    from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn
+    from .storage import shards as shard_store
+    from .storage.db import init_db
+
+    init_db()
+    if enable:
+        with Progress(TextColumn("🗂️  Sharding"), BarColumn(), TextColumn("{task.completed}/{task.total}"),
+                      TimeRemainingColumn(), console=console) as progress:
+            task = progress.add_task("shard", total=None)
+            stats = shard_store.enable(on_progress=lambda done, total: progress.update(task, completed=done, total=total))
+        console.print(f"[green]✅ {stats['sessions']} 个会话 / {stats['messages']} 条消息已迁入 "
+                      f"{stats['shards']} 个分片[/green] [dim]({shard_store.SHARD_DIR})[/dim]")
+    if freeze:
+        frozen = shard_store.freeze()
+        console.print(f"[green]🧊 已冻结 {len(frozen)} 个冷分片[/green]" + (f" [dim]({', '.join(frozen)})[/dim]" if frozen else ""))
+    if not (enable or freeze):
+        if not shard_store.enabled():
+            console.print("[dim]当前为单文件存储；engram shards --enable 切换到按月分片[/dim]")
+        table = Table(show_header=True, header_style="bold cyan")
+        for col in ("Shard", "Messages", "Size", "State"):
+            table.add_column(col)
+        for st in shard_store.stats():
+            state = "cold, read-only" if st["cold"] else "hot"
+            table.add_row(st["shard"], str(st["messages"]), _mb(st["bytes"]), f"{state} ({st['journal']})")
+        if table.rows:
+            console.print(table)
+
+@app.command()
+def optimize(
+    light: bool = typer.Option(False, "--light", help="只做 sync 后自动维护的轻量步骤（增量 merge，不做全量 VACUUM）"),
+):
+    """整理 FTS 段、刷新统计信息、回收空闲页并截断 WAL（engram.db、各分片、memory.db）。"""
+    from .storage.db import init_db
+    from .storage.maintenance import optimize as run_optimize
+
+    init_db()
+    with console.status("Optimizing..."):
+        reports = run_optimize(full=not light)
+    table = Table(show_header=True, header_style="bold cyan")
+    for col in ("Database", "Before", "After", "Free pages", "Time"):
+        table.add_column(col)
+    before = after = 0
+    steps: dict[str, float] = {}
+    for r in reports:
+        before += r["size_before"] + r["wal_before"]
+        after += r["size_after"] + r["wal_after"]
+        for k, v in r["timings"].items():
+            steps[k] = steps.get(k, 0.0) + v
+        table.add_row(r["db"] + (" [dim](VACUUM)[/dim]" if r["vacuumed"] else ""),
+                      f"{_mb(r['size_before'])} + WAL {_mb(r['wal_before'])}",
+                      f"{_mb(r['size_after'])} + WAL {_mb(r['wal_after'])}",
+                      f"{r['free_pages_before']} → {r['free_pages_after']}", f"{r['seconds']:.2f}s")
+    console.print(table)
+    console.print(f"[dim]  {', '.join(f'{k} {v:.2f}s' for k, v in steps.items())}[/dim]")
+    console.print(f"[green]✅ 维护完成：{_mb(before)} → {_mb(after)}[/green]")
+
+@app.command()
+def prune(
+    older_than: int = typer.Option(None, "--older-than", help="删除超过 N 天的会话"),
+    max_per_tool: int = typer.Option(None, "--max-per-tool", help="每个工具只保留最新 N 个会话"),
+    noise: bool = typer.Option(None, "--noise/--keep-noise", help="删除 heartbeat/cron/系统会话"),
+    missing_source: bool = typer.Option(None, "--missing-source/--keep-missing-source",
+                                        help="删除源文件已不存在的会话"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只统计将删除的会话和大致空间，不删除"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="不再确认"),
+    batch_size: int = typer.Option(200, "--batch-size", help="每个事务删除的会话数"),
+):
+    """按保留规则删除会话（config.json 的 retention，命令行选项优先）。"""
+    from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn
+    from .storage.db import init_db
+    from .storage import retention
+
+    init_db()
+    rules = retention.rules_from_config()
+    for rule, value in (("max_age_days", older_than), ("max_per_tool", max_per_tool),
+                        ("noise", noise), ("missing_source", missing_source)):
+        if value is not None:
+            rules[rule] = value
+    rules = {k: v for k, v in rules.items() if v}
+    if not rules:
+        console.print("[yellow]没有保留规则：用 --older-than / --max-per-tool / --noise / --missing-source，"
+                      "或在 config.json 设置 \"retention\"[/yellow]")
+        raise typer.Exit(1)
+
+    plan = retention.prune(rules, dry_run=True)
+    for rule, n in plan["matched"].items():
+        console.print(f"  {rule}: {n} 个会话")
+    console.print(f"共 {plan['sessions']} 个会话 / {plan['messages']} 条消息，约 {_mb(plan['bytes'])}")
+    if dry_run or not plan["sessions"]:
+        return
+    if not yes and not typer.confirm("确认删除？", default=False):
+        raise typer.Exit(1)
+
+    with Progress(TextColumn("🗑️  Pruning"), BarColumn(), TextColumn("{task.completed}/{task.total}"),
+                  TimeRemainingColumn(), console=console) as progress:
+        task = progress.add_task("prune", total=plan["sessions"])
+        stats = retention.prune(rules, batch_size=batch_size,
+                                on_progress=lambda done, _: progress.update(task, completed=done))
+    console.print(f"[green]✅ 已删除 {stats['sessions']} 个会话 / {stats['messages']} 条消息[/green]")
+    console.print("[dim]  sync 不会再导入这些会话；要恢复（源文件还在时）运行 engram sync --full[/dim]")
+    console.print("[dim]  engram optimize 把释放的空间还给磁盘[/dim]")
+
+@app.command()
+def watch(
+    debounce: float = typer.Option(1.5, "--debounce", help="文件事件静默多少秒后入库"),
+    poll: float = typer.Option(5.0, "--poll", help="未安装 watchdog 时的轮询间隔（秒）"),
+):
+    """常驻监听各工具的会话目录，新对话数秒内入库并刷新 facts / context。"""
+    from .storage.db import init_db
+    from .extractors import get_available_extractors
+    from .watch import SessionWatcher
+    from datetime import datetime
+
+    init_db()
+    extractors = get_available_extractors()
+    if not extractors:
+        console.print("[red]No supported AI tools found on this machine.[/red]")
+        raise typer.Exit(1)
+
+    def _report(written: dict):
+        ts = datetime.now().strftime("%H:%M:%S")
+        detail = ", ".join(f"{k}: {v}" for k, v in written.items())
+        console.print(f"[dim]{ts}[/dim] 🔄 {detail}")
+
+    def _report_error(stage: str, e: Exception):
+        ts = datetime.now().strftime("%H:%M:%S")
+        console.print(f"[dim]{ts}[/dim] [red]⚠️ {stage} 出错（已跳过）: {e}[/red]")
+
+    watcher = SessionWatcher(extractors, debounce=debounce, poll_interval=poll, on_ingest=_report,
+                             on_error=_report_error)
+    mode = "文件事件" if SessionWatcher.has_native_events() else f"轮询 {poll}s（pip install watchdog 可改为事件驱动）"
+    console.print(f"[green]👀 Watching {', '.join(e.name for e in extractors)}[/green] [dim]({mode}，Ctrl-C 退出)[/dim]")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+        console.print("\n[dim]stopped[/dim]")
+
+_SINCE_HELP = "只看此后开始的会话：7d / 12h / 2w 或 YYYY-MM-DD"
+_UNTIL_HELP = "只看此前开始的会话（同 --since 格式）"
+_PROJECT_HELP = "项目名（如 engram）或完整路径，精确匹配"
+_UNDER_HELP = "项目路径前缀：该目录及其子目录下的所有项目"
+
+@app.command()
+def search(query: str, tool: str = typer.Option(None, "--tool", "-t"), limit: int = 10,
+           since: str = typer.Option(None, "--since", help=_SINCE_HELP),
+           until: str = typer.Option(None, "--until", help=_UNTIL_HELP),
+           project: str = typer.Option(None, "--project", "-p", help=_PROJECT_HELP),
+           under: str = typer.Option(None, "--under", help=_UNDER_HELP)):
     """Search across all AI tool conversations AND memory facts."""
     from .storage.db import search_sessions, search_memories
     from .storage.memory_db import search_facts
 
-    sessions = search_sessions(query, tool=tool, limit=limit)
+    try:
+        sessions = search_sessions(query, tool=tool, limit=limit, since=since, until=until,
+                                   project=project, project_prefix=under)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
     memories = search_memories(query, limit=5)
     facts = search_facts(query, limit=8)
 
@@ -125,11 +468,19 @@ def search(query: str, tool: str = typer.Option(None, "--tool", "-t"), limit: in
             console.print(Panel(m["content"][:200], title=f"Memory #{m['id']}"))
 
 @app.command()
-def ls(tool: str = typer.Option(None, "--tool", "-t"), limit: int = 20):
+def ls(tool: str = typer.Option(None, "--tool", "-t"), limit: int = 20,
+       since: str = typer.Option(None, "--since", help=_SINCE_HELP),
+       until: str = typer.Option(None, "--until", help=_UNTIL_HELP),
+       project: str = typer.Option(None, "--project", "-p", help=_PROJECT_HELP),
+       under: str = typer.Option(None, "--under", help=_UNDER_HELP)):
     """List recent sessions."""
     from .storage.db import list_sessions
     
-    sessions = list_sessions(tool=tool, limit=limit)
+    try:
+        sessions = list_sessions(tool=tool, limit=limit, since=since, until=until,
+                                 project=project, project_prefix=under)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
     if not sessions:
         console.print("[yellow]No sessions. Run [bold]engram sync[/bold] first.[/yellow]")
         return
@@ -295,7 +646,7 @@ def pull():
     安全合并：本地未推送的 facts 不会丢失（远端优先，本地独有 facts 保留）。
     """
     from .config import get_backend
-    from .storage.memory_db import MEMORY_DB, list_facts, add_fact
+    from .storage.memory_db import MEMORY_DB, list_facts, add_fact, close_mem_db
     from .context_gen import CONTEXT_FILE, CORE_FILE
     import shutil, tempfile
     from pathlib import Path
@@ -309,6 +660,8 @@ def pull():
     local_facts_before = {f["id"]: f for f in list_facts()} if MEMORY_DB.exists() else {}
 
     # ── 2. 下载远端文件（memory.db 直接覆盖）──
+    # 覆盖前先关闭已打开的连接，之后的访问会重新打开新文件
+    close_mem_db()
     ok_files = []
     for fpath, remote_name in [(MEMORY_DB, "memory.db"), (CORE_FILE, "core.md"), (CONTEXT_FILE, "context.md")]:
         try:
@@ -379,6 +732,46 @@ def status_cmd():
         else:
             console.print(f"   {label:<15} [dim]not found[/dim]")
 
+    # ── 向量索引：内存 / 召回率权衡 ──
+    from .storage.db import DB_PATH
+    if DB_PATH.exists():
+        try:
+            from .storage.db import transaction
+            from .storage.vector_index import get_index, ignored_settings
+            from .storage.embedders import get_embedder
+            embedder = get_embedder()
+            console.print()
+            console.print(f"[bold]🧬 Vector index:[/bold] [dim]{embedder.model_id} ({embedder.dim}d)[/dim]")
+            with transaction() as conn:
+                for name in ("sessions", "chunks"):
+                    st = get_index(name).stats(conn)
+                    line = f"   {name:<10} {st['engine']}/{st['quantization']:<7} {st['vectors']:>7} vectors"
+                    if st["float_bytes"] is not None:
+                        line += f"  float {st['float_bytes'] / 1e6:.1f}MB"
+                    if st["code_bytes"]:
+                        line += f"  codes {st['code_bytes'] / 1e6:.1f}MB ({st['dims']} dims)"
+                    if st["recall"] is not None:
+                        line += f"  recall@10 {st['recall']:.2f}"
+                    console.print(line)
+                ignored = ignored_settings(conn)
+            if ignored:
+                console.print(f"   [yellow]⚠️  {', '.join(ignored)} 只对 numpy 引擎生效，config.json 指定了 sqlite-vec；"
+                              f"改为 \"vector_engine\": \"auto\" 或 \"numpy\" 启用[/yellow]")
+        except Exception as e:
+            console.print(f"   [dim]unavailable: {e}[/dim]")
+
+    # ── 按月分片 ──
+    from .storage import shards
+    shard_stats = shards.stats() if shards.SHARD_DIR.exists() else []
+    if shard_stats:
+        console.print()
+        layout = "sharded" if shards.enabled() else "single（旧分片仍可读）"
+        console.print(f"[bold]🗂️  Shards:[/bold] {len(shard_stats)} 个 [dim]({layout})[/dim]")
+        for st in shard_stats:
+            state = "cold, read-only" if st["cold"] else "hot"
+            console.print(f"   {st['shard']:<10} {st['messages']:>8} messages  {_mb(st['bytes']):>9}  "
+                          f"[dim]{state}, {st['journal']}[/dim]")
+
     # ── core.md 大小警告 ──
     if CORE_FILE.exists():
         tokens = len(CORE_FILE.read_text(encoding="utf-8")) // 4
@@ -487,27 +880,11 @@ def recent(
 ):
     """显示最近的会话记录（按时间倒序）。"""
     from engram.storage.db import list_sessions
-    from engram.extractor_facts import _is_noise, SKIP_PROJECT_DIRS
     from datetime import datetime, timedelta
-    import os
-
-    sessions = list_sessions(limit=limit * 5)
-    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
-
-    recent_sessions = [
-        s for s in sessions
-        if (s.get("imported_at") or s.get("created_at") or "") >= cutoff
-    ]
-
-    if not all_sessions:
-        # 过滤噪声（heartbeat/cron/system sessions）
-        recent_sessions = [
-            s for s in recent_sessions
-            if not _is_noise(s.get("title") or "")
-            and os.path.basename((s.get("project") or "").rstrip("/")) not in SKIP_PROJECT_DIRS
-        ]
 
-    recent_sessions = recent_sessions[:limit]
+    # imported_at 是 SQLite datetime('now') 格式；噪声（heartbeat/cron/system）在 SQL 里按入库时的标记过滤
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    recent_sessions = list_sessions(limit=limit, imported_since=cutoff, skip_noise=not all_sessions)
 
     if not recent_sessions:
         console.print(f"[dim]最近 {days} 天没有有效会话（heartbeat/cron 已过滤，加 --all 查看全部）[/dim]")
@@ -0,0 +1,162 @@
+"""Shared local embedding service on a Unix domain socket.
+
+``engram embed-server`` loads the model once; CLI commands and every MCP
+server process then send their texts here instead of loading their own copy
+(seconds of cold start and hundreds of MB each). Requests arriving within
+``BATCH_WINDOW`` of each other are merged into one model call.
+
+Wire format, both directions: a 4-byte big-endian length and a JSON header,
+followed in the response by ``n * dim`` packed float32 values.
+:func:`embed_remote` returns None whenever the server is not reachable, and
+callers fall back to in-process embedding.
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional
+
+SOCKET_PATH = Path.home() / ".engram" / "embed.sock"
+# Longest a request waits for others to join its batch
+BATCH_WINDOW = 0.005
+MAX_BATCH_TEXTS = 256
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 120
+
+
+def _send(sock: socket.socket, header: dict, payload: bytes = b""):
+    data = json.dumps(header).encode()
+    sock.sendall(struct.pack(">I", len(data)) + data + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embed server closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_header(sock: socket.socket) -> dict:
+    (length,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, length))
+
+
+def available() -> bool:
+    return hasattr(socket, "AF_UNIX") and SOCKET_PATH.exists()
+
+
+def embed_remote(texts: list[str], model: str) -> Optional[list[bytes]]:
+    """Packed float32 vectors from the running server, or None if it can't serve ``model``."""
+    if not texts or not available():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(SOCKET_PATH))
+            sock.settimeout(REQUEST_TIMEOUT)
+            _send(sock, {"texts": texts})
+            header = _recv_header(sock)
+            if not header.get("ok") or header.get("model") != model:
+                return None
+            row = header["dim"] * 4
+            data = _recv_exact(sock, header["n"] * row)
+    except (OSError, ValueError):
+        return None
+    return [data[i * row:(i + 1) * row] for i in range(header["n"])]
+
+
+class _Batcher:
+    """Merges concurrent requests into model calls of up to ``MAX_BATCH_TEXTS``."""
+
+    def __init__(self, embed_many):
+        self._embed_many = embed_many
+        self._queue: queue.Queue = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        threading.Thread(target=self._loop, daemon=True, name="engram-embed-batcher").start()
+
+    def submit(self, texts: list[str]) -> Future:
+        fut: Future = Future()
+        self._queue.put((texts, fut))
+        return fut
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            while size < MAX_BATCH_TEXTS:
+                try:
+                    item = self._queue.get(timeout=BATCH_WINDOW)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self.requests += len(pending)
+            self.batches += 1
+            try:
+                vectors = self._embed_many([t for texts, _ in pending for t in texts])
+            except Exception as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            start = 0
+            for texts, fut in pending:
+                fut.set_result(vectors[start:start + len(texts)])
+                start += len(texts)
+
+
+class EmbedServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # many MCP processes may connect at once
+
+    def __init__(self, path: Path = None, batch_size: Optional[int] = None, threads: Optional[int] = None):
+        from .storage.embedders import get_embedder, embedding_config
+        from .storage.vector import _pack
+        self.path = Path(path or SOCKET_PATH)
+        embedder = get_embedder(threads)
+        self.model_name = embedder.model_id
+        batch_size = batch_size or embedding_config()["batch_size"]
+        list(embedder.embed(["warm up"]))  # load the model before accepting connections
+        self.batcher = _Batcher(lambda texts: [_pack(v) for v in embedder.embed(texts, batch_size=batch_size)])
+        self._claim_socket()
+        super().__init__(str(self.path), _Handler)
+        os.chmod(self.path, 0o600)
+
+    def _claim_socket(self):
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(str(self.path))
+            except OSError:
+                self.path.unlink()  # stale socket from a crashed server
+                return
+        raise RuntimeError(f"embed server already running on {self.path}")
+
+    def server_close(self):
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server: EmbedServer = self.server
+        try:
+            texts = _recv_header(self.request).get("texts", [])
+            vectors = server.batcher.submit([str(t) for t in texts]).result()
+        except Exception as e:
+            _send(self.request, {"ok": False, "error": str(e)})
+            return
+        dim = len(vectors[0]) // 4 if vectors else 0
+        _send(self.request, {"ok": True, "model": server.model_name, "n": len(vectors), "dim": dim},
+              b"".join(vectors))
+
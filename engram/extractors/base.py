@@ -1,18 +1,92 @@
 """Base extractor interface."""
+import logging
 from abc import ABC, abstractmethod
-from typing import Iterator
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+def tail_lines(path: Path, cursor: dict) -> Iterator[str]:
+    """Stream complete lines from ``cursor["offset"]`` onwards, advancing the offset.
+
+    A trailing line without a newline is left unread (the writer may still be
+    appending to it), so the next run resumes from its start.
+    """
+    with open(path, "rb") as fh:
+        fh.seek(cursor.get("offset", 0))
+        for raw in fh:
+            if not raw.endswith(b"\n"):
+                break
+            cursor["offset"] = cursor.get("offset", 0) + len(raw)
+            yield raw.decode("utf-8", errors="replace")
+
 
 class BaseExtractor(ABC):
     name: str = ""
-    
+    # Append-only logs: parse_source() can resume from cursor["offset"]
+    tailable: bool = False
+
     @abstractmethod
     def is_available(self) -> bool:
         pass
-    
+
     @abstractmethod
-    def extract_sessions(self) -> Iterator[dict]:
+    def iter_sources(self) -> Iterator[Path]:
+        """Yield every source file (one unit of change tracking) this tool has."""
         pass
-    
+
+    @abstractmethod
+    def parse_source(self, source: Path, cursor: dict = None) -> Iterator[dict]:
+        """Parse one source into session dicts.
+
+        Tailable extractors resume from ``cursor["offset"]``, update the cursor
+        in place and mark sessions holding only new messages with ``append``.
+        A source that cannot be read raises, so it is not marked as synced.
+        """
+        pass
+
+    def source_files(self, source: Path) -> list[Path]:
+        """Files whose stat/content decide whether ``source`` changed."""
+        return [source]
+
+    def watch_paths(self) -> list[Path]:
+        """Directories to watch for live ingestion (``engram watch``)."""
+        return []
+
+    def source_for_path(self, path: Path) -> Optional[Path]:
+        """Map a changed file under :meth:`watch_paths` to its source, or None to ignore it."""
+        return None
+
+    def extract_sessions(self, manifest=None, sources: Iterable[Path] = None) -> Iterator[dict]:
+        """Yield sessions from all sources, skipping ones the manifest says are unchanged.
+
+        A source is marked done in the manifest only after all of its sessions
+        have been handed to the consumer, so the writer can persist the mark in
+        the same transaction as the sessions. A source whose parse raises is
+        recorded in ``manifest.failures`` (logged without a manifest) and
+        skipped. ``sources`` restricts the run to specific sources instead of
+        everything :meth:`iter_sources` yields.
+        """
+        if not self.is_available():
+            return
+        for source in (self.iter_sources() if sources is None else sources):
+            stamp = cursor = None
+            if manifest is not None:
+                stamp = manifest.check(str(source), self.source_files(source), tail=self.tailable)
+                if stamp is None:
+                    continue
+                if self.tailable:
+                    cursor = manifest.resume_cursor(str(source), source)
+            try:
+                yield from self.parse_source(source, cursor)
+            except Exception as e:
+                # 解析失败：不标记 done，下次 sync 重试这个文件
+                if manifest is not None:
+                    manifest.fail(self.name, str(source), e)
+                else:
+                    logging.getLogger("engram").warning(f"{self.name}: {source}: {e}")
+                continue
+            if manifest is not None:
+                manifest.done(stamp, cursor)
+
     def make_session_id(self, tool: str, unique: str) -> str:
         import hashlib
         return f"{tool}_{hashlib.md5(unique.encode()).hexdigest()[:12]}"
@@ -32,104 +32,117 @@ class CursorExtractor(BaseExtractor):
         d = _workspace_storage_dir()
         return d is not None and d.exists()
 
-    def extract_sessions(self) -> Iterator[dict]:
+    def iter_sources(self) -> Iterator[Path]:
         ws_dir = _workspace_storage_dir()
         if not ws_dir:
             return
+        yield from ws_dir.glob("*/state.vscdb")
 
-        for db_path in ws_dir.glob("*/state.vscdb"):
-            try:
-                conn = sqlite3.connect(str(db_path), timeout=3)
-                conn.execute("PRAGMA journal_mode=WAL")  # avoid lock conflicts with running Cursor
-                row = conn.execute(
-                    "SELECT value FROM ItemTable WHERE key = 'workbench.panel.aichat.view.aichat.chatdata'"
-                ).fetchone()
-                conn.close()
-                if not row or not row[0]:
-                    continue
-            except (sqlite3.OperationalError, Exception):
-                continue
+    def source_files(self, db_path: Path) -> list[Path]:
+        # Cursor writes through WAL; new chats may only be in the -wal file
+        wal = db_path.with_name(db_path.name + "-wal")
+        return [db_path, wal] if wal.exists() else [db_path]
+
+    def watch_paths(self) -> list[Path]:
+        ws_dir = _workspace_storage_dir()
+        return [ws_dir] if ws_dir else []
+
+    def source_for_path(self, path: Path) -> Path | None:
+        if path.name in ("state.vscdb", "state.vscdb-wal"):
+            return path.with_name("state.vscdb")
+        return None
+
+    def parse_source(self, db_path: Path, cursor: dict = None) -> Iterator[dict]:
+        # state.vscdb 是 SQLite，不能续读：cursor 忽略，每次整体重解析
+        # 库损坏 / 被锁 / JSON 不完整时直接抛出：不标记 manifest，下次 sync 重试
+        conn = sqlite3.connect(str(db_path), timeout=3)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")  # avoid lock conflicts with running Cursor
+            row = conn.execute(
+                "SELECT value FROM ItemTable WHERE key = 'workbench.panel.aichat.view.aichat.chatdata'"
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or not row[0]:
+            return
 
-            try:
-                data = json.loads(row[0])
-            except Exception:
+        data = json.loads(row[0])
+
+        # data can be a dict with "tabs" or similar structure, or a list
+        conversations = []
+        if isinstance(data, dict):
+            # Try common structures
+            if "tabs" in data:
+                for tab in data["tabs"]:
+                    if isinstance(tab, dict) and "chat" in tab:
+                        conversations.append(tab["chat"])
+                    elif isinstance(tab, dict) and "bubbles" in tab:
+                        conversations.append(tab)
+            elif "messages" in data:
+                conversations.append(data)
+            elif "bubbles" in data:
+                conversations.append(data)
+            else:
+                # Try all values that look like conversation objects
+                for v in data.values():
+                    if isinstance(v, list):
+                        conversations.append({"messages": v})
+        elif isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict):
+                    conversations.append(item)
+
+        workspace_hash = db_path.parent.name
+
+        for idx, conv in enumerate(conversations):
+            messages = []
+            # Try "bubbles" format (Cursor AI chat)
+            bubbles = conv.get("bubbles", [])
+            if bubbles:
+                for b in bubbles:
+                    if not isinstance(b, dict):
+                        continue
+                    role = "assistant" if b.get("type") == "ai" or b.get("type") == "response" else "user"
+                    content = b.get("text", b.get("content", ""))
+                    if not content:
+                        continue
+                    messages.append({
+                        "role": role,
+                        "content": str(content)[:4000],
+                        "timestamp": "",
+                    })
+            else:
+                # Try "messages" format
+                for m in conv.get("messages", []):
+                    if not isinstance(m, dict):
+                        continue
+                    role = m.get("role", m.get("type", "user"))
+                    content = m.get("content", m.get("text", ""))
+                    if not content:
+                        continue
+                    if isinstance(content, list):
+                        content = " ".join(str(c.get("text", c)) for c in content if isinstance(c, (dict, str)))
+                    messages.append({
+                        "role": str(role),
+                        "content": str(content)[:4000],
+                        "timestamp": "",
+                    })
+
+            if not messages:
                 continue
 
-            # data can be a dict with "tabs" or similar structure, or a list
-            conversations = []
-            if isinstance(data, dict):
-                # Try common structures
-                if "tabs" in data:
-                    for tab in data["tabs"]:
-                        if isinstance(tab, dict) and "chat" in tab:
-                            conversations.append(tab["chat"])
-                        elif isinstance(tab, dict) and "bubbles" in tab:
-                            conversations.append(tab)
-                elif "messages" in data:
-                    conversations.append(data)
-                elif "bubbles" in data:
-                    conversations.append(data)
-                else:
-                    # Try all values that look like conversation objects
-                    for v in data.values():
-                        if isinstance(v, list):
-                            conversations.append({"messages": v})
-            elif isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict):
-                        conversations.append(item)
-
-            workspace_hash = db_path.parent.name
-
-            for idx, conv in enumerate(conversations):
-                messages = []
-                # Try "bubbles" format (Cursor AI chat)
-                bubbles = conv.get("bubbles", [])
-                if bubbles:
-                    for b in bubbles:
-                        if not isinstance(b, dict):
-                            continue
-                        role = "assistant" if b.get("type") == "ai" or b.get("type") == "response" else "user"
-                        content = b.get("text", b.get("content", ""))
-                        if not content:
-                            continue
-                        messages.append({
-                            "role": role,
-                            "content": str(content)[:4000],
-                            "timestamp": "",
-                        })
-                else:
-                    # Try "messages" format
-                    for m in conv.get("messages", []):
-                        if not isinstance(m, dict):
-                            continue
-                        role = m.get("role", m.get("type", "user"))
-                        content = m.get("content", m.get("text", ""))
-                        if not content:
-                            continue
-                        if isinstance(content, list):
-                            content = " ".join(str(c.get("text", c)) for c in content if isinstance(c, (dict, str)))
-                        messages.append({
-                            "role": str(role),
-                            "content": str(content)[:4000],
-                            "timestamp": "",
-                        })
-
-                if not messages:
-                    continue
-
-                first_user = next((m["content"] for m in messages if m["role"] == "user"), "")
-                title = conv.get("title", conv.get("name", first_user[:80] if first_user else f"cursor-{workspace_hash[:8]}-{idx}"))
-
-                unique_id = f"{workspace_hash}_{idx}"
-                yield {
-                    "id": self.make_session_id("cursor", unique_id),
-                    "source_tool": "cursor",
-                    "source_path": str(db_path),
-                    "project": "",
-                    "title": title,
-                    "summary": "",
-                    "created_at": "",
-                    "messages": messages,
-                    "tags": [],
-                }
+            first_user = next((m["content"] for m in messages if m["role"] == "user"), "")
+            title = conv.get("title", conv.get("name", first_user[:80] if first_user else f"cursor-{workspace_hash[:8]}-{idx}"))
+
+            unique_id = f"{workspace_hash}_{idx}"
+            yield {
+                "id": self.make_session_id("cursor", unique_id),
+                "source_tool": "cursor",
+                "source_path": str(db_path),
+                "project": "",
+                "title": title,
+                "summary": "",
+                "created_at": "",
+                "messages": messages,
+                "tags": [],
+            }
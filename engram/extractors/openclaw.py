@@ -1,87 +1,102 @@
 """Extract conversations from OpenClaw (~/.openclaw/agents/*/sessions/*.jsonl)."""
 import json
 from pathlib import Path
-from typing import Iterator
-from .base import BaseExtractor
+from typing import Iterator, Optional
+from .base import BaseExtractor, tail_lines
 
 OPENCLAW_DIR = Path.home() / ".openclaw" / "agents"
 
 class OpenClawExtractor(BaseExtractor):
     name = "openclaw"
-    
+    tailable = True
+
     def is_available(self) -> bool:
         return OPENCLAW_DIR.exists() and any(OPENCLAW_DIR.glob("*/sessions/*.jsonl"))
-    
-    def extract_sessions(self) -> Iterator[dict]:
-        if not self.is_available():
+
+    def iter_sources(self) -> Iterator[Path]:
+        yield from sorted(OPENCLAW_DIR.glob("*/sessions/*.jsonl"),
+                          key=lambda f: f.stat().st_mtime, reverse=True)
+
+    def watch_paths(self) -> list[Path]:
+        return [OPENCLAW_DIR]
+
+    def source_for_path(self, path: Path) -> Optional[Path]:
+        return path if path.suffix == ".jsonl" and path.parent.name == "sessions" else None
+
+    def parse_source(self, jsonl_file: Path, cursor: dict = None) -> Iterator[dict]:
+        cursor = cursor if cursor is not None else {"offset": 0}
+        append = cursor["offset"] > 0
+        if cursor.get("noise"):
+            # heartbeat/cron 会话：只推进 offset，不入库
+            for _ in tail_lines(jsonl_file, cursor):
+                pass
             return
-        
-        for jsonl_file in sorted(OPENCLAW_DIR.glob("*/sessions/*.jsonl"), 
-                                  key=lambda f: f.stat().st_mtime, reverse=True):
+        messages = []
+        # session 头只在文件开头出现，续读时从 cursor 取回
+        session_meta = cursor.get("meta", {})
+
+        for line in tail_lines(jsonl_file, cursor):
+            line = line.strip()
+            if not line:
+                continue
             try:
-                messages = []
-                session_meta = {}
-                
-                with open(jsonl_file, "r", encoding="utf-8", errors="replace") as fh:
-                    for line in fh:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            entry = json.loads(line)
-                        except:
-                            continue
-                    
-                    entry_type = entry.get("type", "")
-                    
-                    if entry_type == "session":
-                        session_meta = entry
-                    
-                    elif entry_type == "message":
-                        msg = entry.get("message", {})
-                        role = msg.get("role", "")
-                        if role not in ("user", "assistant"):
-                            continue
-                        
-                        content = msg.get("content", "")
-                        if isinstance(content, list):
-                            text_parts = []
-                            for block in content:
-                                if isinstance(block, dict) and block.get("type") == "text":
-                                    text_parts.append(block.get("text", ""))
-                            content = "\n".join(text_parts)
-                        
-                        if not content or not str(content).strip():
-                            continue
-                        
-                        messages.append({
-                            "role": role,
-                            "content": str(content)[:5000],
-                            "timestamp": entry.get("timestamp", ""),
-                        })
-                
-                if not messages:
+                entry = json.loads(line)
+            except:
+                continue
+
+            entry_type = entry.get("type", "")
+
+            if entry_type == "session":
+                session_meta = {"cwd": entry.get("cwd", ""), "timestamp": entry.get("timestamp", "")}
+                cursor["meta"] = session_meta
+
+            elif entry_type == "message":
+                msg = entry.get("message", {})
+                role = msg.get("role", "")
+                if role not in ("user", "assistant"):
                     continue
-                
-                # Filter: skip heartbeat/cron sessions (too much noise)
-                first_user = next((m["content"] for m in messages if m["role"] == "user"), "")
-                if first_user.startswith("[cron:") or first_user.startswith("[heartbeat"):
+
+                content = msg.get("content", "")
+                if isinstance(content, list):
+                    text_parts = []
+                    for block in content:
+                        if isinstance(block, dict) and block.get("type") == "text":
+                            text_parts.append(block.get("text", ""))
+                    content = "\n".join(text_parts)
+
+                if not content or not str(content).strip():
                     continue
-                
-                session_id = self.make_session_id("openclaw", str(jsonl_file))
-                
-                first_asst = next((m["content"] for m in messages if m["role"] == "assistant"), "")
-                
-                yield {
-                    "id": session_id,
-                    "source_tool": "openclaw",
-                    "source_path": str(jsonl_file),
-                    "project": session_meta.get("cwd", ""),
-                    "title": first_user[:100] if first_user else jsonl_file.stem,
-                    "summary": first_asst[:200] if first_asst else "",
-                    "created_at": session_meta.get("timestamp", ""),
-                    "messages": messages,
-                    "tags": [],
-                }
-            except Exception:
-                continue
+
+                messages.append({
+                    "role": role,
+                    "content": str(content)[:5000],
+                    "timestamp": entry.get("timestamp", ""),
+                })
+
+        if not messages:
+            return
+
+        # Filter: skip heartbeat/cron sessions (too much noise)
+        first_user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        if not cursor.get("seen_user") and first_user:
+            cursor["seen_user"] = True
+            if first_user.startswith("[cron:") or first_user.startswith("[heartbeat"):
+                cursor["noise"] = True
+                return
+
+        session_id = self.make_session_id("openclaw", str(jsonl_file))
+
+        first_asst = next((m["content"] for m in messages if m["role"] == "assistant"), "")
+
+        yield {
+            "id": session_id,
+            "source_tool": "openclaw",
+            "source_path": str(jsonl_file),
+            "project": session_meta.get("cwd", ""),
+            "title": first_user[:100] if first_user else jsonl_file.stem,
+            "summary": first_asst[:200] if first_asst else "",
+            "created_at": session_meta.get("timestamp", ""),
+            "messages": messages,
+            "tags": [],
+            "append": append,
+        }
@@ -32,85 +32,118 @@ class OpenCodeExtractor(BaseExtractor):
         session_dir = base / "session" / "global"
         return session_dir.exists() and any(session_dir.glob("ses_*.json"))
 
-    def extract_sessions(self) -> Iterator[dict]:
+    def iter_sources(self) -> Iterator[Path]:
         base = _find_opencode_storage()
         if not base:
             return
-        session_dir = base / "session" / "global"
-        if not session_dir.exists():
-            return
+        yield from (base / "session" / "global").glob("ses_*.json")
+
+    def watch_paths(self) -> list[Path]:
+        base = _find_opencode_storage()
+        return [base] if base else []
 
-        for ses_file in session_dir.glob("ses_*.json"):
+    def source_for_path(self, path: Path) -> Path | None:
+        base = _find_opencode_storage()
+        if not base:
+            return None
+        if path.parent == base / "session" / "global" and path.name.startswith("ses_"):
+            return path
+        if path.parent.parent == base / "message":
+            # message/<session_id>/msg_*.json
+            return base / "session" / "global" / f"{path.parent.name}.json"
+        if path.parent.parent == base / "part" and path.suffix == ".json":
+            # part/<message_id>/prt_*.json 的路径里没有会话 id，从内容里取
             try:
-                ses = json.loads(ses_file.read_text())
+                sid = json.loads(path.read_text()).get("sessionID")
             except Exception:
-                continue
-
-            sid = ses.get("id", "")
-            if not sid:
-                continue
-
-            # Read messages
-            msg_dir = base / "message" / sid
-            messages = []
-            msg_map = {}  # msg_id -> msg dict
-
-            if msg_dir.exists():
-                for msg_file in sorted(msg_dir.glob("msg_*.json")):
-                    try:
-                        msg = json.loads(msg_file.read_text())
-                    except Exception:
-                        continue
-                    msg_id = msg.get("id", "")
-                    role = msg.get("role", "user")
-                    ts = ""
-                    created = msg.get("time", {}).get("created")
-                    if created:
-                        ts = datetime.fromtimestamp(created / 1000, tz=timezone.utc).isoformat()
-
-                    # Read parts for this message
-                    part_dir = base / "part" / msg_id
-                    content_parts = []
-                    if part_dir.exists():
-                        for prt_file in sorted(part_dir.glob("prt_*.json")):
-                            try:
-                                prt = json.loads(prt_file.read_text())
-                            except Exception:
-                                continue
-                            if prt.get("type") == "text" and prt.get("text"):
-                                content_parts.append(prt["text"])
-
-                    content = "\n".join(content_parts) if content_parts else ""
-                    if not content:
-                        continue
-
-                    messages.append({
-                        "role": role,
-                        "content": content[:4000],
-                        "timestamp": ts,
-                    })
-                    msg_map[msg_id] = msg
-
-            # Title
-            title = ses.get("title", "")
-            if not title:
-                first_user = next((m["content"] for m in messages if m["role"] == "user"), "")
-                title = first_user[:80] if first_user else sid
-
-            # Created time
-            created_at = ""
-            ses_created = ses.get("time", {}).get("created")
-            if ses_created:
-                created_at = datetime.fromtimestamp(ses_created / 1000, tz=timezone.utc).isoformat()
-
-            yield {
-                "id": self.make_session_id("opencode", sid),
-                "source_tool": "opencode",
-                "source_path": str(base),
-                "project": ses.get("directory", ""),
-                "title": title,
-                "summary": "",
-                "created_at": created_at,
-                "messages": messages,
-                "tags": [],
-            }
+                return None
+            return base / "session" / "global" / f"{sid}.json" if sid else None
+        return None
+
+    def source_files(self, ses_file: Path) -> list[Path]:
+        # 消息和 part 分散在独立文件里，任何一个变化都算会话变化
+        base = ses_file.parents[2]
+        files = [ses_file]
+        msg_dir = base / "message" / ses_file.stem
+        if msg_dir.exists():
+            for msg_file in msg_dir.glob("msg_*.json"):
+                files.append(msg_file)
+                part_dir = base / "part" / msg_file.stem
+                if part_dir.exists():
+                    files.extend(part_dir.glob("prt_*.json"))
+        return files
+
+    def parse_source(self, ses_file: Path, cursor: dict = None) -> Iterator[dict]:
+        # 会话拆在多个文件里，不能续读：cursor 忽略，每次整体重解析
+        base = ses_file.parents[2]
+        # 会话文件读不了时抛出（不标记 manifest）；单条消息 / part 坏了只跳过那一条
+        ses = json.loads(ses_file.read_text())
+
+        sid = ses.get("id", "")
+        if not sid:
+            return
+
+        # Read messages
+        msg_dir = base / "message" / sid
+        messages = []
+        msg_map = {}  # msg_id -> msg dict
+
+        if msg_dir.exists():
+            for msg_file in sorted(msg_dir.glob("msg_*.json")):
+                try:
+                    msg = json.loads(msg_file.read_text())
+                except Exception:
+                    continue
+                msg_id = msg.get("id", "")
+                role = msg.get("role", "user")
+                ts = ""
+                created = msg.get("time", {}).get("created")
+                if created:
+                    ts = datetime.fromtimestamp(created / 1000, tz=timezone.utc).isoformat()
+
+                # Read parts for this message
+                part_dir = base / "part" / msg_id
+                content_parts = []
+                if part_dir.exists():
+                    for prt_file in sorted(part_dir.glob("prt_*.json")):
+                        try:
+                            prt = json.loads(prt_file.read_text())
+                        except Exception:
+                            continue
+                        if prt.get("type") == "text" and prt.get("text"):
+                            content_parts.append(prt["text"])
+
+                content = "\n".join(content_parts) if content_parts else ""
+                if not content:
+                    continue
+
+                messages.append({
+                    "role": role,
+                    "content": content[:4000],
+                    "timestamp": ts,
+                })
+                msg_map[msg_id] = msg
+
+        # Title
+        title = ses.get("title", "")
+        if not title:
+            first_user = next((m["content"] for m in messages if m["role"] == "user"), "")
+            title = first_user[:80] if first_user else sid
+
+        # Created time
+        created_at = ""
+        ses_created = ses.get("time", {}).get("created")
+        if ses_created:
+            created_at = datetime.fromtimestamp(ses_created / 1000, tz=timezone.utc).isoformat()
+
+        yield {
+            "id": self.make_session_id("opencode", sid),
+            "source_tool": "opencode",
+            "source_path": str(base),
+            "project": ses.get("directory", ""),
+            "title": title,
+            "summary": "",
+            "created_at": created_at,
+            "messages": messages,
+            "tags": [],
+        }
@@ -22,19 +22,27 @@ async def list_tools() -> list[types.Tool]:
                 "properties": {
                     "query": {"type": "string", "description": "Search query"},
                     "tool": {"type": "string", "description": "Filter by tool: claude_code, cursor, opencode, openclaw"},
-                    "limit": {"type": "integer", "default": 10}
+                    "limit": {"type": "integer", "default": 10},
+                    "since": {"type": "string", "description": "Only sessions started at or after this time: relative (7d, 12h, 2w) or ISO date/time"},
+                    "until": {"type": "string", "description": "Only sessions started at or before this time (same formats as since)"},
+                    "project": {"type": "string", "description": "Exact project name (e.g. engram) or full project path"},
+                    "project_prefix": {"type": "string", "description": "Project path prefix: that directory and every project below it"},
+                    "after": {"type": "string", "description": "Page cursor: pass next_after from the previous response to get the next page of sessions"}
                 },
                 "required": ["query"]
             }
         ),
         types.Tool(
             name="list_sessions",
-            description="List recent AI coding sessions. Optionally filter by tool or project.",
+            description="List recent AI coding sessions. Optionally filter by tool, project or start time.",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "tool": {"type": "string", "description": "Filter by tool"},
-                    "project": {"type": "string", "description": "Filter by project path"},
+                    "since": {"type": "string", "description": "Only sessions started at or after this time: relative (7d, 12h, 2w) or ISO date/time"},
+                    "until": {"type": "string", "description": "Only sessions started at or before this time (same formats as since)"},
+                    "project": {"type": "string", "description": "Exact project name (e.g. engram) or full project path"},
+                    "project_prefix": {"type": "string", "description": "Project path prefix: that directory and every project below it"},
                     "limit": {"type": "integer", "default": 20}
                 }
             }
@@ -66,12 +74,17 @@ async def list_tools() -> list[types.Tool]:
         ),
         types.Tool(
             name="sync_sessions",
-            description="Sync and import latest sessions from all available AI tools on this machine.",
-            inputSchema={"type": "object", "properties": {}}
+            description="Sync and import latest sessions from all available AI tools on this machine. Only changed source files are re-parsed unless full=true.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "full": {"type": "boolean", "default": False, "description": "Ignore the change manifest and rebuild everything"}
+                }
+            }
         ),
         types.Tool(
             name="semantic_search",
-            description="Semantic/vector search across all AI conversations. Better than keyword search for conceptual queries.",
+            description="Semantic/vector search across all AI conversations. Better than keyword search for conceptual queries. Each hit includes the best-matching message chunk and its message_offset (index into get_session messages).",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -87,7 +100,7 @@ async def list_tools() -> list[types.Tool]:
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "project": {"type": "string", "description": "Project directory path"},
+                    "project": {"type": "string", "description": "Project directory path (includes sessions in its subdirectories) or project name"},
                     "limit": {"type": "integer", "default": 5, "description": "Number of recent sessions"}
                 }
             }
@@ -97,11 +110,23 @@ async def list_tools() -> list[types.Tool]:
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
     if name == "search_memory":
-        sessions = search_sessions(
-            arguments["query"],
-            tool=arguments.get("tool"),
-            limit=arguments.get("limit", 10)
-        )
+        limit = arguments.get("limit", 10)
+        after = arguments.get("after")
+        try:
+            sessions = search_sessions(
+                arguments["query"],
+                tool=arguments.get("tool"),
+                limit=limit,
+                after=after,
+                since=arguments.get("since"),
+                until=arguments.get("until"),
+                project=arguments.get("project"),
+                project_prefix=arguments.get("project_prefix"),
+            )
+        except ValueError as e:  # since/until 格式不对
+            return [types.TextContent(type="text", text=json.dumps({"error": str(e)}, ensure_ascii=False))]
+        from .storage.search import cursor_of
+        next_after = cursor_of(sessions[-1]) if len(sessions) == limit and sessions[-1].get("score") else None
         # 同时搜索 memory.db facts（跨工具共享的精炼记忆）
         from .storage.memory_db import search_facts
         facts = search_facts(arguments["query"], limit=8)
@@ -111,15 +136,22 @@ async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
             "sessions": sessions,
             "memories": memories,
             "total": len(facts) + len(sessions) + len(memories),
+            "next_after": next_after,
         }
         return [types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
     
     elif name == "list_sessions":
-        sessions = list_sessions(
-            tool=arguments.get("tool"),
-            project=arguments.get("project"),
-            limit=arguments.get("limit", 20)
-        )
+        try:
+            sessions = list_sessions(
+                tool=arguments.get("tool"),
+                project=arguments.get("project"),
+                project_prefix=arguments.get("project_prefix"),
+                since=arguments.get("since"),
+                until=arguments.get("until"),
+                limit=arguments.get("limit", 20)
+            )
+        except ValueError as e:  # since/until 格式不对
+            return [types.TextContent(type="text", text=json.dumps({"error": str(e)}, ensure_ascii=False))]
         return [types.TextContent(type="text", text=json.dumps(sessions, ensure_ascii=False, indent=2))]
     
     elif name == "get_session":
@@ -142,36 +174,53 @@ async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
         return [types.TextContent(type="text", text=json.dumps({"id": fid, "scope": scope, "status": "saved"}))]
     
     elif name == "sync_sessions":
-        from .storage.db import upsert_session
+        from .storage.db import upsert_sessions
+        from .storage.sync_state import SyncManifest
+        full = bool(arguments.get("full", False))
+        manifest = SyncManifest(full=full)
         extractors = get_available_extractors()
         counts = {}
+        rates = {}
+        errors = {}
         for extractor in extractors:
-            count = 0
-            for session in extractor.extract_sessions():
-                upsert_session(session)
-                count += 1
-            counts[extractor.name] = count
+            # 单个工具出错不影响其他工具的同步结果
+            try:
+                stats = upsert_sessions(extractor.extract_sessions(manifest), manifest=manifest, force=full)
+            except Exception as e:
+                errors[extractor.name] = str(e)
+                continue
+            counts[extractor.name] = stats["sessions"]
+            rates[extractor.name] = round(stats["rows_per_sec"])
         total = sum(counts.values())
-        return [types.TextContent(type="text", text=json.dumps({"synced": counts, "total": total}))]
+        from .storage.embed_queue import drain
+        emb = drain()
+        return [types.TextContent(type="text", text=json.dumps({"synced": counts, "total": total, "rows_per_sec": rates,
+                                                                    "unchanged_sources": manifest.skipped,
+                                                                    "embedded": emb["embedded"],
+                                                                    "pending_embeddings": emb["remaining"],
+                                                                    "errors": errors,
+                                                                    "failed_sources": manifest.failures},
+                                                                   ensure_ascii=False))]
     
     elif name == "semantic_search":
-        from .storage.vector import vector_search
-        from .storage.db import get_db
-        session_ids = vector_search(arguments.get("query", ""), limit=arguments.get("limit", 10))
+        from .storage.vector import vector_search_chunks
+        from .storage.db import get_sessions_brief
+        hits = vector_search_chunks(arguments.get("query", ""), limit=arguments.get("limit", 10))
+        sessions = {s["id"]: s for s in get_sessions_brief([h["session_id"] for h in hits])}
         results = []
-        if session_ids:
-            conn = get_db()
-            try:
-                for sid in session_ids:
-                    row = conn.execute("SELECT * FROM sessions WHERE id = ?", (sid,)).fetchone()
-                    if row:
-                        results.append(dict(row))
-            finally:
-                conn.close()
+        for hit in hits:
+            session = sessions.get(hit["session_id"])
+            if session:
+                results.append({**session, "distance": hit["distance"],
+                                "best_chunk": hit["chunk"], "message_offset": hit["message_offset"]})
         return [types.TextContent(type="text", text=json.dumps(results[:5], ensure_ascii=False, indent=2))]
 
     elif name == "get_context_summary":
-        sessions = list_sessions(project=arguments.get("project"), limit=arguments.get("limit", 5))
+        # 传目录路径时包含其子目录下的会话；传项目名时精确匹配
+        project = arguments.get("project") or ""
+        by_path = "/" in project or "\\" in project
+        sessions = list_sessions(project=None if by_path else project or None,
+                                 project_prefix=project if by_path else None, limit=arguments.get("limit", 5))
         summary_lines = []
         for s in sessions:
             summary_lines.append(f"[{s['source_tool']}] {s['title']} ({s.get('created_at','')})")
@@ -183,11 +232,20 @@ async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
     return [types.TextContent(type="text", text='{"error": "Unknown tool"}')]
 
 def main():
+    from .storage.db import get_db, close_db
+    from .storage.memory_db import get_mem_db, close_mem_db
     init_db()
+    # 连接在整个 server 生命周期内复用，tool 调用不再重新建连
+    get_db()
+    get_mem_db()
     async def _run():
         async with stdio_server() as (read_stream, write_stream):
             await app.run(read_stream, write_stream, app.create_initialization_options())
-    asyncio.run(_run())
+    try:
+        asyncio.run(_run())
+    finally:
+        close_db()
+        close_mem_db()
 
 if __name__ == "__main__":
     main()
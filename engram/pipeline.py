@@ -0,0 +1,129 @@
+"""Parallel sync pipeline: parse pool → single SQLite writer → embedding worker.
+
+Sources are checked against the change manifest on the main thread, parsed
+in a process pool, written by one writer thread in batched transactions, and
+embedded by a separate worker thread that drains the pending-embeddings
+queue as batches commit. Every hand-off is a bounded queue, so a
+slow stage throttles the ones before it and memory stays bounded.
+"""
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+_DONE = object()
+
+
+def _parse_source(name: str, source: Path, cursor: Optional[dict]):
+    """Process-pool entry point: parse one source of extractor ``name``."""
+    from .extractors import ALL_EXTRACTORS
+    extractor = next(e for e in ALL_EXTRACTORS if e.name == name)
+    return list(extractor.parse_source(source, cursor)), cursor
+
+
+def _embed_worker(embed_q: queue.Queue, stats: dict, batch_size: Optional[int]):
+    """Drain the pending-embeddings queue each time the writer commits a batch."""
+    from .storage.embed_queue import drain
+    available = True
+    while True:
+        item = embed_q.get()
+        if item is _DONE:
+            return
+        if not available:
+            continue  # keep consuming so the writer never blocks
+        result = drain(batch_size=batch_size)
+        stats["embedded"] += result["embedded"]
+        if result["error"]:
+            # 模型不可用（未安装 fastembed 等）：留在队列里，之后 `engram embed` 补齐
+            available = False
+
+
+def run_pipeline(extractors: list, manifest, jobs: int = 4, queue_depth: int = 64,
+                 batch_size: int = 200, force: bool = False, embed_batch_size: Optional[int] = None,
+                 on_session: Callable[[dict], None] = None) -> dict:
+    """Sync ``extractors`` with ``jobs`` parser processes.
+
+    ``queue_depth`` bounds both the in-flight parse jobs and the parsed
+    sources waiting for the writer.
+    Returns per-tool ``parsed`` counts, the writer's ingest stats under
+    ``write``, the ``embedded`` and parse ``errors`` counts, and one
+    ``failures`` entry (``tool``, ``source``, ``error``) per source that
+    failed to parse. Sessions the embedding worker could not embed stay
+    queued for ``engram embed``.
+    """
+    from .storage.db import upsert_sessions
+
+    write_q: queue.Queue = queue.Queue(maxsize=queue_depth)
+    embed_q: queue.Queue = queue.Queue(maxsize=queue_depth)
+    result = {"parsed": {e.name: 0 for e in extractors}, "write": {}, "embedded": 0, "errors": 0,
+              "failures": []}
+    writer_error: list[BaseException] = []
+
+    def _drain():
+        while True:
+            item = write_q.get()
+            if item is _DONE:
+                return
+            name, sessions, stamp, cursor = item
+            for session in sessions:
+                result["parsed"][name] += 1
+                if on_session:
+                    on_session(session)
+                yield session
+            manifest.done(stamp, cursor)
+
+    def _writer():
+        try:
+            result["write"] = upsert_sessions(_drain(), batch_size=batch_size, manifest=manifest,
+                                              force=force, embed_queue=embed_q)
+        except BaseException as e:
+            writer_error.append(e)
+            # Unblock the producer: keep consuming until it finishes
+            while write_q.get() is not _DONE:
+                pass
+
+    embedder = threading.Thread(target=_embed_worker, args=(embed_q, result, embed_batch_size), daemon=True)
+    writer = threading.Thread(target=_writer, daemon=True)
+    embedder.start()
+    writer.start()
+
+    def _collect(fut, meta):
+        name, source, stamp = meta
+        try:
+            sessions, cursor = fut.result()
+        except Exception as e:
+            # 不标记 manifest：下次 sync 重试这个文件
+            result["errors"] += 1
+            result["failures"].append({"tool": name, "source": str(source), "error": str(e)})
+            return
+        write_q.put((name, sessions, stamp, cursor))
+
+    try:
+        # spawn: the writer/embedder threads are already running, fork would copy their locks
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            in_flight: deque = deque()
+            for extractor in extractors:
+                for source in extractor.iter_sources():
+                    stamp = manifest.check(str(source), extractor.source_files(source),
+                                           tail=extractor.tailable)
+                    if stamp is None:
+                        continue
+                    cursor = manifest.resume_cursor(str(source), source) if extractor.tailable else None
+                    in_flight.append((pool.submit(_parse_source, extractor.name, source, cursor),
+                                      (extractor.name, source, stamp)))
+                    if len(in_flight) >= queue_depth:
+                        _collect(*in_flight.popleft())
+            while in_flight:
+                _collect(*in_flight.popleft())
+    finally:
+        write_q.put(_DONE)
+        writer.join()
+        embed_q.put(_DONE)
+        embedder.join()
+
+    if writer_error:
+        raise writer_error[0]
+    return result
@@ -0,0 +1,167 @@
+"""Message-level chunk embeddings.
+
+A session's messages are joined and cut into overlapping windows of
+``CHUNK_CHARS``; each chunk is one row of the ``embeddings`` table and one
+row of the ``chunks`` KNN index (see :mod:`engram.storage.vector_index`)
+keyed by its id. The row only locates the chunk (first message id and
+offset, character offset into the text joined from that message, length):
+the text is cut again from ``messages`` when a hit needs its snippet, and
+the vector lives only in the index. Chunking is incremental: when a
+tailed session grows, only the chunks starting in its last chunked message
+are re-cut and new chunks are added after them, so long sessions are never
+re-embedded from the start.
+"""
+import sqlite3
+from bisect import bisect_right
+from typing import Iterable, Optional
+
+CHUNK_CHARS = 800
+CHUNK_OVERLAP = 200
+# Chunk neighbours fetched per requested session (several chunks may hit one session)
+CHUNK_FANOUT = 4
+
+
+def chunk_messages(messages: list[dict], size: int = CHUNK_CHARS,
+                   overlap: int = CHUNK_OVERLAP) -> list[tuple[int, int, str]]:
+    """Split messages into overlapping windows; returns ``(message_index, char_offset, text)``.
+
+    ``message_index`` is the position of the message the window starts in,
+    ``char_offset`` where ``text`` starts in the messages joined from that one
+    (see :func:`joined_text`).
+    """
+    starts, parts, pos = [], [], 0
+    for m in messages:
+        text = (m.get("content") or "").strip()
+        starts.append(pos)
+        parts.append(text)
+        pos += len(text) + 1
+    joined = "\n".join(parts)
+    if not joined.strip():
+        return []
+    chunks = []
+    step = max(size - overlap, 1)
+    for begin in range(0, len(joined), step):
+        window = joined[begin:begin + size]
+        text = window.strip()
+        if text:
+            index = bisect_right(starts, begin) - 1
+            start = begin + len(window) - len(window.lstrip())
+            chunks.append((index, start - starts[index], text))
+        if begin + size >= len(joined):
+            break
+    return chunks
+
+
+def joined_text(rows: Iterable, end: int) -> str:
+    """Message bodies joined as :func:`chunk_messages` joins them, read until ``end`` chars."""
+    parts, pos = [], 0
+    for row in rows:
+        text = (row[0] or "").strip()
+        parts.append(text)
+        pos += len(text) + 1
+        if pos > end:
+            break
+    return "\n".join(parts)
+
+
+def _bodies_from(conn: sqlite3.Connection, session_id: str, message_id: int):
+    from .shards import messages_db
+    return messages_db(conn, session_id).execute(
+        "SELECT engram_text(content) FROM messages WHERE session_id = ? AND id >= ? ORDER BY id",
+        (session_id, message_id))
+
+
+def chunk_text(conn: sqlite3.Connection, session_id: str, message_id: int,
+               char_offset: Optional[int], char_length: Optional[int]) -> Optional[str]:
+    """A stored chunk's text, cut again from the session's messages."""
+    if char_offset is None or char_length is None:
+        return None
+    end = char_offset + char_length
+    return joined_text(_bodies_from(conn, session_id, message_id), end)[char_offset:end]
+
+
+def plan_chunks(conn: sqlite3.Connection, session_id: str) -> tuple[Optional[int], list[dict]]:
+    """Chunks still to embed for a session.
+
+    Returns ``(from_message_id, chunks)``: existing chunks starting at or
+    after ``from_message_id`` are superseded by the new ones (None when the
+    session has no chunks yet). Each chunk dict has ``message_id``,
+    ``message_offset``, ``char_offset``, ``char_length`` and ``chunk`` (the
+    text to embed; it is not stored).
+    """
+    last = conn.execute("""
+        SELECT message_id, message_offset FROM embeddings
+        WHERE session_id = ? AND source_type = 'chunk' ORDER BY id DESC LIMIT 1
+    """, (session_id,)).fetchone()
+    if last is None:
+        from_id, base = None, 0
+    else:
+        # Re-cut from the start of the message the last chunk begins in
+        from_id = last["message_id"]
+        base = last["message_offset"]
+    from .shards import messages_db
+    msgs = messages_db(conn, session_id).execute(
+        "SELECT id, engram_text(content) AS content FROM messages WHERE session_id = ? AND id >= ? ORDER BY id",
+        (session_id, from_id or 0)).fetchall()
+    if from_id is not None and len(msgs) <= 1:
+        return from_id, []  # nothing appended since the last chunk was cut
+    chunks = [{"message_id": msgs[i]["id"], "message_offset": base + i, "char_offset": offset,
+               "char_length": len(text), "chunk": text}
+              for i, offset, text in chunk_messages([dict(m) for m in msgs])]
+    return from_id, chunks
+
+
+_CHUNK_IDS = "SELECT id FROM embeddings WHERE session_id = ? AND source_type = 'chunk' AND message_id >= ?"
+
+
+def delete_chunks(conn: sqlite3.Connection, session_id: str, from_message_id: int = 0):
+    """Drop a session's chunks (those starting at or after ``from_message_id``)."""
+    from .vector_index import get_index
+    args = (session_id, from_message_id)
+    ids = [r[0] for r in conn.execute(_CHUNK_IDS, args)]
+    if ids:
+        get_index("chunks").remove(conn, ids)
+        conn.execute(f"DELETE FROM embeddings WHERE id IN ({_CHUNK_IDS})", args)
+
+
+def store_chunks(conn: sqlite3.Connection, session_id: str, from_message_id: Optional[int],
+                 chunks: list[dict], blobs: list[bytes]):
+    if not chunks:
+        return
+    from .vector_index import get_index
+    if from_message_id is not None:
+        delete_chunks(conn, session_id, from_message_id)
+    indexed = []
+    for c, blob in zip(chunks, blobs):
+        # 只存位置：正文在 messages 里，向量只在索引里
+        cid = conn.execute("""
+            INSERT INTO embeddings (session_id, message_id, message_offset, char_offset, char_length, source_type)
+            VALUES (?, ?, ?, ?, ?, 'chunk')
+        """, (session_id, c["message_id"], c["message_offset"], c["char_offset"], c["char_length"])).lastrowid
+        indexed.append((cid, blob))
+    get_index("chunks").add(conn, indexed)
+
+
+def chunk_search(conn: sqlite3.Connection, q_emb: bytes, limit: int = 10) -> list[dict]:
+    """KNN over chunks, max-sim aggregated per session (nearest chunk wins).
+
+    Returns dicts with ``session_id``, ``distance``, ``chunk`` and
+    ``message_offset`` of each session's best chunk, nearest first.
+    """
+    from .vector_index import get_index
+    nearest = get_index("chunks").search(conn, q_emb, limit * CHUNK_FANOUT)
+    if not nearest:
+        return []
+    rows = {r["id"]: r for r in conn.execute(f"""
+        SELECT id, session_id, message_id, message_offset, char_offset, char_length FROM embeddings
+        WHERE id IN ({",".join("?" * len(nearest))})
+    """, [cid for cid, _ in nearest])}
+    best: dict[str, tuple] = {}
+    for cid, distance in nearest:
+        r = rows.get(cid)
+        if r is not None and r["session_id"] not in best:
+            best[r["session_id"]] = (r, distance)
+    # Snippets only for the hits returned
+    return [{"session_id": r["session_id"], "message_offset": r["message_offset"], "distance": distance,
+             "chunk": chunk_text(conn, r["session_id"], r["message_id"], r["char_offset"], r["char_length"])}
+            for r, distance in list(best.values())[:limit]]
@@ -0,0 +1,212 @@
+"""Optional zstd compression of message bodies with a corpus-trained dictionary.
+
+Enabled with ``"message_compression": "zstd"`` in config.json (``engram
+compact`` turns it on and converts the rows already stored). Compressed
+bodies are stored as BLOBs in ``messages.content``; plain rows stay TEXT, so
+both kinds mix freely. Every engram.db connection registers the SQL function
+``engram_text(content)``, which returns the text either way. The FTS tables
+index the ``messages_text`` view built on it, so search and snippets see the
+decompressed text.
+
+Short messages are not worth a frame and are kept as text. Dictionaries are
+kept in ``zstd_dicts`` under their zstd dict id (each frame records the id it
+was compressed with), so retraining never strands older rows.
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+# Dictionary size and training sample count (zstd's defaults are in this range)
+DICT_SIZE = 112 * 1024
+TRAIN_SAMPLES = 20000
+# zstd needs a reasonable sample to train on
+MIN_TRAIN_SAMPLES = 200
+# Bodies shorter than this (bytes) stay plain text
+MIN_COMPRESS_BYTES = 128
+DEFAULT_LEVEL = 9
+BATCH_SIZE = 1000
+
+_dicts: dict[int, bytes] = {}
+_local = threading.local()
+
+
+def available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def enabled() -> bool:
+    from ..config import get_config
+    return get_config().get("message_compression") == "zstd"
+
+
+def _load_dict(db_path: Path, dict_id: int) -> bytes:
+    data = _dicts.get(dict_id)
+    if data is None:
+        # Own connection: the SQL function can't query the connection it runs on
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+            row = conn.execute("SELECT dict FROM zstd_dicts WHERE dict_id = ?", (dict_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"zstd dictionary {dict_id} missing from {db_path}")
+        data = _dicts[dict_id] = row[0]
+    return data
+
+
+def _decompressor(db_path: Path, dict_id: int):
+    """Per-thread decompressors (zstandard contexts are not thread-safe)."""
+    import zstandard
+    cache = _local.__dict__.setdefault("decompressors", {})
+    d = cache.get(dict_id)
+    if d is None:
+        dict_data = zstandard.ZstdCompressionDict(_load_dict(db_path, dict_id)) if dict_id else None
+        d = cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return d
+
+
+def decompress(db_path: Path, data: bytes) -> str:
+    import zstandard
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    return _decompressor(db_path, dict_id).decompress(data).decode("utf-8")
+
+
+def register(conn: sqlite3.Connection, db_path: Path):
+    """Register ``engram_text()`` on a connection to ``db_path``."""
+    def engram_text(value):
+        if isinstance(value, bytes):
+            return decompress(db_path, value)
+        return value
+    conn.create_function("engram_text", 1, engram_text, deterministic=True)
+
+
+def _latest_dict(conn: sqlite3.Connection) -> Optional[tuple[int, bytes]]:
+    row = conn.execute("SELECT dict_id, dict FROM zstd_dicts ORDER BY seq DESC LIMIT 1").fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def encoder(conn: sqlite3.Connection, level: Optional[int] = None,
+            force: bool = False) -> Optional[Callable[[str], Union[str, bytes]]]:
+    """Content encoder for new message rows, or None to store plain text.
+
+    None unless compression is enabled (or ``force``), zstandard is
+    installed and a dictionary has been trained (``engram compact``).
+    """
+    if not (force or enabled()) or not available():
+        return None
+    latest = _latest_dict(conn)
+    if latest is None:
+        return None
+    import zstandard
+    from ..config import get_config
+    dict_id, data = latest
+    _dicts[dict_id] = data
+    compressor = zstandard.ZstdCompressor(
+        level=level or get_config().get("compression_level", DEFAULT_LEVEL),
+        dict_data=zstandard.ZstdCompressionDict(data))
+
+    def encode(text: str) -> Union[str, bytes]:
+        raw = text.encode("utf-8")
+        if len(raw) < MIN_COMPRESS_BYTES:
+            return text
+        packed = compressor.compress(raw)
+        return packed if len(packed) < len(raw) else text
+    return encode
+
+
+def train(conn: sqlite3.Connection, samples: int = TRAIN_SAMPLES, dict_size: int = DICT_SIZE) -> int:
+    """Train a dictionary on a random sample of stored messages; returns its id."""
+    import random
+    import zstandard
+    from .shards import message_dbs
+    texts = []
+    for _, mconn in message_dbs():
+        texts += [r[0].encode("utf-8") for r in mconn.execute("""
+            SELECT engram_text(content) FROM messages
+            WHERE id IN (SELECT id FROM messages ORDER BY random() LIMIT ?)
+        """, (samples,))]
+    if len(texts) > samples:
+        texts = random.sample(texts, samples)
+    if len(texts) < MIN_TRAIN_SAMPLES:
+        raise ValueError(f"need at least {MIN_TRAIN_SAMPLES} messages to train a dictionary, found {len(texts)}")
+    trained = zstandard.train_dictionary(dict_size, texts)
+    dict_id = trained.dict_id()
+    conn.execute("INSERT OR REPLACE INTO zstd_dicts (dict_id, dict, samples) VALUES (?, ?, ?)",
+                 (dict_id, trained.as_bytes(), len(texts)))
+    _dicts[dict_id] = trained.as_bytes()
+    return dict_id
+
+
+def _content_bytes() -> int:
+    from .shards import message_dbs
+    return sum(c.execute("SELECT COALESCE(SUM(length(CAST(content AS BLOB))), 0) FROM messages").fetchone()[0]
+               for _, c in message_dbs())
+
+
+def compact(retrain: bool = False, level: Optional[int] = None, batch_size: int = BATCH_SIZE,
+            on_progress: Callable[[int, int], None] = None) -> dict:
+    """Compress every plain-text message body, training a dictionary first if needed.
+
+    Covers engram.db and every month shard. With ``retrain`` a new
+    dictionary is trained and used for the rows converted from now on; rows
+    compressed earlier keep their dictionary.
+    ``on_progress(done, total)`` is called after every committed batch.
+    Returns ``rows`` (compressed), ``bytes_before``, ``bytes_after``, ``dict_id`` and ``seconds``.
+    """
+    from .db import transaction
+    from .shards import message_dbs
+    start = time.perf_counter()
+    with transaction() as conn:
+        if retrain or _latest_dict(conn) is None:
+            train(conn)
+        encode = encoder(conn, level=level, force=True)
+        dict_id = _latest_dict(conn)[0]
+    before = _content_bytes()
+    dbs = message_dbs(write=True)
+    total = sum(c.execute("SELECT COUNT(*) FROM messages WHERE typeof(content) = 'text'").fetchone()[0]
+                for _, c in dbs)
+    done = compressed = 0
+    for _, mconn in dbs:
+        last_id = 0
+        while True:
+            rows = mconn.execute("""
+                SELECT id, content FROM messages WHERE id > ? AND typeof(content) = 'text'
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            updates = [(packed, r["id"]) for r in rows
+                       if isinstance(packed := encode(r["content"]), bytes)]
+            # FTS triggers skip rows whose decompressed text is unchanged
+            with mconn:
+                mconn.executemany("UPDATE messages SET content = ? WHERE id = ?", updates)
+            compressed += len(updates)
+            last_id = rows[-1]["id"]
+            done += len(rows)
+            if on_progress:
+                on_progress(done, total)
+    return {"rows": compressed, "bytes_before": before, "bytes_after": _content_bytes(), "dict_id": dict_id,
+            "seconds": time.perf_counter() - start}
+
+
+def decompress_all(batch_size: int = BATCH_SIZE) -> dict:
+    """Store every message body as plain text again (before uninstalling zstandard)."""
+    from .shards import message_dbs
+    start = time.perf_counter()
+    before = _content_bytes()
+    rows = 0
+    for _, mconn in message_dbs(write=True):
+        while True:
+            with mconn:
+                n = mconn.execute("""
+                    UPDATE messages SET content = engram_text(content)
+                    WHERE id IN (SELECT id FROM messages WHERE typeof(content) = 'blob' LIMIT ?)
+                """, (batch_size,)).rowcount
+            if not n:
+                break
+            rows += n
+    return {"rows": rows, "bytes_before": before, "bytes_after": _content_bytes(),
+            "seconds": time.perf_counter() - start}
@@ -0,0 +1,122 @@
+"""Process-wide SQLite connection manager.
+
+Each thread gets one long-lived connection per database file. PRAGMAs and
+extensions are applied once when the connection is opened, and sqlite3's
+statement cache keeps prepared statements warm across calls.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    # Only takes effect on a new file; engram optimize converts older ones
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionManager:
+    """Hands out one cached connection per (thread, database path).
+
+    ``path`` is a callable so that module-level path constants can still be
+    monkeypatched; if it starts returning a different path, the thread's
+    connection is transparently reopened. ``readonly`` connections open the
+    file with ``mode=ro`` (for cold shards, see :mod:`engram.storage.shards`).
+    """
+
+    def __init__(self, path: Callable[[], Path],
+                 on_open: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 pragmas: tuple = PRAGMAS, readonly: bool = False):
+        self._path = path
+        self._on_open = on_open
+        self._pragmas = pragmas
+        self._readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[sqlite3.Connection] = []
+        self._pid = os.getpid()
+
+    def _open(self, path: Path) -> sqlite3.Connection:
+        if self._readonly:
+            target, uri = f"file:{path}?mode=ro", True
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            target, uri = str(path), False
+        # check_same_thread is off only so close_all() can run from the main
+        # thread; each connection is still used by the thread that opened it.
+        conn = sqlite3.connect(target, timeout=10, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False, uri=uri)
+        conn.row_factory = sqlite3.Row
+        for pragma in self._pragmas:
+            conn.execute(pragma)
+        if self._on_open:
+            self._on_open(conn)
+        conn.commit()
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        if os.getpid() != self._pid:
+            # Forked child: inherited connections must not be reused.
+            self._local = threading.local()
+            self._all = []
+            self._pid = os.getpid()
+        path = Path(self._path())
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.path == path:
+            return conn
+        if conn is not None:
+            self._discard(conn)
+        conn = self._open(path)
+        self._local.conn = conn
+        self._local.path = path
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Yield this thread's connection; commit on success, roll back on error."""
+        conn = self.get()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if conn.in_transaction:
+                conn.commit()
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        conn.close()
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._discard(conn)
+            self._local.conn = None
+
+    def close_all(self):
+        """Close every connection this manager has handed out.
+
+        Used before the database file is replaced (e.g. ``engram pull``) and
+        on process shutdown.
+        """
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
@@ -1,10 +1,20 @@
 """SQLite storage with FTS5 full-text search and vector semantic search."""
 import sqlite3
 import json
+import hashlib
 import os
+import queue
+import re
+import time
 from pathlib import Path
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Iterable, Optional
+
+from .connection import ConnectionManager
+from .migrations import add_column, migrate, only_if, steps
+from .search import trigram_supported
+from . import shards
 
 DB_PATH = Path.home() / ".engram" / "engram.db"
 
@@ -19,7 +29,8 @@ CREATE TABLE IF NOT EXISTS sessions (
     message_count INTEGER DEFAULT 0,
     created_at TEXT,
     imported_at TEXT DEFAULT (datetime('now')),
-    tags TEXT DEFAULT '[]'
+    tags TEXT DEFAULT '[]',
+    content_hash TEXT
 );
 
 CREATE TABLE IF NOT EXISTS messages (
@@ -31,17 +42,6 @@ CREATE TABLE IF NOT EXISTS messages (
     has_images INTEGER DEFAULT 0
 );
 
-CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
-    id UNINDEXED,
-    title,
-    summary
-);
-
-CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
-    session_id UNINDEXED,
-    content
-);
-
 CREATE TABLE IF NOT EXISTS memories (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     content TEXT NOT NULL,
@@ -51,32 +51,61 @@ CREATE TABLE IF NOT EXISTS memories (
     created_at TEXT DEFAULT (datetime('now'))
 );
 
-CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
-    id UNINDEXED,
-    content
-);
-
 CREATE TABLE IF NOT EXISTS embeddings (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     session_id TEXT,
     message_id INTEGER,
-    chunk TEXT NOT NULL,
-    embedding BLOB,
-    source_type TEXT DEFAULT 'message'
+    source_type TEXT DEFAULT 'message',
+    message_offset INTEGER,
+    char_offset INTEGER,
+    char_length INTEGER
 );
 
-CREATE VIRTUAL TABLE IF NOT EXISTS vec_embeddings USING vec0(
-    session_id TEXT,
-    embedding FLOAT[384]
+CREATE TABLE IF NOT EXISTS sync_state (
+    source_path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    content_hash TEXT,
+    byte_offset INTEGER,
+    head_hash TEXT,
+    cursor TEXT,
+    synced_at TEXT DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS pending_embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL UNIQUE,
+    queued_at TEXT DEFAULT (datetime('now'))
+);
+
+-- sessions_fts / messages_fts / memories_fts: external-content FTS5 created by migration 3
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    created_at TEXT DEFAULT (datetime('now')),
+    PRIMARY KEY (model, content_hash)
+) WITHOUT ROWID;
+
+-- Sessions removed by engram prune; sync does not import them again
+CREATE TABLE IF NOT EXISTS pruned_sessions (
+    id TEXT PRIMARY KEY,
+    pruned_at TEXT DEFAULT (datetime('now'))
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS zstd_dicts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    dict_id INTEGER NOT NULL UNIQUE,
+    dict BLOB NOT NULL,
+    samples INTEGER,
+    created_at TEXT DEFAULT (datetime('now'))
 );
 """
 
-def get_db() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(DB_PATH), timeout=10)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
+def _on_open(conn: sqlite3.Connection):
+    from .compression import register
+    register(conn, DB_PATH)
     try:
         import sqlite_vec
         conn.enable_load_extension(True)
@@ -84,198 +113,667 @@ def get_db() -> sqlite3.Connection:
         conn.enable_load_extension(False)
     except Exception:
         pass
-    return conn
+    # Commands that never call init_db (search, ls, recent, MCP reads) still get the current schema
+    conn.executescript(SCHEMA)
+    migrate(conn, MIGRATIONS)
+
+_manager = ConnectionManager(lambda: DB_PATH, on_open=_on_open)
+
+def get_db() -> sqlite3.Connection:
+    """Return this thread's shared engram.db connection (do not close it)."""
+    return _manager.get()
+
+def transaction():
+    """Context manager over the shared connection: commits on success, rolls back on error."""
+    return _manager.transaction()
+
+def close_db():
+    """Close all engram.db connections held by this process."""
+    _manager.close_all()
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def _message_index_sql(table: str, tokenize: str) -> str:
+    """(Re)create a message FTS table over ``messages_text``, with its triggers."""
+    return f"""
+    DROP TRIGGER IF EXISTS {table}_ai;
+    DROP TRIGGER IF EXISTS {table}_ad;
+    DROP TRIGGER IF EXISTS {table}_au;
+    DROP TABLE IF EXISTS {table};
+    CREATE VIRTUAL TABLE {table} USING fts5(
+        content, content='messages_text', content_rowid='id', tokenize='{tokenize}');
+    CREATE TRIGGER {table}_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO {table} (rowid, content) VALUES (new.id, engram_text(new.content));
+    END;
+    CREATE TRIGGER {table}_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO {table} ({table}, rowid, content) VALUES ('delete', old.id, engram_text(old.content));
+    END;
+    -- compressing or decompressing a body in place leaves the text, and the index, unchanged
+    CREATE TRIGGER {table}_au AFTER UPDATE OF content ON messages
+    WHEN engram_text(old.content) IS NOT engram_text(new.content) BEGIN
+        INSERT INTO {table} ({table}, rowid, content) VALUES ('delete', old.id, engram_text(old.content));
+        INSERT INTO {table} (rowid, content) VALUES (new.id, engram_text(new.content));
+    END;
+    INSERT INTO {table} ({table}) VALUES ('rebuild');
+    """
+
+def normalize_project(project: Optional[str]) -> Optional[str]:
+    """Project path with ``/`` separators, ``~`` expanded and no trailing slash (None if empty)."""
+    if not project:
+        return None
+    path = os.path.expanduser(project.replace("\\", "/"))
+    return path.rstrip("/") or "/"
+
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_RELATIVE = re.compile(r"^(\d+)\s*([mhdw])$")
+_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+def normalize_time(value, end: bool = False) -> Optional[str]:
+    """``YYYY-MM-DD HH:MM:SS`` in UTC (the format of ``imported_at``) for an ISO
+    date/time or an epoch in seconds or milliseconds; None if unparseable.
+    A bare date means the start of that day, or its last second with ``end``."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = float(text)
+        except ValueError:
+            try:
+                dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+            if end and len(text) == 10:
+                dt += timedelta(days=1, seconds=-1)
+            return dt.strftime(_TIME_FORMAT)
+    if isinstance(value, (int, float)) and value > 0:
+        ts = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime(_TIME_FORMAT)
+    return None
+
+def filter_time(value: str, end: bool = False) -> str:
+    """A ``since`` / ``until`` filter value: a relative age (``30m``, ``12h``, ``7d``, ``2w``)
+    or anything :func:`normalize_time` accepts. Raises ValueError otherwise."""
+    m = _RELATIVE.match(value.strip())
+    if m:
+        then = datetime.now(timezone.utc) - timedelta(**{_UNITS[m.group(2)]: int(m.group(1))})
+        return then.strftime(_TIME_FORMAT)
+    normalized = normalize_time(value, end=end)
+    if normalized is None:
+        raise ValueError(f"unrecognized time {value!r} (use 7d, 12h, 2w or YYYY-MM-DD)")
+    return normalized
+
+def session_filter(filters: Optional[dict], alias: str = "s") -> tuple[str, dict]:
+    """SQL condition over the sessions table ``alias`` and its named parameters.
+
+    ``filters`` may hold ``tool``, ``since`` / ``until`` (see
+    :func:`filter_time`; compared with ``started_at``), ``project`` (exact
+    project name, or exact path when it contains a ``/``) and
+    ``project_prefix`` (a path: that project and everything below it).
+    Every condition is served by an index from migration 8. Returns
+    ``("1", {})`` when there is nothing to filter.
+    """
+    f = {k: v for k, v in (filters or {}).items() if v}
+    clauses, params = [], {}
+    if "tool" in f:
+        clauses.append(f"{alias}.source_tool = :f_tool"); params["f_tool"] = f["tool"]
+    if "since" in f:
+        clauses.append(f"{alias}.started_at >= :f_since"); params["f_since"] = filter_time(f["since"])
+    if "until" in f:
+        clauses.append(f"{alias}.started_at <= :f_until"); params["f_until"] = filter_time(f["until"], end=True)
+    if "project" in f:
+        if "/" in f["project"] or "\\" in f["project"]:
+            clauses.append(f"{alias}.project_path = :f_project"); params["f_project"] = normalize_project(f["project"])
+        else:
+            clauses.append(f"{alias}.project_name = :f_project"); params["f_project"] = f["project"]
+    if "project_prefix" in f:
+        # Range scans on the index: the path itself, or anything between "<path>/" and "<path>0"
+        clauses.append(f"({alias}.project_path = :f_prefix OR ({alias}.project_path >= :f_prefix || '/'"
+                       f" AND {alias}.project_path < :f_prefix || '0'))")
+        params["f_prefix"] = normalize_project(f["project_prefix"])
+    return (" AND ".join(clauses) or "1"), params
+
+def session_labels(title: Optional[str], project: Optional[str]) -> tuple[int, Optional[str]]:
+    """``(is_noise, project_name)`` stored with a session.
+
+    ``is_noise`` marks heartbeat / cron / system sessions by their title;
+    ``project_name`` is the project directory's name, NULL when it is not a
+    real project (home, the OpenClaw workspace, ... see ``SKIP_PROJECT_DIRS``).
+    """
+    from ..extractor_facts import SKIP_PROJECT_DIRS, _is_noise
+    name = os.path.basename(normalize_project(project) or "")
+    return int(_is_noise(title or "")), (None if name in SKIP_PROJECT_DIRS else name)
+
+def _backfill_labels(conn: sqlite3.Connection):
+    rows = conn.execute("SELECT id, title, project FROM sessions").fetchall()
+    conn.executemany("UPDATE sessions SET is_noise = ?, project_name = ? WHERE id = ?",
+                     [(*session_labels(r[1], r[2]), r[0]) for r in rows])
+
+def _backfill_paths(conn: sqlite3.Connection):
+    rows = conn.execute("SELECT id, project, created_at, imported_at FROM sessions").fetchall()
+    conn.executemany("UPDATE sessions SET project_path = ?, started_at = ? WHERE id = ?",
+                     [(normalize_project(r[1]), normalize_time(r[2]) or r[3], r[0]) for r in rows])
+
+_SLIM_EMBEDDINGS = """
+CREATE TABLE embeddings_slim (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    message_id INTEGER,
+    source_type TEXT DEFAULT 'message',
+    message_offset INTEGER,
+    char_offset INTEGER,
+    char_length INTEGER
+)
+"""
+
+def _slim_chunk_rows(conn: sqlite3.Connection):
+    """Replace stored chunk text and vectors with the chunk's position in its messages."""
+    if "chunk" not in {r[1] for r in conn.execute("PRAGMA table_info(embeddings)")}:
+        return  # created by the current SCHEMA
+    from .chunks import _bodies_from
+    conn.execute(_SLIM_EMBEDDINGS)
+    rows = []
+    for r in conn.execute("""
+        SELECT id, session_id, message_id, message_offset, chunk FROM embeddings
+        WHERE source_type = 'chunk' ORDER BY id
+    """).fetchall():
+        chunk = r["chunk"] or ""
+        parts, length = [], -1
+        # A chunk starts in message message_id (or on the newline after it)
+        for body in _bodies_from(conn, r["session_id"], r["message_id"]):
+            parts.append((body[0] or "").strip())
+            length += len(parts[-1]) + 1
+            if length >= len(parts[0]) + 1 + len(chunk):
+                break
+        offset = "\n".join(parts).find(chunk) if chunk else -1
+        # Messages rewritten since the chunk was cut: no snippet (re-chunked on the next embed)
+        rows.append((r["id"], r["session_id"], r["message_id"], r["message_offset"],
+                     offset if offset >= 0 else None, len(chunk) if offset >= 0 else None))
+    conn.executemany("""
+        INSERT INTO embeddings_slim (id, session_id, message_id, source_type, message_offset, char_offset, char_length)
+        VALUES (?, ?, ?, 'chunk', ?, ?, ?)
+    """, rows)
+    # Keep AUTOINCREMENT from handing out ids the chunks index may still hold
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'embeddings_slim'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'embeddings_slim', seq FROM sqlite_sequence"
+                 " WHERE name = 'embeddings'")
+    conn.execute("DROP TABLE embeddings")
+    conn.execute("ALTER TABLE embeddings_slim RENAME TO embeddings")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_session ON embeddings(session_id, source_type, message_id)")
+
+# Append-only; see engram.storage.migrations
+MIGRATIONS = [
+    # 1: columns added after the first release (fresh databases get them from SCHEMA)
+    steps(
+        add_column("sessions", "content_hash", "TEXT"),
+        add_column("sync_state", "byte_offset", "INTEGER"),
+        add_column("sync_state", "head_hash", "TEXT"),
+        add_column("sync_state", "cursor", "TEXT"),
+        add_column("embeddings", "message_offset", "INTEGER"),
+    ),
+    # 2: indexes for per-session message reads, recency listing and chunk lookups
+    """
+    CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+    CREATE INDEX IF NOT EXISTS idx_sessions_imported ON sessions(imported_at);
+    CREATE INDEX IF NOT EXISTS idx_sessions_tool_imported ON sessions(source_tool, imported_at);
+    CREATE INDEX IF NOT EXISTS idx_embeddings_session ON embeddings(session_id, source_type, message_id);
+    """,
+    # 3: FTS tables index the base tables' text instead of storing a second copy and are
+    # kept in sync by triggers; hits join back by rowid. sessions has no INTEGER PRIMARY
+    # KEY, so after a full VACUUM sessions_fts must be rebuilt (rowids may change).
+    """
+    DROP TABLE IF EXISTS sessions_fts;
+    DROP TABLE IF EXISTS messages_fts;
+    DROP TABLE IF EXISTS memories_fts;
+    CREATE VIRTUAL TABLE sessions_fts USING fts5(title, summary, content='sessions');
+    CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='messages', content_rowid='id');
+    CREATE VIRTUAL TABLE memories_fts USING fts5(content, content='memories', content_rowid='id');
+
+    CREATE TRIGGER sessions_fts_ai AFTER INSERT ON sessions BEGIN
+        INSERT INTO sessions_fts (rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+    END;
+    CREATE TRIGGER sessions_fts_ad AFTER DELETE ON sessions BEGIN
+        INSERT INTO sessions_fts (sessions_fts, rowid, title, summary)
+        VALUES ('delete', old.rowid, old.title, old.summary);
+    END;
+    CREATE TRIGGER sessions_fts_au AFTER UPDATE OF title, summary ON sessions
+    WHEN old.title IS NOT new.title OR old.summary IS NOT new.summary BEGIN
+        INSERT INTO sessions_fts (sessions_fts, rowid, title, summary)
+        VALUES ('delete', old.rowid, old.title, old.summary);
+        INSERT INTO sessions_fts (rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+    END;
+
+    CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+
+    CREATE TRIGGER memories_fts_ai AFTER INSERT ON memories BEGIN
+        INSERT INTO memories_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER memories_fts_ad AFTER DELETE ON memories BEGIN
+        INSERT INTO memories_fts (memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER memories_fts_au AFTER UPDATE OF content ON memories BEGIN
+        INSERT INTO memories_fts (memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO memories_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+
+    INSERT INTO sessions_fts (sessions_fts) VALUES ('rebuild');
+    INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+    INSERT INTO memories_fts (memories_fts) VALUES ('rebuild');
+    """,
+    # 4: trigram twins of the FTS tables for substring and CJK queries (see search.plan_query)
+    only_if(trigram_supported, """
+    CREATE VIRTUAL TABLE IF NOT EXISTS sessions_tri USING fts5(title, summary, content='sessions', tokenize='trigram');
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_tri USING fts5(content, content='messages', content_rowid='id', tokenize='trigram');
+    CREATE VIRTUAL TABLE IF NOT EXISTS memories_tri USING fts5(content, content='memories', content_rowid='id', tokenize='trigram');
+
+    CREATE TRIGGER IF NOT EXISTS sessions_tri_ai AFTER INSERT ON sessions BEGIN
+        INSERT INTO sessions_tri (rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+    END;
+    CREATE TRIGGER IF NOT EXISTS sessions_tri_ad AFTER DELETE ON sessions BEGIN
+        INSERT INTO sessions_tri (sessions_tri, rowid, title, summary)
+        VALUES ('delete', old.rowid, old.title, old.summary);
+    END;
+    CREATE TRIGGER IF NOT EXISTS sessions_tri_au AFTER UPDATE OF title, summary ON sessions
+    WHEN old.title IS NOT new.title OR old.summary IS NOT new.summary BEGIN
+        INSERT INTO sessions_tri (sessions_tri, rowid, title, summary)
+        VALUES ('delete', old.rowid, old.title, old.summary);
+        INSERT INTO sessions_tri (rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS messages_tri_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_tri (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_tri_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_tri (messages_tri, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_tri_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_tri (messages_tri, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_tri (rowid, content) VALUES (new.id, new.content);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS memories_tri_ai AFTER INSERT ON memories BEGIN
+        INSERT INTO memories_tri (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS memories_tri_ad AFTER DELETE ON memories BEGIN
+        INSERT INTO memories_tri (memories_tri, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS memories_tri_au AFTER UPDATE OF content ON memories BEGIN
+        INSERT INTO memories_tri (memories_tri, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO memories_tri (rowid, content) VALUES (new.id, new.content);
+    END;
+
+    INSERT INTO sessions_tri (sessions_tri) VALUES ('rebuild');
+    INSERT INTO messages_tri (messages_tri) VALUES ('rebuild');
+    INSERT INTO memories_tri (memories_tri) VALUES ('rebuild');
+    """),
+    # 5: message bodies may be zstd BLOBs (engram.storage.compression): the message FTS
+    # tables index the decompressed messages_text view, and their triggers decompress
+    steps(
+        "CREATE VIEW IF NOT EXISTS messages_text AS "
+        "SELECT id, session_id, engram_text(content) AS content FROM messages",
+        _message_index_sql("messages_fts", "unicode61"),
+        only_if(lambda conn: _has_table(conn, "messages_tri"), _message_index_sql("messages_tri", "trigram")),
+    ),
+    # 6: month shard holding the session's messages (engram.storage.shards); NULL = this file
+    add_column("sessions", "shard", "TEXT"),
+    # 7: noise flag and project name computed at ingest (session_labels), so recent / context
+    # lists filter and page in SQL; the partial index serves exactly that filter
+    steps(
+        add_column("sessions", "is_noise", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("sessions", "project_name", "TEXT"),
+        _backfill_labels,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_listed ON sessions(imported_at)"
+        " WHERE is_noise = 0 AND project_name IS NOT NULL",
+    ),
+    # 8: normalized project path and start time (UTC, imported_at's format) behind the
+    # since / until / project filters of search and list_sessions (session_filter)
+    steps(
+        add_column("sessions", "project_path", "TEXT"),
+        add_column("sessions", "started_at", "TEXT"),
+        _backfill_paths,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at);
+        CREATE INDEX IF NOT EXISTS idx_sessions_tool_started ON sessions(source_tool, started_at);
+        CREATE INDEX IF NOT EXISTS idx_sessions_project_path ON sessions(project_path, started_at);
+        CREATE INDEX IF NOT EXISTS idx_sessions_project_name ON sessions(project_name, started_at);
+        """,
+    ),
+    # 9: the few noise sessions, for engram prune's noise rule (retention._noise_ids)
+    "CREATE INDEX IF NOT EXISTS idx_sessions_noise ON sessions(is_noise) WHERE is_noise = 1",
+    # 10: chunk rows keep only their position; the text is cut again from messages and the
+    # vector lives only in the chunks index (it was stored twice before)
+    _slim_chunk_rows,
+]
 
 def init_db():
-    conn = get_db()
-    conn.executescript(SCHEMA)
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.executescript(SCHEMA)
+        migrate(conn, MIGRATIONS)
+        # vec0 tables only when sqlite-vec loads; otherwise the NumPy index
+        from .vector_index import init_index_schema
+        init_index_schema(conn)
+
+def _embedding_text(session: dict, messages: list) -> str:
+    # Build content from title + summary + first 2 messages
+    parts = [session.get("title", ""), session.get("summary", "")]
+    for m in messages[:2]:
+        parts.append(m.get("content", "")[:500])
+    return " ".join(p for p in parts if p)
+
+def session_hash(session: dict) -> str:
+    """Content hash of everything upsert writes for a session."""
+    payload = {k: session.get(k) for k in ("source_tool", "source_path", "project", "title",
+                                           "summary", "created_at", "tags", "messages")}
+    return hashlib.md5(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def _write_session(conn: sqlite3.Connection, session: dict, force: bool = False,
+                   encode: Callable[[str], object] = None, writer=None) -> Optional[int]:
+    """Write one session inside the caller's transaction.
+
+    Returns message rows written, or None when the stored content hash
+    already matches (or the session was pruned, unless ``force``, which
+    re-imports it and drops the tombstone) and nothing was rewritten. ``encode`` maps message text
+    to the stored value (see :func:`engram.storage.compression.encoder`).
+    With a :class:`~engram.storage.shards.ShardWriter`, messages go to the
+    shard it routes the session to.
+    """
+    sid = session["id"]
+    messages = session.get("messages", [])   # 修复: get 不 pop，不破坏调用方的 dict
+    session_data = {k: v for k, v in session.items() if k != "messages"}  # 安全副本
+    content_hash = session_hash(session)
+    row = conn.execute("SELECT content_hash, shard FROM sessions WHERE id = ?", (sid,)).fetchone()
+    if not force and row and row[0] == content_hash:
+        return None
+    if row is None and conn.execute("SELECT 1 FROM pruned_sessions WHERE id = ?", (sid,)).fetchone():
+        if not force:
+            return None
+        # sync --full 撤销 prune：重新导入并去掉 tombstone
+        conn.execute("DELETE FROM pruned_sessions WHERE id = ?", (sid,))
+    shard = writer.route(session) if writer is not None else None
+    # Upsert in place (not REPLACE): keeps the rowid that sessions_fts points at, and the
+    # FTS triggers only fire when title/summary actually change
+    is_noise, project_name = session_labels(session.get("title"), session.get("project"))
+    conn.execute("""
+        INSERT INTO sessions
+        (id, source_tool, source_path, project, title, summary, message_count, created_at, tags, content_hash, shard,
+         is_noise, project_name, project_path, started_at)
+        VALUES (:id, :source_tool, :source_path, :project, :title, :summary, :message_count, :created_at, :tags,
+                :content_hash, :shard, :is_noise, :project_name, :project_path,
+                COALESCE(:started_at, datetime('now')))
+        ON CONFLICT(id) DO UPDATE SET
+            source_tool = excluded.source_tool, source_path = excluded.source_path,
+            project = excluded.project, title = excluded.title, summary = excluded.summary,
+            message_count = excluded.message_count, created_at = excluded.created_at,
+            imported_at = excluded.imported_at, tags = excluded.tags, content_hash = excluded.content_hash,
+            shard = excluded.shard, is_noise = excluded.is_noise, project_name = excluded.project_name,
+            project_path = excluded.project_path,
+            started_at = COALESCE(:started_at, sessions.started_at)
+    """, {**session_data, "tags": json.dumps(session_data.get("tags", [])), "message_count": len(messages),
+          "content_hash": content_hash, "shard": shard, "is_noise": is_noise, "project_name": project_name,
+          "project_path": normalize_project(session.get("project")),
+          "started_at": normalize_time(session.get("created_at"))})
+
+    # Clean old messages and chunk vectors (message ids change); triggers update the FTS
+    from .chunks import delete_chunks
+    delete_chunks(conn, sid)
+    old_shard = row[1] if row else None
+    if old_shard is not None and old_shard != shard and writer is not None:
+        writer.conn(old_shard).execute("DELETE FROM messages WHERE session_id = ?", (sid,))
+    mconn = writer.conn(shard) if shard is not None else conn
+    mconn.execute("DELETE FROM messages WHERE session_id = ?", (sid,))
+    _insert_messages(mconn, sid, messages, encode)
+    return len(messages)
+
+def _insert_messages(conn: sqlite3.Connection, sid: str, messages: list, encode=None):
+    conn.executemany(
+        "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+        [(sid, m["role"], encode(m["content"]) if encode else m["content"], m.get("timestamp"))
+         for m in messages]
+    )
+
+def _append_session(conn: sqlite3.Connection, session: dict,
+                    encode: Callable[[str], object] = None, writer=None) -> Optional[int]:
+    """Append the new messages of a tailed log to an existing session.
+
+    Returns message rows written, or None if the session is not stored yet
+    (the caller then writes it in full). Messages go where the session's
+    earlier messages are.
+    """
+    sid = session["id"]
+    row = conn.execute("SELECT content_hash, shard, title, project, created_at FROM sessions WHERE id = ?",
+                       (sid,)).fetchone()
+    if row is None:
+        return None
+    messages = session.get("messages", [])
+    content_hash = hashlib.md5(f"{row[0]}:{session_hash(session)}".encode()).hexdigest()
+    is_noise, _ = session_labels(row[2] or session.get("title", ""), row[3])
+    started_at = normalize_time(row[4] or session.get("created_at"))
+    conn.execute("""
+        UPDATE sessions SET
+            message_count = message_count + :n,
+            title = COALESCE(NULLIF(title, ''), :title),
+            summary = COALESCE(NULLIF(summary, ''), :summary),
+            created_at = COALESCE(NULLIF(created_at, ''), :created_at),
+            content_hash = :content_hash,
+            is_noise = :is_noise,
+            started_at = COALESCE(:started_at, started_at)
+        WHERE id = :id
+    """, {"id": sid, "n": len(messages), "title": session.get("title", ""),
+          "summary": session.get("summary", ""), "created_at": session.get("created_at"),
+          "content_hash": content_hash, "is_noise": is_noise, "started_at": started_at})
+    _insert_messages(writer.conn(row[1]) if row[1] is not None else conn, sid, messages, encode)
+    return len(messages)
+
+def upsert_sessions(sessions: Iterable[dict], batch_size: int = 200, embed: bool = True,
+                    manifest=None, force: bool = False, embed_queue: "queue.Queue" = None) -> dict:
+    """Bulk-ingest sessions in batches of ``batch_size``, one short transaction each.
+
+    Each batch is pulled from ``sessions`` (parsing the sources) before its
+    transaction opens, so the write lock is never held during extractor I/O.
+    Written sessions are put on the ``pending_embeddings`` queue in the same
+    transaction (unless ``embed=False``); vectors are computed later by
+    :func:`engram.storage.embed_queue.drain`, so ingest never waits on the model.
+    Sessions whose content hash is unchanged are skipped unless ``force``.
+    Sessions flagged ``append`` (tailed logs) only add their new messages.
+    If a :class:`~engram.storage.sync_state.SyncManifest` is given, its
+    finished-source stamps are saved in the same transactions.
+    With ``embed_queue``, the number of sessions queued by each committed batch
+    is put on it to wake a concurrent embedding worker.
+    Returns ingest stats including ``queued`` and ``rows_per_sec``
+    (session + message rows).
+    """
+    from .compression import encoder
+    from .embed_queue import enqueue
+    from .shards import ShardWriter
+    start = time.perf_counter()
+    stats = {"sessions": 0, "messages": 0, "unchanged": 0, "queued": 0}
+    sessions = iter(sessions)
+    batch_size = max(batch_size, 1)
+    while True:
+        # 先在事务外取满一批：提取器读文件 / 解析时不占写锁，事务只包住写入
+        batch = list(islice(sessions, batch_size))
+        if not batch and manifest is None:
+            break
+        queued = 0
+        with transaction() as conn, ShardWriter() as writer:
+            encode = encoder(conn)
+            for session in batch:
+                appended = _append_session(conn, session, encode, writer) if session.get("append") else None
+                if appended is not None:
+                    written = appended
+                else:
+                    written = _write_session(conn, session, force=force, encode=encode, writer=writer)
+                    if written is None:
+                        stats["unchanged"] += 1
+                        continue
+                stats["messages"] += written
+                stats["sessions"] += 1
+                # Appends only need new chunks; the session vector comes from the cache
+                if embed:
+                    enqueue(conn, [session["id"]])
+                    queued += 1
+            # Sources finish (manifest.done) while the batch is pulled, so their
+            # sessions are all in this batch or an earlier one
+            if manifest is not None:
+                manifest.flush(conn)
+        stats["queued"] += queued
+        if embed_queue is not None and queued:
+            embed_queue.put(queued)
+        if len(batch) < batch_size:
+            break
+
+    stats["seconds"] = time.perf_counter() - start
+    rows = stats["sessions"] + stats["messages"]
+    stats["rows_per_sec"] = rows / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+def delete_sessions(session_ids: Iterable[str], batch_size: int = 200,
+                    on_progress: Callable[[int, int], None] = None) -> dict:
+    """Delete sessions and everything derived from them, one short transaction per batch.
+
+    Removes messages (from engram.db or their shard; the FTS triggers drop
+    the index rows), session and chunk vectors, embedding rows and queued
+    embeddings. Ids that were actually deleted go to ``pruned_sessions`` so a
+    later sync skips them (``sync --full`` brings them back).
+    ``on_progress(done, total)`` is called after every committed batch.
+    """
+    from .chunks import delete_chunks
+    from .vector_index import get_index
+    ids = list(dict.fromkeys(session_ids))
+    stats = {"sessions": 0, "messages": 0}
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        marks = ",".join("?" * len(batch))
+        with transaction() as conn, shards.ShardWriter(route=False) as writer:
+            for key, sids in shards.group_by_shard(conn, batch).items():
+                mconn = writer.conn(key) if key is not None else conn
+                stats["messages"] += mconn.execute(
+                    f"DELETE FROM messages WHERE session_id IN ({','.join('?' * len(sids))})", sids).rowcount
+            for sid in batch:
+                delete_chunks(conn, sid)
+            get_index("sessions").remove(conn, batch)
+            conn.execute(f"DELETE FROM embeddings WHERE session_id IN ({marks})", batch)
+            conn.execute(f"DELETE FROM pending_embeddings WHERE session_id IN ({marks})", batch)
+            # 只给真正存在的会话留 tombstone：传错的 id 不能挡住以后的导入
+            deleted = [r[0] for r in conn.execute(f"SELECT id FROM sessions WHERE id IN ({marks})", batch)]
+            conn.executemany("INSERT OR IGNORE INTO pruned_sessions (id) VALUES (?)", [(sid,) for sid in deleted])
+            stats["sessions"] += conn.execute(f"DELETE FROM sessions WHERE id IN ({marks})", batch).rowcount
+        if on_progress:
+            on_progress(min(i + batch_size, len(ids)), len(ids))
+    return stats
 
 def upsert_session(session: dict) -> str:
-    conn = get_db()
-    try:
-        sid = session["id"]
-        messages = session.get("messages", [])   # 修复: get 不 pop，不破坏调用方的 dict
-        session_data = {k: v for k, v in session.items() if k != "messages"}  # 安全副本
-        conn.execute("""
-            INSERT OR REPLACE INTO sessions 
-            (id, source_tool, source_path, project, title, summary, message_count, created_at, tags)
-            VALUES (:id, :source_tool, :source_path, :project, :title, :summary, :message_count, :created_at, :tags)
-        """, {**session_data, "tags": json.dumps(session_data.get("tags", [])), "message_count": len(messages)})
-        
-        # Clean old messages and FTS entries
-        conn.execute("DELETE FROM messages_fts WHERE session_id = ?", (sid,))
-        conn.execute("DELETE FROM messages WHERE session_id = ?", (sid,))
-        for msg in messages:
-            conn.execute(
-                "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-                (sid, msg["role"], msg["content"], msg.get("timestamp"))
-            )
-            conn.execute("INSERT INTO messages_fts (session_id, content) VALUES (?, ?)",
-                        (sid, msg["content"]))
-        
-        # Update sessions FTS
-        conn.execute("DELETE FROM sessions_fts WHERE id = ?", (sid,))
-        conn.execute("INSERT INTO sessions_fts (id, title, summary) VALUES (?, ?, ?)",
-                    (sid, session.get("title",""), session.get("summary","")))
-        conn.commit()
-        
-        # Add vector embedding (lazy - don't fail if model not available)
-        try:
-            from .vector import add_embedding
-            # Build content from title + summary + first 2 messages
-            parts = [session.get("title", ""), session.get("summary", "")]
-            for m in messages[:2]:
-                parts.append(m.get("content", "")[:500])
-            content = " ".join(p for p in parts if p)
-            if content.strip():
-                add_embedding(sid, content)
-        except Exception:
-            pass
-        
-        return sid
-    finally:
-        conn.close()
-
-def search_sessions(query: str, tool: str = None, limit: int = 10) -> list:
-    # Try vector search first for candidate session_ids
-    vector_ids = []
-    try:
-        from .vector import vector_search
-        vector_ids = vector_search(query, limit=limit)
-    except Exception:
-        pass
+    upsert_sessions([session])
+    return session["id"]
 
-    conn = get_db()
-    try:
-        # Escape double quotes in query for FTS5 MATCH safety
-        safe_query = query.replace('"', '""')
-        fts_query = f'"{safe_query}"'
-        params = [fts_query, fts_query, limit]
-        tool_filter = "AND s.source_tool = ?" if tool else ""
-        if tool:
-            params = [fts_query, fts_query, tool, limit]
-        
-        rows = conn.execute(f"""
-            SELECT DISTINCT s.*, snippet(messages_fts, 1, '[', ']', '...', 20) as snippet
-            FROM sessions s
-            JOIN messages_fts mf ON mf.session_id = s.id
-            WHERE (messages_fts MATCH ? OR s.id IN (
-                SELECT id FROM sessions_fts WHERE sessions_fts MATCH ?
-            ))
-            {tool_filter}
-            ORDER BY s.imported_at DESC
-            LIMIT ?
-        """, params).fetchall()
-        fts_results = [dict(r) for r in rows]
-    except:
-        q = f"%{query}%"
-        tool_clause = "AND s.source_tool = ?" if tool else ""
-        extra_params = [tool] if tool else []
-        rows = conn.execute(f"""
-            SELECT DISTINCT s.* FROM sessions s
-            JOIN messages m ON m.session_id = s.id
-            WHERE (m.content LIKE ? OR s.title LIKE ? OR s.summary LIKE ?)
-            {tool_clause}
-            ORDER BY s.imported_at DESC LIMIT ?
-        """, (q, q, q, *extra_params, limit)).fetchall()
-        fts_results = [dict(r) for r in rows]
-    finally:
-        conn.close()
-
-    # Merge vector results with FTS results (deduplicated)
-    seen = {r["id"] for r in fts_results}
-    if vector_ids:
-        conn = get_db()
-        try:
-            for vid in vector_ids:
-                if vid not in seen:
-                    row = conn.execute("SELECT * FROM sessions WHERE id = ?", (vid,)).fetchone()
-                    if row:
-                        r = dict(row)
-                        if not tool or r.get("source_tool") == tool:
-                            fts_results.append(r)
-                            seen.add(vid)
-        finally:
-            conn.close()
-
-    return fts_results[:limit]
-
-def list_sessions(tool: str = None, project: str = None, limit: int = 20) -> list:
-    conn = get_db()
-    try:
-        where = []
-        params = []
-        if tool:
-            where.append("source_tool = ?"); params.append(tool)
-        if project:
-            where.append("project LIKE ?"); params.append(f"%{project}%")
-        where_clause = "WHERE " + " AND ".join(where) if where else ""
-        params.append(limit)
+def search_sessions(query: str, tool: str = None, limit: int = 10, after=None,
+                    weights: dict = None, since: str = None, until: str = None,
+                    project: str = None, project_prefix: str = None) -> list:
+    """Hybrid (FTS + vector, reciprocal rank fusion) session search.
+
+    Rows carry ``fts_rank``, ``vec_distance`` and ``fused_score``; ``weights``
+    overrides the per-retriever RRF weights (``{"fts": .., "vec": ..}``) and
+    ``after`` is the previous page's :func:`engram.storage.search.cursor_of`.
+    ``since`` / ``until`` / ``project`` / ``project_prefix`` restrict the
+    sessions searched (see :func:`session_filter`).
+    """
+    from .search import hybrid_search
+    return hybrid_search(query, tool=tool, limit=limit, after=after, weights=weights,
+                         filters={"since": since, "until": until, "project": project,
+                                  "project_prefix": project_prefix})
+
+def list_sessions(tool: str = None, project: str = None, limit: int = 20, since: str = None,
+                  until: str = None, project_prefix: str = None, imported_since: str = None,
+                  skip_noise: bool = False) -> list:
+    """Sessions, most recently imported first.
+
+    ``tool`` / ``project`` / ``project_prefix`` / ``since`` / ``until`` are
+    the search filters (see :func:`session_filter`). ``imported_since`` keeps
+    sessions imported at or after that ``YYYY-MM-DD HH:MM:SS`` time;
+    ``skip_noise`` drops heartbeat/cron sessions and sessions without a real
+    project (see :func:`session_labels`).
+    """
+    where_clause, params = session_filter({"tool": tool, "project": project, "project_prefix": project_prefix,
+                                           "since": since, "until": until})
+    where = [where_clause]
+    if skip_noise:
+        # Spelled exactly as idx_sessions_listed's WHERE so the partial index applies
+        where.append("is_noise = 0 AND project_name IS NOT NULL")
+    if imported_since:
+        where.append("imported_at >= :imported_since"); params["imported_since"] = imported_since
+    with transaction() as conn:
         rows = conn.execute(f"""
-            SELECT id, source_tool, project, title, summary, message_count, created_at, imported_at
-            FROM sessions {where_clause}
-            ORDER BY imported_at DESC LIMIT ?
-        """, params).fetchall()
+            SELECT id, source_tool, project, project_name, title, summary, message_count, created_at, imported_at
+            FROM sessions s WHERE {" AND ".join(where)}
+            ORDER BY imported_at DESC LIMIT :limit
+        """, {**params, "limit": limit}).fetchall()
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
 
 def get_session(session_id: str) -> Optional[dict]:
-    conn = get_db()
-    try:
+    with transaction() as conn:
         row = conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
         if not row:
             return None
         session = dict(row)
-        msgs = conn.execute(
-            "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id",
+        mconn = conn if row["shard"] is None else shards.connect(row["shard"])
+        msgs = mconn.execute(
+            "SELECT role, engram_text(content) AS content, timestamp FROM messages"
+            " WHERE session_id = ? ORDER BY id",
             (session_id,)
         ).fetchall()
         session["messages"] = [dict(m) for m in msgs]
         return session
-    finally:
-        conn.close()
 
 def add_memory(content: str, source_tool: str = None, session_id: str = None, tags: list = None) -> int:
-    conn = get_db()
-    try:
+    with transaction() as conn:
         cursor = conn.execute(
             "INSERT INTO memories (content, source_tool, source_session_id, tags) VALUES (?, ?, ?, ?)",
             (content, source_tool, session_id, json.dumps(tags or []))
         )
-        mid = cursor.lastrowid
-        conn.execute("INSERT INTO memories_fts (id, content) VALUES (?, ?)", (str(mid), content))
-        conn.commit()
-        return mid
-    finally:
-        conn.close()
+        return cursor.lastrowid
 
 def search_memories(query: str, limit: int = 10) -> list:
-    conn = get_db()
-    try:
-        safe_query = query.replace('"', '""')
-        rows = conn.execute("""
-            SELECT m.* FROM memories m
-            JOIN memories_fts mf ON mf.id = CAST(m.id AS TEXT)
-            WHERE memories_fts MATCH ?
-            ORDER BY m.created_at DESC LIMIT ?
-        """, (f'"{safe_query}"', limit)).fetchall()
-        if not rows:
+    from .search import fts_query, plan_query
+    plan = plan_query(query)
+    with transaction() as conn:
+        rows = []
+        for index in plan:
+            table = "memories_tri" if index == "trigram" else "memories_fts"
+            try:
+                rows = conn.execute(f"""
+                    SELECT m.* FROM memories m
+                    JOIN {table} ON {table}.rowid = m.id
+                    WHERE {table} MATCH ?
+                    ORDER BY m.created_at DESC LIMIT ?
+                """, (fts_query(query), limit)).fetchall()
+            except sqlite3.Error:
+                continue
+            if rows or index == "trigram":
+                break
+        else:
+            # Terms too short for trigrams (or no trigram support): unindexed scan
             rows = conn.execute(
                 "SELECT * FROM memories WHERE content LIKE ? ORDER BY created_at DESC LIMIT ?",
                 (f"%{query}%", limit)
             ).fetchall()
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
 
 
 def get_sessions_since(since_iso: str) -> list:
     """获取某时间点之后导入的会话。"""
-    conn = get_db()
-    try:
+    with transaction() as conn:
         rows = conn.execute("""
             SELECT id, source_tool, project, title, summary, imported_at
             FROM sessions
@@ -283,5 +781,21 @@ def get_sessions_since(since_iso: str) -> list:
             ORDER BY imported_at DESC
         """, (since_iso,)).fetchall()
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
+
+
+def get_sessions_brief(session_ids: list) -> list:
+    """按 id 批量取会话元信息（不含消息）。"""
+    if not session_ids:
+        return []
+    from .retention import ID_SLICE
+    ids = list(dict.fromkeys(session_ids))
+    rows = []
+    with transaction() as conn:
+        # 分片查询：watch 一轮可能写入上千个会话，IN (...) 不能超过变量上限
+        for i in range(0, len(ids), ID_SLICE):
+            part = ids[i:i + ID_SLICE]
+            rows += conn.execute(f"""
+                SELECT id, source_tool, project, title, summary, imported_at
+                FROM sessions WHERE id IN ({",".join("?" * len(part))})
+            """, part).fetchall()
+    return [dict(r) for r in rows]
@@ -0,0 +1,128 @@
+"""Pending-embeddings queue: ingest records what needs a vector, a worker embeds it later.
+
+Sessions are queued in the same transaction that writes them, so sync never
+waits on the model and a session written without a model (fastembed missing,
+offline download) is still embedded by a later :func:`drain` / ``engram embed``.
+Re-queueing a session gives it a new queue id, so a vector computed from an
+older version never dequeues the newer one.
+"""
+import sqlite3
+import time
+from typing import Callable, Iterable, Optional
+
+# Sessions read and committed per round; the model still sees ``batch_size`` texts at a time
+ROUND_BATCHES = 8
+
+
+def enqueue(conn: sqlite3.Connection, session_ids: Iterable[str]):
+    """Queue sessions for (re-)embedding inside the caller's transaction."""
+    conn.executemany("INSERT OR REPLACE INTO pending_embeddings (session_id) VALUES (?)",
+                     [(sid,) for sid in session_ids])
+
+
+def pending_count() -> int:
+    from .db import transaction
+    with transaction() as conn:
+        return conn.execute("SELECT COUNT(*) FROM pending_embeddings").fetchone()[0]
+
+
+def requeue_all() -> int:
+    """Queue every stored session (``engram embed --rebuild``); returns the queue size.
+
+    Existing chunks are dropped so they are re-cut and re-embedded from scratch.
+    """
+    from .db import transaction
+    from .vector_index import get_index
+    with transaction() as conn:
+        get_index("chunks").clear(conn)
+        conn.execute("DELETE FROM embeddings WHERE source_type = 'chunk'")
+        conn.execute("INSERT OR REPLACE INTO pending_embeddings (session_id) SELECT id FROM sessions")
+        return conn.execute("SELECT COUNT(*) FROM pending_embeddings").fetchone()[0]
+
+
+def _texts(conn: sqlite3.Connection, session_ids: list[str]) -> dict[str, str]:
+    from .db import _embedding_text
+    from .shards import connect, group_by_shard
+    marks = ",".join("?" * len(session_ids))
+    sessions = {r["id"]: dict(r) for r in conn.execute(
+        f"SELECT id, title, summary FROM sessions WHERE id IN ({marks})", session_ids)}
+    first_msgs: dict[str, list] = {}
+    for key, ids in group_by_shard(conn, session_ids).items():
+        mconn = conn if key is None else connect(key)
+        for r in mconn.execute(f"""
+            SELECT session_id, content FROM (
+                SELECT session_id, engram_text(content) AS content,
+                       ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id) AS n
+                FROM messages WHERE session_id IN ({",".join("?" * len(ids))})
+            ) WHERE n <= 2 ORDER BY session_id, n
+        """, ids):
+            first_msgs.setdefault(r["session_id"], []).append({"content": r["content"]})
+    return {sid: _embedding_text(s, first_msgs.get(sid, [])) for sid, s in sessions.items()}
+
+
+def drain(batch_size: Optional[int] = None, threads: Optional[int] = None, limit: Optional[int] = None,
+          on_progress: Callable[[int, int], None] = None) -> dict:
+    """Embed queued sessions in batches until the queue is empty (or ``limit`` reached).
+
+    ``on_progress(done, total)`` is called after every committed round. If
+    the model can't be loaded or fails, draining stops, the remaining queue is
+    kept and the reason is returned under ``error``.
+    Each session gets its session-level vector and its new message chunks
+    (see :mod:`engram.storage.chunks`).
+    Returns ``embedded`` (sessions), ``chunks``, ``skipped`` (deleted or empty
+    sessions), ``seconds``, ``per_sec`` and ``remaining``.
+    """
+    from .db import transaction
+    from .vector import embed_texts, store_embeddings
+    from .chunks import plan_chunks, store_chunks
+    from .embedders import embedding_config
+
+    batch_size = batch_size or embedding_config()["batch_size"]
+    start = time.perf_counter()
+    stats = {"embedded": 0, "chunks": 0, "skipped": 0, "error": None}
+    total = pending_count()
+    if limit is not None:
+        total = min(total, limit)
+    done = 0
+    while done < total:
+        with transaction() as conn:
+            rows = conn.execute("SELECT id, session_id FROM pending_embeddings ORDER BY id LIMIT ?",
+                                (min(batch_size * ROUND_BATCHES, total - done),)).fetchall()
+            if not rows:
+                break
+            texts = _texts(conn, [r["session_id"] for r in rows])
+            plans = {sid: plan_chunks(conn, sid) for sid in texts}
+        items = [(sid, text) for sid, text in texts.items() if text.strip()]
+        chunk_texts = [c["chunk"] for _, chunks in plans.values() for c in chunks]
+        # The model runs outside any transaction so ingest can keep writing
+        try:
+            blobs = embed_texts([t for _, t in items] + chunk_texts, batch_size=batch_size, threads=threads)
+        except Exception as e:
+            stats["error"] = f"{type(e).__name__}: {e}"
+            break
+        session_blobs = dict(zip((sid for sid, _ in items), blobs))
+        chunk_blobs = iter(blobs[len(items):])
+        with transaction() as conn:
+            # A session re-queued meanwhile was rewritten: its new queue entry redoes it
+            marks = ",".join("?" * len(rows))
+            live = {r[0] for r in conn.execute(f"SELECT session_id FROM pending_embeddings WHERE id IN ({marks})",
+                                               [r["id"] for r in rows])}
+            for sid, (from_id, chunks) in plans.items():
+                mine = [next(chunk_blobs) for _ in chunks]
+                if sid not in live:
+                    continue
+                if sid in session_blobs:
+                    store_embeddings(conn, [(sid, session_blobs[sid])])
+                    stats["embedded"] += 1
+                store_chunks(conn, sid, from_id, chunks, mine)
+                stats["chunks"] += len(chunks)
+            conn.executemany("DELETE FROM pending_embeddings WHERE id = ?", [(r["id"],) for r in rows])
+        stats["skipped"] += len(rows) - len(session_blobs)
+        done += len(rows)
+        if on_progress:
+            on_progress(done, total)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["per_sec"] = stats["embedded"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    stats["remaining"] = pending_count()
+    return stats
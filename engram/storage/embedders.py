@@ -0,0 +1,150 @@
+"""Embedding backends.
+
+Selected in config.json::
+
+    "embedding_backend": "fastembed" | "hashing",
+    "embedding_model": "BAAI/bge-small-en-v1.5",   # fastembed only
+    "embedding_dim": 384,
+    "embedding_threads": 4,                        # ONNX intra-op threads
+    "embedding_batch_size": 32
+
+``hashing`` needs no model download: character n-grams are hashed into a
+fixed number of signed buckets (the "hashing trick") and L2-normalised, so
+air-gapped machines and CI still get (lexical-ish) semantic search.
+Each backend has a ``model_id`` that keys the embedding cache and tells
+``init_db`` when stored vectors must be rebuilt.
+"""
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+DEFAULT_BACKEND = "fastembed"
+DEFAULT_MODEL = "BAAI/bge-small-en-v1.5"
+DEFAULT_DIM = 384
+DEFAULT_BATCH_SIZE = 32
+# Dimensions of common fastembed models, so the schema can be created without importing fastembed
+KNOWN_DIMS = {
+    "BAAI/bge-small-en-v1.5": 384,
+    "BAAI/bge-base-en-v1.5": 768,
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "intfloat/multilingual-e5-small": 384,
+}
+
+
+class Embedder(ABC):
+    name = ""
+    dim = DEFAULT_DIM
+
+    @property
+    @abstractmethod
+    def model_id(self) -> str:
+        pass
+
+    @abstractmethod
+    def embed(self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterable:
+        """Yield one float vector per text."""
+        pass
+
+
+class FastEmbedEmbedder(Embedder):
+    name = "fastembed"
+
+    def __init__(self, model: str = DEFAULT_MODEL, dim: Optional[int] = None, threads: Optional[int] = None):
+        self.model = model
+        self.threads = threads
+        self.dim = dim or _fastembed_dim(model)
+        self._model = None
+
+    @property
+    def model_id(self) -> str:
+        return self.model  # plain model name, as stored before backends existed
+
+    def _load(self):
+        if self._model is None:
+            from fastembed import TextEmbedding
+            self._model = TextEmbedding(self.model, threads=self.threads)
+        return self._model
+
+    def embed(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        return self._load().embed(texts, batch_size=batch_size)
+
+
+def _fastembed_dim(model: str) -> int:
+    if model in KNOWN_DIMS:
+        return KNOWN_DIMS[model]
+    try:
+        from fastembed import TextEmbedding
+        for info in TextEmbedding.list_supported_models():
+            if info.get("model") == model:
+                return int(info["dim"])
+    except Exception:
+        pass
+    return DEFAULT_DIM
+
+
+class HashingEmbedder(Embedder):
+    """Deterministic character n-gram feature hashing, vectorised with NumPy."""
+    name = "hashing"
+
+    def __init__(self, dim: int = DEFAULT_DIM, ngrams: tuple = (3, 5), **_):
+        self.dim = dim
+        self.ngrams = ngrams
+
+    @property
+    def model_id(self) -> str:
+        return f"hashing:{self.dim}:{self.ngrams[0]}-{self.ngrams[1]}"
+
+    def _vector(self, text: str):
+        import numpy as np
+        codes = np.frombuffer(f" {' '.join(text.lower().split())} ".encode("utf-32-le"), dtype=np.uint32)
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for n in range(self.ngrams[0], self.ngrams[1] + 1):
+            if len(codes) < n:
+                break
+            # Polynomial hash of every n-gram at once (uint64 wraps deterministically)
+            h = np.full(len(codes) - n + 1, n, dtype=np.uint64)
+            for j in range(n):
+                h = h * np.uint64(1_000_003) + codes[j:len(codes) - n + 1 + j].astype(np.uint64)
+            h ^= h >> np.uint64(29)
+            sign = np.where(h & np.uint64(1 << 40), 1.0, -1.0).astype(np.float32)
+            vec += np.bincount((h % np.uint64(self.dim)).astype(np.int64), weights=sign,
+                               minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def embed(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        for text in texts:
+            yield self._vector(text)
+
+
+BACKENDS = {
+    "fastembed": FastEmbedEmbedder,
+    "hashing": HashingEmbedder,
+}
+
+_embedder: Optional[Embedder] = None
+
+
+def embedding_config() -> dict:
+    from ..config import get_config
+    cfg = get_config()
+    return {
+        "backend": cfg.get("embedding_backend", DEFAULT_BACKEND),
+        "model": cfg.get("embedding_model", DEFAULT_MODEL),
+        "dim": cfg.get("embedding_dim"),
+        "threads": cfg.get("embedding_threads"),
+        "batch_size": cfg.get("embedding_batch_size", DEFAULT_BATCH_SIZE),
+    }
+
+
+def get_embedder(threads: Optional[int] = None) -> Embedder:
+    """The configured backend, created once per process (``threads`` overrides the config)."""
+    global _embedder
+    if _embedder is None:
+        cfg = embedding_config()
+        if cfg["backend"] not in BACKENDS:
+            raise ValueError(f"unknown embedding_backend {cfg['backend']!r}, expected one of {sorted(BACKENDS)}")
+        if cfg["backend"] == "fastembed":
+            _embedder = FastEmbedEmbedder(cfg["model"], dim=cfg["dim"], threads=threads or cfg["threads"])
+        else:
+            _embedder = BACKENDS[cfg["backend"]](dim=cfg["dim"] or DEFAULT_DIM)
+    return _embedder
@@ -0,0 +1,162 @@
+"""Database maintenance behind ``engram optimize``.
+
+Re-syncing rewrites sessions in place, so over time the FTS5 indexes pile up
+small segments, the WAL grows between checkpoints and deleted pages sit on
+the freelist. :func:`optimize` runs, on engram.db, every message shard and
+memory.db:
+
+1. FTS5 ``optimize`` (or a bounded ``merge`` in the light mode) on every
+   full-text table, word and trigram;
+2. ``ANALYZE`` + ``PRAGMA optimize`` to refresh planner statistics;
+3. ``PRAGMA incremental_vacuum`` to hand free pages back to the filesystem.
+   Databases created before ``auto_vacuum=INCREMENTAL`` was set are converted
+   by one full ``VACUUM`` the first time ``engram optimize`` runs;
+4. ``PRAGMA wal_checkpoint(TRUNCATE)``.
+
+After ``sync`` the light mode runs by itself when :func:`due` finds a reason
+(``"auto_optimize": false`` in config.json turns that off).
+"""
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+FTS_TABLES = ("sessions_fts", "sessions_tri", "messages_fts", "messages_tri",
+              "memories_fts", "memories_tri", "facts_fts", "facts_tri")
+# External-content tables keyed by the implicit rowid of sessions / facts;
+# VACUUM may renumber those rowids, so they are rebuilt after one
+ROWID_FTS_TABLES = ("sessions_fts", "sessions_tri", "facts_fts", "facts_tri")
+
+# Pages merged per FTS table in the light (automatic) mode
+MERGE_PAGES = 500
+# Thresholds for the automatic run after sync
+AUTO_WAL_BYTES = 64 * 1024 * 1024
+AUTO_FREE_RATIO = 0.2
+AUTO_SESSIONS = 2000
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _databases() -> list[tuple[str, Path, sqlite3.Connection]]:
+    """``(name, path, connection)`` for engram.db, every shard and memory.db."""
+    from . import shards
+    from .db import DB_PATH, get_db
+    from .memory_db import MEMORY_DB, get_mem_db
+    dbs = [("engram.db", DB_PATH, get_db())]
+    dbs += [(shards.shard_path(k).name, shards.shard_path(k), shards.connect(k, write=True))
+            for k in shards.shard_keys()]
+    dbs.append(("memory.db", MEMORY_DB, get_mem_db()))
+    return dbs
+
+
+def _size(path: Path) -> tuple[int, int]:
+    """(database file, WAL file) sizes in bytes."""
+    wal = path.with_name(path.name + "-wal")
+    return (path.stat().st_size if path.exists() else 0,
+            wal.stat().st_size if wal.exists() else 0)
+
+
+def _pragma(conn: sqlite3.Connection, name: str) -> int:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _fts_tables(conn: sqlite3.Connection) -> list[str]:
+    present = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [t for t in FTS_TABLES if t in present]
+
+
+def optimize_db(conn: sqlite3.Connection, path: Path, full: bool = True) -> dict:
+    """Run the maintenance steps on one database; returns sizes and per-step timings.
+
+    ``full=False`` is the light mode used after sync: a bounded FTS merge,
+    ``PRAGMA optimize`` without a full ``ANALYZE``, and never a full ``VACUUM``.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    size_before, wal_before = _size(path)
+    free_before = _pragma(conn, "freelist_count")
+    timings = {}
+
+    def timed(step, fn):
+        start = time.perf_counter()
+        fn()
+        if conn.in_transaction:
+            conn.commit()
+        timings[step] = timings.get(step, 0.0) + time.perf_counter() - start
+
+    tables = _fts_tables(conn)
+    for table in tables:
+        if full:
+            timed("fts", lambda: conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')"))
+        else:
+            timed("fts", lambda: conn.execute(f"INSERT INTO {table} ({table}, rank) VALUES ('merge', ?)",
+                                              (MERGE_PAGES,)))
+
+    timed("analyze", lambda: (conn.execute("ANALYZE") if full else None, conn.execute("PRAGMA optimize")))
+
+    vacuumed = False
+    if _pragma(conn, "auto_vacuum") == AUTO_VACUUM_INCREMENTAL:
+        # executescript steps the pragma to completion; execute() frees a single page
+        timed("vacuum", lambda: conn.executescript("PRAGMA incremental_vacuum"))
+    elif full:
+        def convert():
+            conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+            for table in ROWID_FTS_TABLES:
+                if table in tables:
+                    conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+        timed("vacuum", convert)
+        vacuumed = True
+
+    if _pragma(conn, "journal_mode") == "wal":
+        timed("checkpoint", lambda: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall())
+
+    size_after, wal_after = _size(path)
+    return {
+        "size_before": size_before, "wal_before": wal_before,
+        "size_after": size_after, "wal_after": wal_after,
+        "free_pages_before": free_before, "free_pages_after": _pragma(conn, "freelist_count"),
+        "fts_tables": len(tables), "vacuumed": vacuumed,
+        "timings": timings, "seconds": sum(timings.values()),
+    }
+
+
+def optimize(full: bool = True) -> list[dict]:
+    """Optimize engram.db, every shard and memory.db; one report per database."""
+    from .db import transaction
+    reports = []
+    for name, path, conn in _databases():
+        reports.append({"db": name, **optimize_db(conn, path, full=full)})
+    with transaction() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS engram_meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT OR REPLACE INTO engram_meta (key, value) VALUES ('optimized_at', datetime('now'))")
+    return reports
+
+
+def due() -> Optional[str]:
+    """Why an automatic optimize should run now, or None.
+
+    Cheap checks only: a WAL over ``AUTO_WAL_BYTES``, more than
+    ``AUTO_FREE_RATIO`` of a database on the freelist, or ``AUTO_SESSIONS``
+    sessions (re)written since the last optimize.
+    """
+    from ..config import get_config
+    cfg = get_config()
+    if not cfg.get("auto_optimize", True):
+        return None
+    for name, path, conn in _databases():
+        wal = _size(path)[1]
+        if wal > cfg.get("auto_optimize_wal_bytes", AUTO_WAL_BYTES):
+            return f"{name} WAL {wal / 1024 / 1024:.0f} MB"
+        pages = _pragma(conn, "page_count")
+        if pages and _pragma(conn, "freelist_count") / pages > cfg.get("auto_optimize_free_ratio", AUTO_FREE_RATIO):
+            return f"{name} free pages > {cfg.get('auto_optimize_free_ratio', AUTO_FREE_RATIO):.0%}"
+    from .db import get_db
+    conn = get_db()
+    has_meta = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'engram_meta'").fetchone()
+    row = conn.execute("SELECT value FROM engram_meta WHERE key = 'optimized_at'").fetchone() if has_meta else None
+    written = conn.execute("SELECT COUNT(*) FROM sessions WHERE imported_at > ?",
+                           (row[0] if row else "",)).fetchone()[0]
+    if written >= cfg.get("auto_optimize_sessions", AUTO_SESSIONS):
+        return f"{written} sessions written since last optimize"
+    return None
@@ -3,6 +3,10 @@ import sqlite3, json, hashlib
 from pathlib import Path
 from datetime import datetime
 
+from .connection import ConnectionManager
+from .migrations import migrate, only_if
+from .search import fts_query, plan_query, trigram_supported
+
 MEMORY_DB = Path.home() / ".engram" / "memory.db"
 
 SCHEMA = """
@@ -18,27 +22,66 @@ CREATE TABLE IF NOT EXISTS facts (
     use_count   INTEGER DEFAULT 0
 );
 
-CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(
-    id UNINDEXED,
-    scope UNINDEXED,
-    content
-);
+-- facts_fts: 外部内容 FTS5，由迁移 2 创建并用触发器同步
 """
 
+# 只追加、不修改已发布的步骤，见 engram.storage.migrations
+MIGRATIONS = [
+    # 1: list_facts / _enforce_limit 按 scope + pinned 过滤、按 priority/use_count 排序
+    "CREATE INDEX IF NOT EXISTS idx_facts_scope ON facts(scope, pinned, priority, use_count)",
+    # 2: facts_fts 改为外部内容表（不再存第二份正文），由触发器维护，按 rowid 关联 facts。
+    #    facts 没有 INTEGER PRIMARY KEY，完整 VACUUM 之后需要 rebuild
+    """
+    DROP TABLE IF EXISTS facts_fts;
+    CREATE VIRTUAL TABLE facts_fts USING fts5(content, content='facts');
+    CREATE TRIGGER facts_fts_ai AFTER INSERT ON facts BEGIN
+        INSERT INTO facts_fts (rowid, content) VALUES (new.rowid, new.content);
+    END;
+    CREATE TRIGGER facts_fts_ad AFTER DELETE ON facts BEGIN
+        INSERT INTO facts_fts (facts_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END;
+    CREATE TRIGGER facts_fts_au AFTER UPDATE OF content ON facts BEGIN
+        INSERT INTO facts_fts (facts_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO facts_fts (rowid, content) VALUES (new.rowid, new.content);
+    END;
+    INSERT INTO facts_fts (facts_fts) VALUES ('rebuild');
+    """,
+    # 3: trigram 索引，中文和子串查询不再退化成 LIKE 全表扫描（见 search.plan_query）
+    only_if(trigram_supported, """
+    CREATE VIRTUAL TABLE IF NOT EXISTS facts_tri USING fts5(content, content='facts', tokenize='trigram');
+    CREATE TRIGGER IF NOT EXISTS facts_tri_ai AFTER INSERT ON facts BEGIN
+        INSERT INTO facts_tri (rowid, content) VALUES (new.rowid, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS facts_tri_ad AFTER DELETE ON facts BEGIN
+        INSERT INTO facts_tri (facts_tri, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS facts_tri_au AFTER UPDATE OF content ON facts BEGIN
+        INSERT INTO facts_tri (facts_tri, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO facts_tri (rowid, content) VALUES (new.rowid, new.content);
+    END;
+    INSERT INTO facts_tri (facts_tri) VALUES ('rebuild');
+    """),
+]
+
 SCOPE_LIMITS = {"global": 50, "project": 30}
 
-_schema_initialized = False
+def _init_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+    migrate(conn, MIGRATIONS)
+
+_manager = ConnectionManager(lambda: MEMORY_DB, on_open=_init_schema)
 
-def get_mem_db():
-    global _schema_initialized
-    MEMORY_DB.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(MEMORY_DB), timeout=10)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    if not _schema_initialized:
-        conn.executescript(SCHEMA)
-        _schema_initialized = True
-    return conn
+def get_mem_db() -> sqlite3.Connection:
+    """返回当前线程共享的 memory.db 连接（不要 close）。"""
+    return _manager.get()
+
+def transaction():
+    """共享连接上的事务上下文：成功提交，异常回滚。"""
+    return _manager.transaction()
+
+def close_mem_db():
+    """关闭本进程持有的所有 memory.db 连接（替换文件前必须调用）。"""
+    _manager.close_all()
 
 def _make_id(scope: str, content: str) -> str:
     return hashlib.md5(f"{scope}:{content[:100]}".encode()).hexdigest()[:12]
@@ -47,20 +90,18 @@ def add_fact(scope: str, content: str, source: str = "manual", priority: int = 3
     if not content or not content.strip():
         raise ValueError("content 不能为空")
     content = content.strip()
-    conn = get_mem_db()
     fid = _make_id(scope, content)
-    try:
+    with transaction() as conn:
+        # 原地 upsert（不用 REPLACE）：rowid 不变，facts_fts 由触发器同步
         conn.execute("""
-            INSERT OR REPLACE INTO facts (id, scope, content, source, priority, pinned)
+            INSERT INTO facts (id, scope, content, source, priority, pinned)
             VALUES (?,?,?,?,?,?)
+            ON CONFLICT(id) DO UPDATE SET
+                scope=excluded.scope, content=excluded.content, source=excluded.source,
+                priority=excluded.priority, pinned=excluded.pinned
         """, (fid, scope, content, source, priority, int(pinned)))
-        conn.execute("DELETE FROM facts_fts WHERE id=?", (fid,))
-        conn.execute("INSERT INTO facts_fts (id, scope, content) VALUES (?,?,?)", (fid, scope, content))
-        conn.commit()
         _enforce_limit(conn, scope)
         return fid
-    finally:
-        conn.close()
 
 def _enforce_limit(conn, scope: str):
     scope_type = "project" if scope.startswith("project:") else "global"
@@ -68,7 +109,7 @@ def _enforce_limit(conn, scope: str):
     count = conn.execute("SELECT COUNT(*) FROM facts WHERE scope=? AND pinned=0", (scope,)).fetchone()[0]
     if count > limit:
         to_delete = count - limit
-        # 先找到要删除的 id，同时清理 FTS
+        # 先找到要删除的 id（FTS 由触发器清理）
         ids_to_del = [r[0] for r in conn.execute("""
             SELECT id FROM facts
             WHERE scope=? AND pinned=0
@@ -77,26 +118,31 @@ def _enforce_limit(conn, scope: str):
         """, (scope, to_delete)).fetchall()]
         if ids_to_del:
             placeholders = ",".join("?" * len(ids_to_del))
-            conn.execute(f"DELETE FROM facts_fts WHERE id IN ({placeholders})", ids_to_del)
             conn.execute(f"DELETE FROM facts WHERE id IN ({placeholders})", ids_to_del)
-            conn.commit()
 
 def search_facts(query: str, scope: str = None, limit: int = 10) -> list:
-    conn = get_mem_db()
-    try:
+    plan = plan_query(query)
+    with transaction() as conn:
         scope_filter = "AND f.scope = ?" if scope else ""
         params_base = [scope] if scope else []
-        safe_query = query.replace('"', '""')
-        try:
-            rows = conn.execute(f"""
-                SELECT f.* FROM facts f
-                JOIN facts_fts ff ON ff.id = f.id
-                WHERE facts_fts MATCH ?
-                {scope_filter}
-                ORDER BY f.priority DESC, f.use_count DESC
-                LIMIT ?
-            """, [f'"{safe_query}"'] + params_base + [limit]).fetchall()
-        except:
+        rows = []
+        for index in plan:
+            table = "facts_tri" if index == "trigram" else "facts_fts"
+            try:
+                rows = conn.execute(f"""
+                    SELECT f.* FROM facts f
+                    JOIN {table} ON {table}.rowid = f.rowid
+                    WHERE {table} MATCH ?
+                    {scope_filter}
+                    ORDER BY f.priority DESC, f.use_count DESC
+                    LIMIT ?
+                """, [fts_query(query)] + params_base + [limit]).fetchall()
+            except sqlite3.Error:
+                continue
+            if rows or index == "trigram":
+                break
+        else:
+            # 词太短用不了 trigram（或 SQLite 不支持）：退回 LIKE 扫描
             scope_clause = "WHERE scope = ? AND" if scope else "WHERE"
             rows = conn.execute(f"""
                 SELECT * FROM facts
@@ -105,14 +151,10 @@ def search_facts(query: str, scope: str = None, limit: int = 10) -> list:
             """, params_base + [f"%{query}%", limit]).fetchall()
         for r in rows:
             conn.execute("UPDATE facts SET use_count=use_count+1, last_used=datetime('now') WHERE id=?", (r["id"],))
-        conn.commit()
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
 
 def list_facts(scope: str = None, pinned_only: bool = False, limit: int = 200) -> list:
-    conn = get_mem_db()
-    try:
+    with transaction() as conn:
         where_parts = []
         params = []
         if scope:
@@ -127,23 +169,13 @@ def list_facts(scope: str = None, pinned_only: bool = False, limit: int = 200) -
             LIMIT ?
         """, params).fetchall()
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
 
 def get_all_scopes() -> list:
-    conn = get_mem_db()
-    try:
+    with transaction() as conn:
         rows = conn.execute("SELECT DISTINCT scope FROM facts ORDER BY scope").fetchall()
         return [r[0] for r in rows]
-    finally:
-        conn.close()
 
 def delete_fact(fid: str) -> bool:
-    conn = get_mem_db()
-    try:
+    with transaction() as conn:
         cursor = conn.execute("DELETE FROM facts WHERE id=?", (fid,))
-        conn.execute("DELETE FROM facts_fts WHERE id=?", (fid,))
-        conn.commit()
         return cursor.rowcount > 0
-    finally:
-        conn.close()
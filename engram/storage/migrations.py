@@ -0,0 +1,84 @@
+"""Versioned schema migrations tracked in ``PRAGMA user_version``.
+
+Each database keeps an ordered list of steps; step ``i`` (1-based) upgrades
+a database at version ``i - 1``. Steps run in place, each in its own
+transaction together with the version bump, so an interrupted upgrade
+resumes where it stopped. Steps are SQL strings (one or more statements)
+or callables taking the connection. Never edit a released step — append a
+new one.
+"""
+import sqlite3
+from typing import Callable, Union
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def add_column(table: str, column: str, decl: str) -> Callable[[sqlite3.Connection], None]:
+    """Step adding a column unless it exists (tables created by a newer SCHEMA already have it)."""
+    def step(conn: sqlite3.Connection):
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return step
+
+
+def steps(*items: Step) -> Callable[[sqlite3.Connection], None]:
+    """Group several steps into one migration."""
+    def step(conn: sqlite3.Connection):
+        for item in items:
+            _run(conn, item)
+    return step
+
+
+def only_if(predicate: Callable[[sqlite3.Connection], bool], step: Step) -> Callable[[sqlite3.Connection], None]:
+    """Step that runs only when ``predicate(conn)`` holds (e.g. an optional SQLite feature)."""
+    def guarded(conn: sqlite3.Connection):
+        if predicate(conn):
+            _run(conn, step)
+    return guarded
+
+
+def _run(conn: sqlite3.Connection, step: Step):
+    if callable(step):
+        step(conn)
+        return
+    for statement in _statements(step):
+        conn.execute(statement)
+
+
+def _statements(sql: str):
+    """Split a script into statements (semicolons inside trigger bodies stay put)."""
+    buf = ""
+    for part in sql.split(";"):
+        buf += part + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \n;"):
+                yield buf
+            buf = ""
+    if buf.strip(" \n;"):
+        yield buf
+
+
+def migrate(conn: sqlite3.Connection, migrations: list[Step]) -> int:
+    """Apply the migrations newer than the database's ``user_version``; returns the new version."""
+    version = user_version(conn)
+    for target in range(version + 1, len(migrations) + 1):
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if user_version(conn) >= target:
+                conn.rollback()
+                continue
+            _run(conn, migrations[target - 1])
+            conn.execute(f"PRAGMA user_version = {target}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return user_version(conn)
@@ -0,0 +1,139 @@
+"""Retention rules behind ``engram prune``.
+
+Rules live under ``"retention"`` in config.json (``engram prune`` options
+override them); nothing is deleted unless at least one is set::
+
+    "retention": {
+        "max_age_days": 365,                 # started (created_at, else imported_at) longer ago
+        "max_per_tool": {"openclaw": 2000},  # keep the newest N per tool; an int applies to every tool
+        "noise": true,                       # heartbeat / cron / system sessions
+        "missing_source": true               # source_path no longer exists on this machine
+    }
+
+Matching sessions are removed by :func:`engram.storage.db.delete_sessions`
+in short batches, so sync and search are never blocked for long. A plain
+sync does not re-import them; ``engram sync --full`` does, as long as the
+source files are still there.
+"""
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+RULES = ("max_age_days", "max_per_tool", "noise", "missing_source")
+# IN (...) lists are read in slices of this many ids
+ID_SLICE = 500
+
+
+def rules_from_config() -> dict:
+    from ..config import get_config
+    rules = get_config().get("retention") or {}
+    return {k: v for k, v in rules.items() if k in RULES and v not in (None, False, 0, {})}
+
+
+def _noise_ids(conn: sqlite3.Connection) -> list[str]:
+    """Sessions whose title matches ``NOISE_PATTERNS``.
+
+    A strict subset of ``is_noise`` (see :func:`engram.storage.db.session_labels`):
+    that flag also marks titles shorter than 10 characters, which hides them
+    from context lists but is too weak a reason to delete a real session.
+    The indexed flag narrows the candidates; the patterns decide.
+    """
+    from ..extractor_facts import NOISE_PATTERNS
+    patterns = [re.compile(p, re.IGNORECASE) for p in NOISE_PATTERNS]
+    return [r[0] for r in conn.execute("SELECT id, title FROM sessions WHERE is_noise = 1 AND title != ''")
+            if any(p.search(r[1].strip()) for p in patterns)]
+
+
+def _missing_source_ids(conn: sqlite3.Connection) -> list[str]:
+    paths = [r[0] for r in conn.execute(
+        "SELECT DISTINCT source_path FROM sessions WHERE source_path IS NOT NULL AND source_path != ''")]
+    missing = [p for p in paths if not os.path.exists(p)]
+    ids = []
+    for i in range(0, len(missing), ID_SLICE):
+        part = missing[i:i + ID_SLICE]
+        ids += [r[0] for r in conn.execute(
+            f"SELECT id FROM sessions WHERE source_path IN ({','.join('?' * len(part))})", part)]
+    return ids
+
+
+def _over_cap_ids(conn: sqlite3.Connection, caps) -> list[str]:
+    ranked = """
+        SELECT id, source_tool, ROW_NUMBER() OVER (PARTITION BY source_tool ORDER BY started_at DESC) AS n
+        FROM sessions
+    """
+    if isinstance(caps, int):
+        return [r[0] for r in conn.execute(f"SELECT id FROM ({ranked}) WHERE n > ?", (caps,))]
+    ids = []
+    for tool, cap in caps.items():
+        ids += [r[0] for r in conn.execute(f"SELECT id FROM ({ranked}) WHERE source_tool = ? AND n > ?",
+                                           (tool, int(cap)))]
+    return ids
+
+
+def candidates(conn: sqlite3.Connection, rules: dict) -> dict[str, list[str]]:
+    """Session ids matched by each rule; a session is listed under the first rule it matches."""
+    found: dict[str, list[str]] = {}
+    if rules.get("max_age_days"):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=int(rules["max_age_days"]))).strftime("%Y-%m-%d")
+        found["max_age_days"] = [r[0] for r in conn.execute("SELECT id FROM sessions WHERE started_at < ?", (cutoff,))]
+    if rules.get("max_per_tool"):
+        found["max_per_tool"] = _over_cap_ids(conn, rules["max_per_tool"])
+    if rules.get("noise"):
+        found["noise"] = _noise_ids(conn)
+    if rules.get("missing_source"):
+        found["missing_source"] = _missing_source_ids(conn)
+    seen = set()
+    for rule, ids in found.items():
+        found[rule] = [sid for sid in ids if not (sid in seen or seen.add(sid))]
+    return found
+
+
+def estimate(conn: sqlite3.Connection, session_ids: list[str]) -> dict:
+    """Messages and stored bytes (message bodies, titles/summaries, vectors) of the sessions."""
+    from .embedders import get_embedder
+    from .shards import connect, group_by_shard
+    vector_bytes = 4 * get_embedder().dim
+    messages = size = 0
+    for i in range(0, len(session_ids), ID_SLICE):
+        part = session_ids[i:i + ID_SLICE]
+        marks = ",".join("?" * len(part))
+        size += conn.execute(f"""
+            SELECT COALESCE(SUM(length(CAST(title AS BLOB)) + length(CAST(summary AS BLOB))), 0)
+            FROM sessions WHERE id IN ({marks})
+        """, part).fetchone()[0]
+        # One session vector plus one per chunk, held by the vector index
+        chunks = conn.execute(f"SELECT COUNT(*) FROM embeddings WHERE session_id IN ({marks})", part).fetchone()[0]
+        size += (len(part) + chunks) * vector_bytes
+        for key, sids in group_by_shard(conn, part).items():
+            mconn = connect(key) if key is not None else conn
+            n, b = mconn.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM(length(CAST(content AS BLOB))), 0)
+                FROM messages WHERE session_id IN ({','.join('?' * len(sids))})
+            """, sids).fetchone()
+            messages += n
+            size += b
+    return {"sessions": len(session_ids), "messages": messages, "bytes": size}
+
+
+def prune(rules: Optional[dict] = None, dry_run: bool = False, batch_size: int = 200,
+          on_progress: Callable[[int, int], None] = None) -> dict:
+    """Apply retention rules (config.json's when ``rules`` is None).
+
+    Returns ``matched`` (sessions per rule), ``sessions``, ``messages`` and
+    ``bytes`` (an estimate taken before deleting); with ``dry_run`` nothing
+    is deleted.
+    """
+    from .db import delete_sessions, transaction
+    rules = rules_from_config() if rules is None else rules
+    with transaction() as conn:
+        matched = candidates(conn, rules)
+        ids = [sid for sids in matched.values() for sid in sids]
+        stats = estimate(conn, ids)
+    stats["matched"] = {rule: len(sids) for rule, sids in matched.items()}
+    stats["dry_run"] = dry_run
+    if not dry_run and ids:
+        deleted = delete_sessions(ids, batch_size=batch_size, on_progress=on_progress)
+        stats.update(deleted)
+    return stats
@@ -0,0 +1,346 @@
+"""Session search: BM25 full-text ranking and RRF hybrid retrieval.
+
+Message hits are aggregated per session in SQL and combined with the
+title/summary match into one relevance score. Two FTS5 indexes cover the
+same text: ``*_fts`` (unicode61 words) and ``*_tri`` (trigrams, for
+substrings and CJK text that has no spaces to split on); :func:`plan_query`
+picks which to try for a query. Only the best ``MAX_HITS``
+message matches (by FTS5 rank) are aggregated, so a query for a very common
+term costs about the same on a small or a large corpus.
+
+:func:`hybrid_search` runs that FTS ranking and the vector KNN search
+concurrently and fuses the two rank lists with reciprocal rank fusion.
+
+Results are ordered by ``(score DESC, id ASC)``; pass the last row's
+:func:`cursor_of` back as ``after`` to fetch the next page (keyset pagination).
+"""
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+from . import shards
+
+MAX_HITS = 2000
+# Filters matching at most this many sessions reach the month shards as an id list
+SCOPE_IDS_MAX = 5000
+
+# Relative weights of the three indexed fields
+WEIGHTS = {"title": 4.0, "summary": 2.0, "messages": 1.0}
+# Extra message hits in the same session add this fraction of their score
+EXTRA_HIT_WEIGHT = 0.1
+
+# Reciprocal rank fusion: fused = sum(w / (RRF_K + rank)) over the retrievers
+RRF_K = 60
+RRF_WEIGHTS = {"fts": 1.0, "vec": 1.0}
+# Candidates taken from each retriever per page
+FUSION_DEPTH = 50
+
+# Word index tables and their trigram twins, per field group
+INDEXES = {
+    "word": {"messages": "messages_fts", "meta": "sessions_fts"},
+    "trigram": {"messages": "messages_tri", "meta": "sessions_tri"},
+}
+# The trigram tokenizer can't match terms shorter than this
+TRIGRAM_MIN_CHARS = 3
+# Scripts written without spaces between words (CJK ideographs, kana, hangul)
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+# Long-lived workers so each keeps its own pooled connection across searches
+_executor: Optional[ThreadPoolExecutor] = None
+
+After = Union[str, tuple, None]
+
+
+def fts_query(query: str) -> str:
+    """Quote each term so user input can't inject FTS5 syntax; terms are ANDed."""
+    terms = [t for t in re.split(r"\s+", query.strip()) if t]
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def plan_query(query: str) -> list[str]:
+    """FTS indexes to try, in order, for ``query`` (``"word"`` / ``"trigram"``).
+
+    CJK text goes straight to trigrams: unicode61 indexes a whole unspaced
+    run as one token, so a word-index phrase match would only hit exact runs.
+    Other scripts try words first (BM25 on whole words ranks better) and
+    fall back to trigrams for substrings. Terms under
+    ``TRIGRAM_MIN_CHARS`` rule trigrams out; when ``"trigram"`` is not in the
+    plan, callers fall back to ``LIKE``.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    trigram = all(len(t) >= TRIGRAM_MIN_CHARS for t in terms)
+    if _CJK.search(query):
+        return ["trigram"] if trigram else ["word"]
+    return ["word", "trigram"] if trigram else ["word"]
+
+
+def trigram_supported(conn: sqlite3.Connection) -> bool:
+    """Whether this SQLite build has the FTS5 trigram tokenizer (3.34+)."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._trigram_probe USING fts5(x, tokenize='trigram')")
+        conn.execute("DROP TABLE temp._trigram_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def parse_after(after: After) -> tuple[Optional[float], Optional[str]]:
+    if not after:
+        return None, None
+    if isinstance(after, str):
+        score, _, sid = after.partition(",")
+        return float(score), sid
+    score, sid = after
+    return float(score), sid
+
+
+def cursor_of(row: dict) -> str:
+    """Keyset cursor (``"<score>,<id>"``) for the row, to pass as ``after``."""
+    return f"{row['score']!r},{row['id']}"
+
+
+def _filters(tool: Optional[str], filters: Optional[dict]) -> tuple[str, dict]:
+    from .db import session_filter
+    return session_filter({**(filters or {}), "tool": tool or (filters or {}).get("tool")})
+
+
+def _shift(ts: Optional[str], days: int) -> Optional[str]:
+    if not ts:
+        return None
+    return (datetime.strptime(ts, "%Y-%m-%d %H:%M:%S") + timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _shard_scope(conn: sqlite3.Connection, cond: str, params: dict) -> tuple[list[str], Optional[str]]:
+    """Shards worth querying under a filter, and (as JSON) the session ids their hits may come from.
+
+    A narrow filter names the sessions, hence the shards, directly; a broad
+    one only prunes shards by month (padded a day for created_at time zones).
+    """
+    if cond == "1" or not shards.shard_keys():
+        return shards.shard_keys(), None
+    ids = [r[0] for r in conn.execute(f"SELECT id FROM sessions s WHERE {cond} LIMIT :scope_max",
+                                      {**params, "scope_max": SCOPE_IDS_MAX + 1})]
+    if len(ids) <= SCOPE_IDS_MAX:
+        return [k for k in shards.group_by_shard(conn, ids) if k is not None], json.dumps(ids)
+    return shards.shard_keys(_shift(params.get("f_since"), -1), _shift(params.get("f_until"), 1)), None
+
+
+def fts_search(conn: sqlite3.Connection, query: str, tool: str = None, limit: int = 10,
+               after: After = None, weights: dict = None, index: str = "word",
+               filters: dict = None) -> list:
+    """Rank sessions by BM25 over ``index`` (see :data:`INDEXES`); returns
+    session rows with ``score`` and ``snippet``. ``filters`` restricts the
+    sessions ranked (see :func:`engram.storage.db.session_filter`)."""
+    match = fts_query(query)
+    if not match:
+        return []
+    w = {**WEIGHTS, **(weights or {})}
+    after_score, after_id = parse_after(after)
+    cond, fparams = _filters(tool, filters)
+    msg, meta = INDEXES[index]["messages"], INDEXES[index]["meta"]
+    # In engram.db the filter joins sessions, so MAX_HITS only counts matching sessions' hits
+    hits_sql = f"""
+            SELECT m.session_id, bm25({msg}) AS r
+            FROM {msg} JOIN messages m ON m.id = {msg}.rowid
+            {"JOIN sessions s ON s.id = m.session_id" if cond != "1" else ""}
+            WHERE {msg} MATCH :q AND {cond}
+            ORDER BY rank LIMIT :max_hits"""
+    shard_hits = None
+    if shards.shard_keys():
+        # Best hits of the month shards, merged with engram.db's own by BM25; shards have
+        # no sessions table, so a filter reaches them as a list of session ids
+        keys, scope_ids = _shard_scope(conn, cond, fparams)
+        shard_sql = f"""
+            SELECT m.session_id, bm25({msg}) AS r
+            FROM {msg} JOIN messages m ON m.id = {msg}.rowid
+            WHERE {msg} MATCH :q
+              AND (:scope_ids IS NULL OR m.session_id IN (SELECT value FROM json_each(:scope_ids)))
+            ORDER BY rank LIMIT :max_hits"""
+        shard_hits = json.dumps(shards.fan_out(
+            lambda c: [tuple(r) for r in c.execute(shard_sql, {"q": match, "max_hits": MAX_HITS,
+                                                               "scope_ids": scope_ids})], keys))
+        hits_sql = f"""
+            SELECT session_id, r FROM ({hits_sql})
+            UNION ALL
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(:shard_hits)
+            ORDER BY r LIMIT :max_hits"""
+    rows = conn.execute(f"""
+        WITH msg_hits AS ({hits_sql}
+        ),
+        msg_scores AS (
+            SELECT session_id,
+                   -(MIN(r) + :extra * (SUM(r) - MIN(r))) * :w_messages AS score,
+                   COUNT(*) AS hits
+            FROM msg_hits GROUP BY session_id
+        ),
+        meta_scores AS (
+            SELECT s.id AS session_id, -bm25({meta}, :w_title, :w_summary) AS score, 0 AS hits
+            FROM {meta} JOIN sessions s ON s.rowid = {meta}.rowid
+            WHERE {meta} MATCH :q AND {cond}
+            ORDER BY rank LIMIT :max_hits
+        ),
+        scored AS (
+            SELECT session_id, SUM(score) AS score, SUM(hits) AS hits
+            FROM (SELECT * FROM msg_scores UNION ALL SELECT * FROM meta_scores)
+            GROUP BY session_id
+        )
+        SELECT s.*, sc.score AS score, sc.hits AS hits
+        FROM scored sc JOIN sessions s ON s.id = sc.session_id
+        WHERE {cond}
+          AND (:after_score IS NULL OR sc.score < :after_score
+               OR (sc.score = :after_score AND s.id > :after_id))
+        ORDER BY sc.score DESC, s.id ASC
+        LIMIT :limit
+    """, {"q": match, "max_hits": MAX_HITS, "extra": EXTRA_HIT_WEIGHT, "shard_hits": shard_hits,
+          "w_messages": w["messages"], "w_title": w["title"], "w_summary": w["summary"],
+          "after_score": after_score, "after_id": after_id, "limit": limit, **fparams}).fetchall()
+    results = [dict(r) for r in rows]
+    _attach_snippets(conn, match, results, msg)
+    return results
+
+
+def _attach_snippets(conn: sqlite3.Connection, match: str, results: list, table: str = "messages_fts"):
+    """Best-ranked message snippet per result, in one query for the whole page."""
+    if not results:
+        return
+    best = {}
+    # One query per database holding the page's messages (just engram.db unless sharded)
+    for key, ids in shards.group_by_shard(conn, [r["id"] for r in results]).items():
+        rows = shards.connect(key).execute(f"""
+            SELECT m.session_id, snippet({table}, 0, '[', ']', '...', 20) AS snippet
+            FROM {table} JOIN messages m ON m.id = {table}.rowid
+            WHERE {table} MATCH ? AND m.session_id IN ({",".join("?" * len(ids))})
+            ORDER BY rank LIMIT ?
+        """, [match, *ids, len(ids) * 20]).fetchall()
+        for row in rows:
+            best.setdefault(row["session_id"], row["snippet"])
+    for r in results:
+        r["snippet"] = best.get(r["id"], "")
+
+
+def like_search(conn: sqlite3.Connection, query: str, tool: str = None, limit: int = 10,
+                filters: dict = None) -> list:
+    """Unindexed substring scan, for queries too short for the trigram index."""
+    cond, fparams = _filters(tool, filters)
+    matched_sql = "SELECT DISTINCT session_id FROM messages_text WHERE content LIKE :q"
+    keys, scope_ids = _shard_scope(conn, cond, fparams)
+    shard_sql = matched_sql + " AND (:scope_ids IS NULL OR session_id IN (SELECT value FROM json_each(:scope_ids)))"
+    shard_ids = json.dumps(shards.fan_out(
+        lambda c: [r[0] for r in c.execute(shard_sql, {"q": f"%{query}%", "scope_ids": scope_ids})], keys))
+    rows = conn.execute(f"""
+        SELECT s.*, 0.0 AS score FROM sessions s
+        WHERE (s.id IN ({matched_sql}) OR s.title LIKE :q OR s.summary LIKE :q
+               OR s.id IN (SELECT value FROM json_each(:shard_ids)))
+          AND {cond}
+        ORDER BY s.imported_at DESC LIMIT :limit
+    """, {"q": f"%{query}%", "shard_ids": shard_ids, "limit": limit, **fparams}).fetchall()
+    return [dict(r) for r in rows]
+
+
+def _fts_leg(query: str, filters: dict, depth: int) -> list:
+    from .db import transaction
+    plan = plan_query(query)
+    exhaustive = False  # a trigram search already covers every substring match
+    with transaction() as conn:
+        for index in plan:
+            try:
+                rows = fts_search(conn, query, limit=depth, index=index, filters=filters)
+            except sqlite3.Error:
+                continue
+            if rows:
+                return rows
+            exhaustive = exhaustive or index == "trigram"
+        return [] if exhaustive else like_search(conn, query, limit=depth, filters=filters)
+
+
+def _vec_leg(query: str, depth: int) -> list:
+    try:
+        from .vector import vector_search_scored
+        return vector_search_scored(query, limit=depth)
+    except Exception:
+        return []
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="engram-search")
+    return _executor
+
+
+def _fuse(query: str, filters: dict, w: dict, depth: int) -> tuple[list, bool]:
+    """Fused candidates from the top ``depth`` of each retriever, and whether more exist."""
+    from .db import transaction
+    fts_future = _pool().submit(_fts_leg, query, filters, depth)
+    vec_future = _pool().submit(_vec_leg, query, depth)
+    fts_rows, vec_hits = fts_future.result(), vec_future.result()
+
+    fused: dict[str, dict] = {}
+    for rank, row in enumerate(fts_rows, 1):
+        fused[row["id"]] = {**row, "fts_score": row.get("score"), "fts_rank": rank,
+                            "vec_rank": None, "vec_distance": None,
+                            "fused_score": w["fts"] / (RRF_K + rank)}
+    missing = []
+    for rank, (sid, distance) in enumerate(vec_hits, 1):
+        entry = fused.get(sid)
+        if entry is None:
+            entry = fused[sid] = {"id": sid, "fts_score": None, "fts_rank": None, "fused_score": 0.0}
+            missing.append(sid)
+        entry["vec_rank"] = rank
+        entry["vec_distance"] = distance
+        entry["fused_score"] += w["vec"] / (RRF_K + rank)
+
+    # Hydrate KNN-only hits in one query, dropping those outside the filters
+    if missing:
+        cond, fparams = _filters(None, filters)
+        with transaction() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM sessions s WHERE id IN (SELECT value FROM json_each(:ids)) AND {cond}",
+                {"ids": json.dumps(missing), **fparams}
+            ).fetchall()
+        found = {r["id"]: dict(r) for r in rows}
+        for sid in missing:
+            row = found.get(sid)
+            if row is None:
+                del fused[sid]
+            else:
+                fused[sid] = {**row, **fused[sid], "snippet": ""}
+
+    for entry in fused.values():
+        entry["score"] = entry["fused_score"]
+    exhausted = len(fts_rows) < depth and len(vec_hits) < depth
+    return list(fused.values()), not exhausted
+
+
+def hybrid_search(query: str, tool: str = None, limit: int = 10, after: After = None,
+                  weights: dict = None, depth: int = FUSION_DEPTH, filters: dict = None) -> list:
+    """FTS + KNN fused with reciprocal rank fusion.
+
+    Each row is a session with ``fts_rank`` / ``vec_distance`` (None when that
+    retriever missed it), ``vec_rank``, ``fused_score`` and ``score`` (same as
+    ``fused_score``, used for keyset pagination via ``after``). Both
+    retrievers run concurrently; when paging past the fused candidates the
+    candidate depth grows until the page fills or the retrievers run dry.
+    ``filters`` (and ``tool``) restrict both legs, see
+    :func:`engram.storage.db.session_filter`.
+    """
+    w = {**RRF_WEIGHTS, **(weights or {})}
+    after_score, after_id = parse_after(after)
+    filters = {**(filters or {}), "tool": tool or (filters or {}).get("tool")}
+    _filters(None, filters)  # bad since / until values fail here, not in a worker thread
+    depth = max(depth, limit)
+    while True:
+        candidates, more = _fuse(query, filters, w, depth)
+        if after_score is not None:
+            candidates = [r for r in candidates if r["score"] < after_score
+                          or (r["score"] == after_score and r["id"] > after_id)]
+        if len(candidates) >= limit or not more or depth >= MAX_HITS:
+            break
+        depth = min(depth * 4, MAX_HITS)
+    candidates.sort(key=lambda r: (-r["score"], r["id"]))
+    return candidates[:limit]
@@ -0,0 +1,312 @@
+"""Optional month-sharded message storage.
+
+Enabled with ``"storage_layout": "sharded"`` in config.json (``engram shards
+--enable`` moves the messages already stored). engram.db stays the catalog:
+one ``sessions`` row per session (metadata, title/summary FTS, vectors,
+queues). Message bodies and their FTS indexes go to one SQLite file per month
+of the session's ``created_at``, ``~/.engram/shards/engram-YYYY-MM.db``
+(``engram-undated.db`` when a tool records no date), named in
+``sessions.shard``. Rows with a NULL ``shard`` keep their messages in
+engram.db, so both layouts can be read at any time.
+
+Ingest writes each month to its own WAL. Full-text search runs the message
+query on every shard in parallel and merges the hits (see
+:mod:`engram.storage.search`). Listing and recent-activity queries only read
+the catalog, and opening a session reads one shard. Shards older than
+``COLD_AFTER_MONTHS`` are opened read-only with a large mmap window; ``engram
+shards --freeze`` checkpoints them and switches them out of WAL mode, so
+readers need no ``-wal``/``-shm`` files.
+"""
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from .connection import PRAGMAS, ConnectionManager
+from .migrations import migrate, only_if, steps
+
+SHARD_DIR = Path.home() / ".engram" / "shards"
+UNDATED = "undated"
+# Shards this many months behind the current one are read through read-only connections
+COLD_AFTER_MONTHS = 2
+COLD_MMAP_BYTES = 256 * 1024 * 1024
+MAX_WORKERS = 8
+
+_MONTH = re.compile(r"^(\d{4})-(\d{2})")
+_FILE = re.compile(r"^engram-(\d{4}-\d{2}|undated)\.db$")
+
+_writers: dict[str, ConnectionManager] = {}
+_readers: dict[str, ConnectionManager] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _shard_migrations() -> list:
+    from .db import _message_index_sql
+    from .search import trigram_supported
+    return [
+        # 1: messages without the catalog's foreign key (sessions lives in engram.db)
+        steps(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT,
+                has_images INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+            CREATE VIEW IF NOT EXISTS messages_text AS
+                SELECT id, session_id, engram_text(content) AS content FROM messages;
+            """,
+            _message_index_sql("messages_fts", "unicode61"),
+            only_if(trigram_supported, _message_index_sql("messages_tri", "trigram")),
+        ),
+    ]
+
+
+def enabled() -> bool:
+    from ..config import get_config
+    return get_config().get("storage_layout") == "sharded"
+
+
+def shard_key(created_at) -> str:
+    """``YYYY-MM`` of an ISO timestamp or epoch (s or ms), else ``"undated"``."""
+    if isinstance(created_at, str):
+        m = _MONTH.match(created_at.strip())
+        if m:
+            return f"{m.group(1)}-{m.group(2)}"
+        try:
+            created_at = float(created_at)
+        except ValueError:
+            return UNDATED
+    if isinstance(created_at, (int, float)) and created_at > 0:
+        ts = created_at / 1000 if created_at > 1e11 else created_at
+        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m")
+    return UNDATED
+
+
+def shard_path(key: str) -> Path:
+    return SHARD_DIR / f"engram-{key}.db"
+
+
+def is_cold(key: str, now: datetime = None) -> bool:
+    if key == UNDATED:
+        return False
+    now = now or datetime.now(timezone.utc)
+    year, month = divmod(now.year * 12 + now.month - 1 - COLD_AFTER_MONTHS, 12)
+    return key < f"{year:04d}-{month + 1:02d}"
+
+
+def shard_keys(since: str = None, until: str = None) -> list[str]:
+    """Existing shards, newest first, optionally only months overlapping [since, until]."""
+    keys = sorted((m.group(1) for p in SHARD_DIR.glob("engram-*.db") if (m := _FILE.match(p.name))),
+                  reverse=True)
+    lo = shard_key(since) if since else None
+    hi = shard_key(until) if until else None
+    return [k for k in keys if k == UNDATED
+            or ((lo in (None, UNDATED) or k >= lo) and (hi in (None, UNDATED) or k <= hi))]
+
+
+def _on_open(conn: sqlite3.Connection):
+    from .compression import register
+    from .db import DB_PATH
+    register(conn, DB_PATH)  # dictionaries live in the catalog
+    migrate(conn, _shard_migrations())
+
+
+def _on_open_cold(conn: sqlite3.Connection):
+    from .compression import register
+    from .db import DB_PATH
+    register(conn, DB_PATH)
+
+
+def _manager(key: str, write: bool) -> ConnectionManager:
+    cold = not write and is_cold(key) and shard_path(key).exists()
+    managers = _readers if cold else _writers
+    mgr = managers.get(key)
+    if mgr is None:
+        if cold:
+            mgr = ConnectionManager(lambda: shard_path(key), on_open=_on_open_cold, readonly=True,
+                                    pragmas=(f"PRAGMA mmap_size={COLD_MMAP_BYTES}", "PRAGMA query_only=1"))
+        elif is_cold(key):
+            # Late writes to an old month must not switch a frozen shard back to WAL
+            mgr = ConnectionManager(lambda: shard_path(key), on_open=_on_open,
+                                    pragmas=tuple(p for p in PRAGMAS if "journal_mode" not in p))
+        else:
+            mgr = ConnectionManager(lambda: shard_path(key), on_open=_on_open)
+        mgr = managers.setdefault(key, mgr)
+    return mgr
+
+
+def connect(key: Optional[str], write: bool = False) -> sqlite3.Connection:
+    """This thread's connection to shard ``key`` (engram.db itself for None)."""
+    if key is None:
+        from .db import get_db
+        return get_db()
+    return _manager(key, write).get()
+
+
+def messages_db(conn: sqlite3.Connection, session_id: str, write: bool = False) -> sqlite3.Connection:
+    """Connection holding ``session_id``'s messages, given a catalog connection."""
+    row = conn.execute("SELECT shard FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    return conn if row is None or row[0] is None else connect(row[0], write=write)
+
+
+def group_by_shard(conn: sqlite3.Connection, session_ids: Iterable[str]) -> dict[Optional[str], list[str]]:
+    """Session ids grouped by the shard holding their messages (None = engram.db)."""
+    ids = list(session_ids)
+    groups: dict[Optional[str], list[str]] = {}
+    if not ids:
+        return groups
+    rows = conn.execute(f"SELECT id, shard FROM sessions WHERE id IN ({','.join('?' * len(ids))})", ids)
+    for r in rows:
+        groups.setdefault(r[1], []).append(r[0])
+    return groups
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="engram-shard")
+    return _executor
+
+
+def fan_out(fn: Callable[[sqlite3.Connection], list], keys: list[str] = None) -> list:
+    """Run ``fn(conn)`` on every shard in parallel and concatenate the results."""
+    keys = shard_keys() if keys is None else keys
+
+    def run(key):
+        conn = connect(key)
+        try:
+            return fn(conn)
+        finally:
+            if conn.in_transaction:
+                conn.commit()
+    out = []
+    for rows in _pool().map(run, keys):
+        out.extend(rows)
+    return out
+
+
+class ShardWriter:
+    """Shard connections written during one ingest batch.
+
+    Used as ``with transaction() as conn, ShardWriter() as writer``: shards
+    commit (or roll back) before the catalog, so a crash in between leaves
+    catalog rows whose content hash is stale (rewritten on the next sync)
+    rather than catalog rows pointing at missing messages.
+    """
+
+    def __init__(self, route: bool = None):
+        self._route = enabled() if route is None else route
+        self._touched: dict[str, sqlite3.Connection] = {}
+
+    def route(self, session: dict) -> Optional[str]:
+        """Shard for a session's messages (None: engram.db, when sharding is off)."""
+        return shard_key(session.get("created_at")) if self._route else None
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def conn(self, key: str) -> sqlite3.Connection:
+        conn = self._touched.get(key)
+        if conn is None:
+            conn = self._touched[key] = connect(key, write=True)
+        return conn
+
+    def commit(self):
+        for conn in self._touched.values():
+            if conn.in_transaction:
+                conn.commit()
+
+    def rollback(self):
+        for conn in self._touched.values():
+            if conn.in_transaction:
+                conn.rollback()
+
+
+def message_dbs(write: bool = True) -> list[tuple[Optional[str], sqlite3.Connection]]:
+    """engram.db and every shard, as ``(key, connection)`` pairs."""
+    return [(None, connect(None))] + [(k, connect(k, write=write)) for k in shard_keys()]
+
+
+def enable(batch_size: int = 200, on_progress: Callable[[int, int], None] = None) -> dict:
+    """Switch to the sharded layout, moving messages out of engram.db session by session."""
+    from ..config import get_config, save_config
+    from .db import transaction
+    cfg = get_config()
+    cfg["storage_layout"] = "sharded"
+    save_config(cfg)
+    with transaction() as conn:
+        sessions = [(r[0], r[1]) for r in conn.execute("SELECT id, created_at FROM sessions WHERE shard IS NULL")]
+    moved_sessions = moved_messages = 0
+    for i in range(0, len(sessions), batch_size):
+        writer = ShardWriter()
+        try:
+            with transaction() as conn:
+                for sid, created_at in sessions[i:i + batch_size]:
+                    key = shard_key(created_at)
+                    rows = conn.execute("""
+                        SELECT id, session_id, role, content, timestamp, has_images FROM messages
+                        WHERE session_id = ? ORDER BY id
+                    """, (sid,)).fetchall()
+                    # Copied as stored: ids stay valid for chunk rows, compressed bodies stay compressed
+                    writer.conn(key).executemany("""
+                        INSERT INTO messages (id, session_id, role, content, timestamp, has_images)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, [tuple(r) for r in rows])
+                    conn.execute("UPDATE sessions SET shard = ? WHERE id = ?", (key, sid))
+                    conn.execute("DELETE FROM messages WHERE session_id = ?", (sid,))
+                    moved_messages += len(rows)
+                writer.commit()
+        except BaseException:
+            writer.rollback()
+            raise
+        moved_sessions += len(sessions[i:i + batch_size])
+        if on_progress:
+            on_progress(moved_sessions, len(sessions))
+    return {"sessions": moved_sessions, "messages": moved_messages, "shards": len(shard_keys())}
+
+
+def freeze() -> list[str]:
+    """Checkpoint cold shards and take them out of WAL mode; returns the keys frozen."""
+    frozen = []
+    for key in shard_keys():
+        if not is_cold(key):
+            continue
+        conn = connect(key, write=True)
+        conn.execute("PRAGMA optimize")
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA journal_mode=DELETE")
+        frozen.append(key)
+    return frozen
+
+
+def stats() -> list[dict]:
+    out = []
+    for key in shard_keys():
+        conn = connect(key)
+        path = shard_path(key)
+        out.append({
+            "shard": key,
+            "messages": conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0],
+            "bytes": path.stat().st_size,
+            "cold": is_cold(key),
+            "journal": conn.execute("PRAGMA journal_mode").fetchone()[0],
+        })
+    return out
+
+
+def close_all():
+    for mgr in list(_writers.values()) + list(_readers.values()):
+        mgr.close_all()
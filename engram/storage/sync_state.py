@@ -0,0 +1,131 @@
+"""Source-file change manifest for incremental sync (``sync_state`` table)."""
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+_HASH_CHUNK = 1 << 20
+# Bytes at the start of an append-only log used to detect rewrites/rotation
+HEAD_BYTES = 4096
+
+
+def hash_files(files: list[Path]) -> str:
+    """Streaming content hash over ``files`` in order."""
+    h = hashlib.md5()
+    for f in files:
+        h.update(str(f.name).encode())
+        try:
+            with open(f, "rb") as fh:
+                while chunk := fh.read(_HASH_CHUNK):
+                    h.update(chunk)
+        except OSError:
+            continue
+    return h.hexdigest()
+
+
+def head_hash(path: Path, length: int) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.md5(fh.read(min(length, HEAD_BYTES))).hexdigest()
+
+
+class SyncManifest:
+    """Decides which extractor sources changed since the last sync.
+
+    A source is unchanged when its (mtime, size) match the stored stamp, or
+    when they differ but the content hash still matches (e.g. a ``touch``).
+    Stamps of finished sources are buffered by :meth:`done` and written by
+    :meth:`flush` inside the writer's transaction.
+
+    Append-only logs (``tail=True``) skip the full-content hash; instead the
+    stored byte offset and a hash of the file head decide whether parsing
+    can resume where the last sync stopped.
+
+    Sources that failed to parse are recorded by :meth:`fail` instead of
+    :meth:`done`, so the next sync tries them again.
+    """
+
+    def __init__(self, full: bool = False):
+        from .db import get_db
+        self.full = full
+        self.skipped = 0
+        self.failures: list[dict] = []
+        self._pending: list[dict] = []
+        self._lock = threading.Lock()
+        rows = get_db().execute(
+            "SELECT source_path, mtime, size, content_hash, byte_offset, head_hash, cursor FROM sync_state"
+        ).fetchall()
+        self._state = {r["source_path"]: dict(r) for r in rows}
+
+    def check(self, key: str, files: list[Path], tail: bool = False) -> Optional[dict]:
+        """Return a new stamp if ``key`` must be re-parsed, else None."""
+        stats = []
+        for f in files:
+            try:
+                stats.append(f.stat())
+            except OSError:
+                continue
+        if not stats:
+            return None
+        stamp = {
+            "source_path": key,
+            "mtime": max(st.st_mtime for st in stats),
+            "size": sum(st.st_size for st in stats),
+            "content_hash": None,
+        }
+        prev = self._state.get(key)
+        if not self.full and prev and prev["mtime"] == stamp["mtime"] and prev["size"] == stamp["size"]:
+            self.skipped += 1
+            return None
+        if tail:
+            return stamp
+        stamp["content_hash"] = hash_files(files)
+        if not self.full and prev and prev["content_hash"] == stamp["content_hash"]:
+            # Touched but identical: remember the new mtime so the next run skips on stat alone
+            self.done(stamp)
+            self.skipped += 1
+            return None
+        return stamp
+
+    def resume_cursor(self, key: str, path: Path) -> dict:
+        """Parser cursor to continue an append-only log, or a fresh one if it was rewritten."""
+        prev = self._state.get(key)
+        if self.full or not prev or not prev.get("byte_offset"):
+            return {"offset": 0}
+        try:
+            if path.stat().st_size < prev["byte_offset"] or head_hash(path, prev["byte_offset"]) != prev["head_hash"]:
+                return {"offset": 0}
+        except OSError:
+            return {"offset": 0}
+        cursor = json.loads(prev["cursor"]) if prev.get("cursor") else {}
+        cursor["offset"] = prev["byte_offset"]
+        return cursor
+
+    def done(self, stamp: dict, cursor: dict = None):
+        """Mark a source as fully handed to the writer."""
+        stamp = {**stamp, "byte_offset": None, "head_hash": None, "cursor": None}
+        if cursor is not None:
+            stamp["byte_offset"] = cursor["offset"]
+            stamp["head_hash"] = head_hash(Path(stamp["source_path"]), cursor["offset"])
+            stamp["cursor"] = json.dumps({k: v for k, v in cursor.items() if k != "offset"}, ensure_ascii=False)
+        with self._lock:
+            self._pending.append(stamp)
+            self._state[stamp["source_path"]] = stamp
+
+    def fail(self, tool: str, key: str, error: Exception):
+        """Record a source whose parse raised; its stamp stays as it was."""
+        with self._lock:
+            self.failures.append({"tool": tool, "source": key, "error": str(error)})
+
+    def flush(self, conn: sqlite3.Connection):
+        """Persist buffered stamps on ``conn`` (caller commits)."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        conn.executemany("""
+            INSERT OR REPLACE INTO sync_state
+            (source_path, mtime, size, content_hash, byte_offset, head_hash, cursor, synced_at)
+            VALUES (:source_path, :mtime, :size, :content_hash, :byte_offset, :head_hash, :cursor, datetime('now'))
+        """, pending)
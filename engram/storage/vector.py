@@ -1,56 +1,137 @@
-"""Vector semantic search using sqlite-vec and fastembed."""
-import struct
+"""Vector semantic search using a configurable embedding backend and a pluggable KNN index."""
+import hashlib
+from functools import lru_cache
 from typing import Optional
 
-_model = None
+from .embedders import get_embedder
 
+# Query embeddings kept in memory per process (repeated MCP searches skip the model)
+QUERY_CACHE_SIZE = 256
 
-def get_model():
-    global _model
-    if _model is None:
-        from fastembed import TextEmbedding
-        _model = TextEmbedding("BAAI/bge-small-en-v1.5")
-    return _model
 
+def get_model(threads: Optional[int] = None):
+    """The configured embedding backend (see :mod:`engram.storage.embedders`)."""
+    return get_embedder(threads)
 
+
+def _pack(vec) -> bytes:
+    import numpy as np
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _cached(conn, hashes: list[str]) -> dict[str, bytes]:
+    from .retention import ID_SLICE
+    model_id = get_embedder().model_id
+    found = {}
+    # 一次 embed 可能有上万段文本：分片查询，IN (...) 不超过变量上限
+    for i in range(0, len(hashes), ID_SLICE):
+        part = hashes[i:i + ID_SLICE]
+        found.update(conn.execute(f"""
+            SELECT content_hash, embedding FROM embedding_cache
+            WHERE model = ? AND content_hash IN ({",".join("?" * len(part))})
+        """, [model_id, *part]).fetchall())
+    return found
+
+
+def embed_texts(texts: list[str], batch_size: Optional[int] = None, threads: Optional[int] = None) -> list[bytes]:
+    """Embed many texts in model batches; returns packed float32 vectors.
+
+    Vectors are looked up in ``embedding_cache`` by (model, content hash)
+    first; only misses reach the model (the shared ``engram embed-server``
+    when it is running, else in-process), and their vectors are cached.
+    """
+    from .db import transaction
+    if not texts:
+        return []
+    from .embedders import embedding_config
+    embedder = get_embedder(threads)
+    batch_size = batch_size or embedding_config()["batch_size"]
+    hashes = [text_hash(t) for t in texts]
+    with transaction() as conn:
+        found = _cached(conn, list(set(hashes)))
+    missing = list({h: t for h, t in zip(hashes, texts) if h not in found}.items())
+    if missing:
+        from ..embed_server import embed_remote
+        fresh = embed_remote([t for _, t in missing], embedder.model_id)
+        if fresh is None:
+            # No shared server running: load the model in this process
+            fresh = [_pack(vec) for vec in embedder.embed([t for _, t in missing], batch_size=batch_size)]
+        with transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, content_hash, embedding) VALUES (?, ?, ?)",
+                [(embedder.model_id, h, blob) for (h, _), blob in zip(missing, fresh)])
+        found.update((h, blob) for (h, _), blob in zip(missing, fresh))
+    return [found[h] for h in hashes]
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
 def embed_text(text: str) -> bytes:
-    """Embed text and return as packed float32 bytes."""
-    model = get_model()
-    vec = next(model.embed([text]))
-    return struct.pack(f"{len(vec)}f", *vec)
+    """Embed text and return as packed float32 bytes (memoized, then cache table, then model)."""
+    return embed_texts([text])[0]
+
+
+def store_embeddings(conn, items: list[tuple[str, bytes]]):
+    """Replace the stored vectors of ``(session_id, packed_vector)`` pairs."""
+    from .vector_index import get_index
+    get_index("sessions").add(conn, items)
 
 
 def add_embedding(session_id: str, content: str):
     """Store embedding for a session's content."""
-    from .db import get_db
-    embedding = embed_text(content)
-    conn = get_db()
-    try:
-        # Delete old embedding for this session
-        conn.execute("DELETE FROM vec_embeddings WHERE session_id = ?", (session_id,))
-        conn.execute(
-            "INSERT INTO vec_embeddings (session_id, embedding) VALUES (?, ?)",
-            (session_id, embedding)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    add_embeddings([(session_id, content)])
+
+
+def add_embeddings(items: list[tuple[str, str]], batch_size: Optional[int] = None) -> int:
+    """Embed ``(session_id, content)`` pairs in model batches and store them."""
+    from .db import transaction
+    if not items:
+        return 0
+    blobs = embed_texts([content for _, content in items], batch_size=batch_size)
+    with transaction() as conn:
+        store_embeddings(conn, [(sid, blob) for (sid, _), blob in zip(items, blobs)])
+    return len(items)
 
 
 def vector_search(query: str, limit: int = 10) -> list[str]:
     """KNN vector search, returns list of session_ids."""
-    from .db import get_db
+    return [sid for sid, _ in vector_search_scored(query, limit)]
+
+
+def vector_search_scored(query: str, limit: int = 10) -> list[tuple[str, float]]:
+    """KNN vector search, returns ``(session_id, distance)`` nearest first.
+
+    A session's distance is the smaller of its session-level vector and its
+    best message chunk (max-sim), so late parts of long sessions are found.
+    """
+    return [(hit["session_id"], hit["distance"]) for hit in vector_search_chunks(query, limit)]
+
+
+def vector_search_chunks(query: str, limit: int = 10) -> list[dict]:
+    """KNN search returning per session its ``distance`` and best ``chunk`` / ``message_offset``.
+
+    ``chunk`` is None when the session-level vector matched better than any chunk.
+    """
+    from .db import transaction
+    from .chunks import chunk_search
+    from .vector_index import get_index
     q_emb = embed_text(query)
-    conn = get_db()
-    try:
-        rows = conn.execute("""
-            SELECT session_id, distance
-            FROM vec_embeddings
-            WHERE embedding MATCH ? AND k = ?
-            ORDER BY distance
-        """, (q_emb, limit)).fetchall()
-        return [row[0] for row in rows]
-    except Exception:
-        return []
-    finally:
-        conn.close()
+    with transaction() as conn:
+        try:
+            rows = get_index("sessions").search(conn, q_emb, limit)
+        except Exception:
+            return []
+        hits = {sid: {"session_id": sid, "distance": dist, "chunk": None, "message_offset": None}
+                for sid, dist in rows}
+        try:
+            chunk_hits = chunk_search(conn, q_emb, limit)
+        except Exception:
+            chunk_hits = []
+    for hit in chunk_hits:
+        current = hits.get(hit["session_id"])
+        if current is None or hit["distance"] < current["distance"]:
+            hits[hit["session_id"]] = hit
+    return sorted(hits.values(), key=lambda h: h["distance"])[:limit]
@@ -0,0 +1,625 @@
+"""Pluggable KNN index behind :mod:`engram.storage.vector`.
+
+Two engines implement :class:`VectorIndex`:
+
+* ``sqlite-vec`` — ``vec0`` virtual tables inside engram.db (needs the
+  native extension to load).
+* ``numpy`` — a contiguous float32 matrix in a memory-mapped file under
+  ``~/.engram/vectors/``, brute-force top-k with ``argpartition``. Pure
+  Python + NumPy, works offline and without any native SQLite extension.
+  Optionally (``vector_quantization`` = ``int8`` or ``binary``, with
+  ``vector_dims`` truncation) the scan runs over compact codes and only the
+  best ``k * vector_rerank`` candidates are re-scored on the float rows, so
+  the float matrix is rarely paged in. Large indexes can also use an
+  IVF-flat ANN layer (k-means lists, ``ann_nprobe`` lists probed per query),
+  trained by ``engram reindex``; below ``ann_min_rows`` vectors, or before
+  it is trained, search stays exact.
+
+The engine is chosen by ``vector_engine`` in config.json. ``auto`` (the
+default) picks sqlite-vec when it loads, NumPy otherwise, and NumPy whenever
+a quantization or IVF setting is configured, since only NumPy implements
+them. With ``vector_engine: "sqlite-vec"`` set explicitly those settings are
+ignored (``engram status`` says so) and ``engram reindex`` has nothing to
+train. Switching engines re-queues every session for embedding. Distances
+are L2 in both engines so scores are comparable.
+"""
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional, Union
+
+from .embedders import DEFAULT_DIM, DEFAULT_MODEL
+VECTORS_DIR = Path.home() / ".engram" / "vectors"
+# Rewrite the matrix once dead rows exceed this share (and COMPACT_MIN rows)
+COMPACT_RATIO = 0.3
+COMPACT_MIN = 1024
+QUANTIZATIONS = ("none", "int8", "binary")
+# Float candidates re-scored per requested neighbour when quantized
+RERANK_FACTOR = 10
+# Rows decoded per block during a quantized scan (bounds temporary memory)
+SCAN_BLOCK = 65536
+# IVF: lists probed per query, and the corpus size below which search stays exact
+ANN_NPROBE = 8
+ANN_MIN_ROWS = 20000
+# k-means training: sampled rows and Lloyd iterations
+ANN_TRAIN_SAMPLE = 50000
+ANN_TRAIN_ITERATIONS = 12
+
+Key = Union[str, int]
+
+# Created with the configured embedding dimension
+VEC_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS vec_embeddings USING vec0(
+    session_id TEXT,
+    embedding FLOAT[{dim}]
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS vec_chunks USING vec0(
+    embedding FLOAT[{dim}]
+);
+"""
+
+NUMPY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vector_indexes (
+    name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS vector_rows (
+    index_name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (index_name, key)
+) WITHOUT ROWID;
+"""
+
+
+class VectorIndex(ABC):
+    """KNN index over packed float32 vectors keyed by session id or chunk id."""
+    engine = ""
+
+    def __init__(self, name: str, key_type: type = str):
+        self.name = name
+        self.key_type = key_type
+
+    @abstractmethod
+    def add(self, conn: sqlite3.Connection, items: list[tuple[Key, bytes]]):
+        """Insert or replace vectors inside the caller's transaction."""
+        pass
+
+    @abstractmethod
+    def remove(self, conn: sqlite3.Connection, keys: list[Key]):
+        pass
+
+    @abstractmethod
+    def clear(self, conn: sqlite3.Connection):
+        pass
+
+    @abstractmethod
+    def search(self, conn: sqlite3.Connection, query: bytes, k: int) -> list[tuple[Key, float]]:
+        """``(key, distance)`` of the ``k`` nearest vectors, nearest first."""
+        pass
+
+    @abstractmethod
+    def count(self, conn: sqlite3.Connection) -> int:
+        pass
+
+    def stats(self, conn: sqlite3.Connection) -> dict:
+        """Vector count and storage footprint, for ``engram status``."""
+        return {"engine": self.engine, "quantization": "none", "vectors": self.count(conn),
+                "float_bytes": None, "code_bytes": 0, "recall": None}
+
+
+class SqliteVecIndex(VectorIndex):
+    engine = "sqlite-vec"
+
+    def __init__(self, name: str, table: str, key_column: str, key_type: type = str):
+        super().__init__(name, key_type)
+        self.table = table
+        self.key_column = key_column
+
+    def add(self, conn, items):
+        self.remove(conn, [key for key, _ in items])
+        conn.executemany(f"INSERT INTO {self.table} ({self.key_column}, embedding) VALUES (?, ?)", items)
+
+    def remove(self, conn, keys):
+        conn.executemany(f"DELETE FROM {self.table} WHERE {self.key_column} = ?", [(k,) for k in keys])
+
+    def clear(self, conn):
+        conn.execute(f"DELETE FROM {self.table}")
+
+    def search(self, conn, query, k):
+        rows = conn.execute(f"""
+            SELECT {self.key_column}, distance FROM {self.table}
+            WHERE embedding MATCH ? AND k = ?
+            ORDER BY distance
+        """, (query, k)).fetchall()
+        return [(self.key_type(r[0]), r[1]) for r in rows]
+
+    def count(self, conn):
+        return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class NumpyIndex(VectorIndex):
+    """Append-only memory-mapped matrix; the key → row map lives in engram.db.
+
+    Replacing a vector appends a new row and repoints its key, so a rolled
+    back transaction only leaves unreferenced rows behind. Compaction writes
+    the live rows to the next generation's file and switches the map and
+    generation in the same transaction; older generation files are removed
+    afterwards.
+
+    Quantized codes live in a sibling file (``.q8`` / ``.q1``) whose row ``i``
+    always encodes float row ``i``; it is extended lazily from the float
+    rows at search time, so switching quantization on needs no migration.
+    IVF list assignments (``.ivf``, int32 per row) work the same way against
+    the centroids trained by :meth:`train` (``<name>.centroids.npy``).
+    """
+    engine = "numpy"
+
+    def __init__(self, name: str, key_type: type = str, dim: int = DEFAULT_DIM, directory: Path = None,
+                 quantization: str = "none", dims: Optional[int] = None, rerank: int = RERANK_FACTOR,
+                 nprobe: int = ANN_NPROBE, ann_min_rows: int = ANN_MIN_ROWS):
+        super().__init__(name, key_type)
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"unknown vector_quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.dim = dim
+        self.directory = directory or VECTORS_DIR
+        self.quantization = quantization
+        self.dims = min(dims or dim, dim)
+        self.rerank = max(rerank, 1)
+        self.nprobe = max(nprobe, 1)
+        self.ann_min_rows = ann_min_rows
+        self._lock = threading.Lock()
+        self._centroid_cache: tuple = (None, None)  # (mtime_ns, centroids)
+        self._map_cache: tuple = (None, None, None)  # (state, rows, keys)
+
+    def _generation(self, conn, write: bool = False) -> int:
+        if write:
+            # Take the write lock before reading, so a concurrent compaction can't
+            # switch generations between our append and our commit
+            conn.execute("INSERT OR IGNORE INTO vector_indexes (name) VALUES (?)", (self.name,))
+        row = conn.execute("SELECT generation FROM vector_indexes WHERE name = ?", (self.name,)).fetchone()
+        return row[0] if row else 0
+
+    def _path(self, generation: int, suffix: str = "f32") -> Path:
+        return self.directory / f"{self.name}.{generation}.{suffix}"
+
+    def _rows_in(self, path: Path, row_bytes: int = None) -> int:
+        return path.stat().st_size // (row_bytes or 4 * self.dim) if path.exists() else 0
+
+    def _append(self, path: Path, data: bytes, row_bytes: int = None) -> int:
+        """Append rows and return the index of the first one."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(path, "ab") as f:
+            _flock(f)  # other engram processes may append too
+            start = f.seek(0, os.SEEK_END) // (row_bytes or 4 * self.dim)
+            f.write(data)
+            return start
+
+    def add(self, conn, items):
+        if not items:
+            return
+        path = self._path(self._generation(conn, write=True))
+        first = self._append(path, b"".join(blob for _, blob in items))
+        conn.executemany(
+            "INSERT OR REPLACE INTO vector_rows (index_name, key, row) VALUES (?, ?, ?)",
+            [(self.name, str(key), first + i) for i, (key, _) in enumerate(items)])
+        centroids = self._centroids()
+        if centroids is not None:
+            # Keep IVF lists current as vectors arrive
+            self._assignments(self._generation(conn), self._matrix(path), centroids)
+        live = self.count(conn)
+        total = self._rows_in(path)
+        if total - live > max(COMPACT_MIN, total * COMPACT_RATIO):
+            self.compact(conn)
+
+    def remove(self, conn, keys):
+        conn.executemany("DELETE FROM vector_rows WHERE index_name = ? AND key = ?",
+                         [(self.name, str(k)) for k in keys])
+
+    def clear(self, conn):
+        self.cleanup(conn)
+        conn.execute("DELETE FROM vector_rows WHERE index_name = ?", (self.name,))
+        generation = self._generation(conn, write=True) + 1
+        for suffix in ("f32", "q8", "q1", "ivf"):
+            self._path(generation, suffix).unlink(missing_ok=True)
+        self._centroids_path().unlink(missing_ok=True)
+        conn.execute("UPDATE vector_indexes SET generation = ? WHERE name = ?", (generation, self.name))
+
+    def count(self, conn):
+        return conn.execute("SELECT COUNT(*) FROM vector_rows WHERE index_name = ?",
+                            (self.name,)).fetchone()[0]
+
+    def _matrix(self, path: Path):
+        import numpy as np
+        n = self._rows_in(path)
+        if n == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    # ── quantized codes ──
+
+    def _code_dtype(self):
+        import numpy as np
+        if self.quantization == "int8":
+            return np.dtype([("code", np.int8, self.dims), ("scale", np.float32), ("norm2", np.float32)])
+        return np.dtype([("code", np.uint8, (self.dims + 7) // 8)])
+
+    def _encode(self, floats):
+        import numpy as np
+        floats = np.asarray(floats, dtype=np.float32)
+        x = floats[:, :self.dims]
+        codes = np.zeros(len(floats), dtype=self._code_dtype())
+        if self.quantization == "int8":
+            scale = np.abs(x).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            codes["code"] = np.round(x / scale[:, None]).astype(np.int8)
+            codes["scale"] = scale
+            codes["norm2"] = np.einsum("ij,ij->i", floats, floats)
+        else:
+            codes["code"] = np.packbits(x > 0, axis=1)
+        return codes
+
+    def _codes(self, generation: int, matrix):
+        """Code rows for ``matrix``, encoding any float rows not coded yet."""
+        import numpy as np
+        dtype = self._code_dtype()
+        path = self._path(generation, "q8" if self.quantization == "int8" else "q1")
+        n = matrix.shape[0]
+        if self._rows_in(path, dtype.itemsize) < n:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock, open(path, "ab") as f:
+                _flock(f)
+                done = f.seek(0, os.SEEK_END) // dtype.itemsize
+                for start in range(done, n, SCAN_BLOCK):
+                    f.write(self._encode(matrix[start:min(start + SCAN_BLOCK, n)]).tobytes())
+        if n == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+
+    def _coarse(self, codes, rows, q, k: int):
+        """Positions (into ``rows``) of the ``k`` best candidates by code distance."""
+        import numpy as np
+        qt = q[:self.dims]
+        if self.quantization == "binary":
+            qbits = np.packbits(qt > 0)
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCAN_BLOCK):
+            block = codes[rows[start:start + SCAN_BLOCK]]
+            if self.quantization == "int8":
+                dots = (block["code"].astype(np.float32) @ qt) * block["scale"]
+                scores[start:start + len(block)] = block["norm2"] - 2 * dots
+            else:
+                scores[start:start + len(block)] = _POPCOUNT[block["code"] ^ qbits].sum(axis=1)
+        if k >= len(rows):
+            return np.arange(len(rows))
+        return np.argpartition(scores, k - 1)[:k]
+
+    def _exact(self, vectors, q, k: int):
+        """``(positions, squared distances)`` of the ``k`` nearest ``vectors``, nearest first."""
+        import numpy as np
+        dist = np.einsum("ij,ij->i", vectors, vectors) - 2 * (vectors @ q) + q @ q
+        k = min(k, len(dist))
+        top = np.argpartition(dist, k - 1)[:k]
+        top = top[np.argsort(dist[top])]
+        return top, dist[top]
+
+    def _id_map(self, conn, generation: int):
+        import numpy as np
+        state = (generation, *conn.execute(
+            "SELECT COUNT(*), MAX(row), TOTAL(row) FROM vector_rows WHERE index_name = ?",
+            (self.name,)).fetchone())
+        cached_state, rows, keys = self._map_cache
+        if cached_state != state:
+            pairs = conn.execute("SELECT row, key FROM vector_rows WHERE index_name = ? ORDER BY row",
+                                 (self.name,)).fetchall()
+            rows = np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs))
+            keys = [p[1] for p in pairs]
+            self._map_cache = (state, rows, keys)
+        return rows, keys
+
+    def _live(self, conn):
+        generation = self._generation(conn)
+        rows, keys = self._id_map(conn, generation)
+        matrix = self._matrix(self._path(generation))
+        # Rows appended by a not-yet-visible transaction may be past the map's end
+        valid = rows < matrix.shape[0]
+        if not valid.all():
+            rows, keys = rows[valid], [key for key, ok in zip(keys, valid) if ok]
+        return generation, matrix, rows, keys
+
+    # ── IVF ──
+
+    def _centroids_path(self) -> Path:
+        return self.directory / f"{self.name}.centroids.npy"
+
+    def _centroids(self):
+        import numpy as np
+        path = self._centroids_path()
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached_mtime, centroids = self._centroid_cache
+        if cached_mtime != mtime:
+            centroids = np.load(path)
+            self._centroid_cache = (mtime, centroids)
+        return centroids
+
+    @staticmethod
+    def _nearest_list(vectors, centroids):
+        import numpy as np
+        # argmin ||x - c||² == argmax (x·c - ||c||²/2)
+        half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ centroids.T - half_norms, axis=1).astype(np.int32)
+
+    def _assignments(self, generation: int, matrix, centroids):
+        """IVF list of every float row, assigning rows not seen yet."""
+        import numpy as np
+        path = self._path(generation, "ivf")
+        n = matrix.shape[0]
+        if self._rows_in(path, 4) < n:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock, open(path, "ab") as f:
+                _flock(f)
+                done = f.seek(0, os.SEEK_END) // 4
+                for start in range(done, n, SCAN_BLOCK):
+                    f.write(self._nearest_list(matrix[start:min(start + SCAN_BLOCK, n)], centroids).tobytes())
+        if n == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.memmap(path, dtype=np.int32, mode="r", shape=(n,))
+
+    def _probe(self, generation: int, matrix, rows, q, k: int):
+        """Positions (into ``rows``) in the ``nprobe`` nearest IVF lists, or None for exact search."""
+        import numpy as np
+        if len(rows) < self.ann_min_rows:
+            return None
+        centroids = self._centroids()
+        if centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(centroids))
+        dist = np.einsum("ij,ij->i", centroids, centroids) - 2 * (centroids @ q)
+        probe = np.argpartition(dist, nprobe - 1)[:nprobe]
+        lists = self._assignments(generation, matrix, centroids)
+        subset = np.flatnonzero(np.isin(lists[rows], probe))
+        return subset if len(subset) >= k else None
+
+    def train(self, conn, nlist: Optional[int] = None, iterations: int = ANN_TRAIN_ITERATIONS,
+              sample: int = ANN_TRAIN_SAMPLE) -> dict:
+        """(Re)train the IVF centroids with k-means over the live vectors.
+
+        ``nlist`` defaults to ``4 * sqrt(n)``. Existing list assignments are
+        dropped and recomputed lazily against the new centroids.
+        """
+        import numpy as np
+        generation, matrix, rows, _ = self._live(conn)
+        if not len(rows):
+            return {"vectors": 0, "nlist": 0}
+        nlist = min(nlist or max(1, int(4 * np.sqrt(len(rows)))), len(rows))
+        rng = np.random.default_rng(0)
+        picks = np.sort(rng.choice(rows, size=min(sample, len(rows)), replace=False))
+        x = np.asarray(matrix[picks], dtype=np.float32)
+        centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._nearest_list(x, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, x)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Re-seed empty lists from random training rows
+            if empty.any():
+                centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()))]
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f"{self.name}.centroids.tmp.npy"
+        np.save(tmp, centroids.astype(np.float32))
+        for path in self.directory.glob(f"{self.name}.*.ivf"):
+            path.unlink(missing_ok=True)
+        os.replace(tmp, self._centroids_path())
+        self._assignments(generation, matrix, self._centroids())
+        return {"vectors": len(rows), "nlist": nlist}
+
+    def _search_rows(self, generation, matrix, rows, q, k: int, approximate: bool):
+        """``(positions into rows, squared distances)`` of the ``k`` nearest, nearest first."""
+        subset = self._probe(generation, matrix, rows, q, k) if approximate else None
+        candidates = rows if subset is None else rows[subset]
+        if approximate and self.quantization != "none":
+            coarse = self._coarse(self._codes(generation, matrix), candidates, q, k * self.rerank)
+            top, dist = self._exact(matrix[candidates[coarse]], q, k)
+            positions = coarse[top]
+        else:
+            positions, dist = self._exact(matrix[candidates], q, k)
+        return (positions if subset is None else subset[positions]), dist
+
+    def search(self, conn, query, k):
+        import numpy as np
+        generation, matrix, rows, keys = self._live(conn)
+        if not len(rows) or k <= 0:
+            return []
+        q = np.frombuffer(query, dtype=np.float32)
+        positions, dist = self._search_rows(generation, matrix, rows, q, k, approximate=True)
+        return [(self.key_type(keys[i]), float(np.sqrt(max(d, 0.0)))) for i, d in zip(positions, dist)]
+
+    def stats(self, conn, samples: int = 20, k: int = 10) -> dict:
+        """Size of the float rows vs. the codes, IVF state, and recall@k of approximate search.
+
+        Recall is measured by querying ``samples`` stored vectors and comparing
+        the quantized / IVF result with an exact scan.
+        """
+        import numpy as np
+        generation, matrix, rows, _ = self._live(conn)
+        result = {"engine": self.engine, "quantization": self.quantization, "dims": self.dims,
+                  "vectors": len(rows), "float_bytes": self._rows_in(self._path(generation)) * 4 * self.dim,
+                  "code_bytes": 0, "recall": None}
+        centroids = self._centroids()
+        result["ann_lists"] = 0 if centroids is None else len(centroids)
+        result["ann_active"] = centroids is not None and len(rows) >= self.ann_min_rows
+        if self.quantization != "none" and len(rows):
+            result["code_bytes"] = self._codes(generation, matrix).nbytes
+        if (self.quantization == "none" and not result["ann_active"]) or not len(rows):
+            return result
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(rows), size=min(samples, len(rows)), replace=False)
+        hits = 0
+        for pos in picks:
+            q = np.asarray(matrix[rows[pos]], dtype=np.float32)
+            exact, _ = self._search_rows(generation, matrix, rows, q, k, approximate=False)
+            approx, _ = self._search_rows(generation, matrix, rows, q, k, approximate=True)
+            hits += len(set(exact.tolist()) & set(approx.tolist())) / len(exact)
+        result["recall"] = hits / len(picks)
+        return result
+
+    def compact(self, conn):
+        """Rewrite live rows contiguously into the next generation's file."""
+        import numpy as np
+        generation = self._generation(conn, write=True)
+        self.cleanup(conn)
+        pairs = conn.execute("SELECT key, row FROM vector_rows WHERE index_name = ? ORDER BY row",
+                             (self.name,)).fetchall()
+        matrix = self._matrix(self._path(generation))
+        new_path = self._path(generation + 1)
+        rows = np.fromiter((p[1] for p in pairs), dtype=np.int64, count=len(pairs))
+        new_path.parent.mkdir(parents=True, exist_ok=True)
+        np.ascontiguousarray(matrix[rows], dtype=np.float32).tofile(new_path)
+        conn.executemany("UPDATE vector_rows SET row = ? WHERE index_name = ? AND key = ?",
+                         [(i, self.name, p[0]) for i, p in enumerate(pairs)])
+        conn.execute("UPDATE vector_indexes SET generation = ? WHERE name = ?", (generation + 1, self.name))
+        self._map_cache = (None, None, None)
+
+    def cleanup(self, conn):
+        """Delete matrix and code files of superseded generations."""
+        current = self._generation(conn)
+        for path in self.directory.glob(f"{self.name}.*.*"):
+            gen = path.suffixes[0].lstrip(".")
+            if gen.isdigit() and int(gen) < current:
+                path.unlink(missing_ok=True)
+
+
+def _flock(f):
+    try:
+        import fcntl
+        fcntl.flock(f, fcntl.LOCK_EX)
+    except ImportError:
+        pass
+
+
+class _Popcount:
+    """Lazily built 256-entry popcount table (keeps numpy import lazy)."""
+    _table = None
+
+    def __getitem__(self, index):
+        if self._table is None:
+            import numpy as np
+            self._table = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+        return self._table[index]
+
+
+_POPCOUNT = _Popcount()
+
+
+_indexes: dict[str, VectorIndex] = {}
+_vec_available: Optional[bool] = None
+
+
+def sqlite_vec_available(conn: sqlite3.Connection) -> bool:
+    global _vec_available
+    if _vec_available is None:
+        try:
+            conn.execute("SELECT vec_version()")
+            _vec_available = True
+        except sqlite3.Error:
+            _vec_available = False
+    return _vec_available
+
+
+# config.json keys only the NumPy engine reads (quantized codes, IVF)
+NUMPY_ONLY_SETTINGS = ("vector_quantization", "vector_dims", "vector_rerank", "ann_nprobe", "ann_min_rows")
+
+
+def _numpy_settings(cfg: dict) -> list[str]:
+    return [key for key in NUMPY_ONLY_SETTINGS if cfg.get(key) not in (None, "none")]
+
+
+def engine_name(conn: sqlite3.Connection) -> str:
+    """Configured engine, with ``auto`` resolved against the config and the loaded extensions."""
+    from ..config import get_config
+    cfg = get_config()
+    engine = cfg.get("vector_engine", "auto")
+    if engine == "auto":
+        # 配了量化 / IVF 就用 numpy：sqlite-vec 不支持这些设置
+        if _numpy_settings(cfg) or not sqlite_vec_available(conn):
+            return "numpy"
+        return "sqlite-vec"
+    return engine
+
+
+def ignored_settings(conn: sqlite3.Connection) -> list[str]:
+    """``NUMPY_ONLY_SETTINGS`` set in config.json that an explicitly chosen sqlite-vec ignores."""
+    from ..config import get_config
+    if engine_name(conn) == "numpy":
+        return []
+    return _numpy_settings(get_config())
+
+
+def init_index_schema(conn: sqlite3.Connection):
+    """Create the storage of the active engine (called from ``init_db``).
+
+    Records the embedding model, dimension and vector engine in
+    ``engram_meta``; when the configured backend or engine changes, both
+    indexes (and chunk rows) are cleared and every session is queued for
+    re-embedding (mostly served from the embedding cache).
+    """
+    from .embedders import get_embedder
+    embedder = get_embedder()
+    engine = engine_name(conn)
+    conn.execute("CREATE TABLE IF NOT EXISTS engram_meta (key TEXT PRIMARY KEY, value TEXT)")
+    stored = dict(conn.execute("SELECT key, value FROM engram_meta"
+                               " WHERE key IN ('embedding_model', 'embedding_dim', 'vector_engine')").fetchall())
+    # Databases from before backends were configurable hold bge-small vectors
+    stored_model = stored.get("embedding_model", DEFAULT_MODEL)
+    stored_dim = int(stored.get("embedding_dim", DEFAULT_DIM))
+    # Before the engine was recorded: vec0 tables mean sqlite-vec held the vectors
+    has_vec0 = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'vec_embeddings'").fetchone()
+    stored_engine = stored.get("vector_engine", "sqlite-vec" if has_vec0 else engine)
+
+    if engine == "sqlite-vec":
+        if stored_dim != embedder.dim:
+            conn.execute("DROP TABLE IF EXISTS vec_embeddings")
+            conn.execute("DROP TABLE IF EXISTS vec_chunks")
+        conn.executescript(VEC_SCHEMA.format(dim=embedder.dim))
+    else:
+        conn.executescript(NUMPY_SCHEMA)
+
+    if stored_model != embedder.model_id or stored_dim != embedder.dim or stored_engine != engine:
+        from .embed_queue import enqueue
+        for name in ("sessions", "chunks"):
+            get_index(name).clear(conn)
+        conn.execute("DELETE FROM embeddings WHERE source_type = 'chunk'")
+        enqueue(conn, [r[0] for r in conn.execute("SELECT id FROM sessions")])
+    conn.executemany("INSERT OR REPLACE INTO engram_meta (key, value) VALUES (?, ?)",
+                     [("embedding_model", embedder.model_id), ("embedding_dim", str(embedder.dim)),
+                      ("vector_engine", engine)])
+
+
+def get_index(name: str) -> VectorIndex:
+    """The ``sessions`` or ``chunks`` index for the configured engine."""
+    from .db import get_db
+    if name not in _indexes:
+        key_type = int if name == "chunks" else str
+        if engine_name(get_db()) == "sqlite-vec":
+            table, key_column = ("vec_chunks", "rowid") if name == "chunks" else ("vec_embeddings", "session_id")
+            _indexes[name] = SqliteVecIndex(name, table, key_column, key_type)
+        else:
+            from ..config import get_config
+            from .embedders import get_embedder
+            cfg = get_config()
+            _indexes[name] = NumpyIndex(name, key_type, dim=get_embedder().dim,
+                                        quantization=cfg.get("vector_quantization", "none"),
+                                        dims=cfg.get("vector_dims"),
+                                        rerank=cfg.get("vector_rerank", RERANK_FACTOR),
+                                        nprobe=cfg.get("ann_nprobe", ANN_NPROBE),
+                                        ann_min_rows=cfg.get("ann_min_rows", ANN_MIN_ROWS))
+    return _indexes[name]
@@ -0,0 +1,182 @@
+"""engram watch — 监听各工具的会话目录，实时增量入库。
+
+有 watchdog 时用系统文件事件（Linux inotify / macOS FSEvents），空闲时不占 CPU；
+没有则退化为按间隔做一次 stat 级增量扫描（未变化的源文件只 stat 不解析）。
+事件会先去抖（debounce），再只重新解析被改动的源文件，随后增量提炼 facts、刷新 context 文件。
+"""
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class SessionWatcher:
+    def __init__(self, extractors: list, debounce: float = 1.5, poll_interval: float = 5.0,
+                 on_ingest: Callable[[dict], None] = None,
+                 on_error: Callable[[str, Exception], None] = None):
+        self.extractors = extractors
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.on_ingest = on_ingest
+        self.on_error = on_error
+        self._paths: set[Path] = set()
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._stop = threading.Event()
+
+    def notify(self, path: str):
+        """Record a changed file; called from the file-event thread."""
+        with self._lock:
+            self._paths.add(Path(path))
+            self._last_event = time.monotonic()
+        self._event.set()
+
+    def stop(self):
+        self._stop.set()
+        self._event.set()
+
+    def _error(self, stage: str, e: Exception):
+        # 出错只跳过这一轮的这一步，守护进程继续监听
+        if self.on_error:
+            self.on_error(stage, e)
+        else:
+            logging.getLogger("engram").warning(f"watch: {stage} failed: {e}")
+
+    def _sources_for(self, extractor, paths: set[Path]) -> list[Path]:
+        roots = [r for r in extractor.watch_paths() if r]
+        sources = set()
+        for p in paths:
+            if not any(p.is_relative_to(r) for r in roots):
+                continue
+            src = extractor.source_for_path(p)
+            if src is not None and src.exists():
+                sources.add(src)
+        return sorted(sources)
+
+    def flush(self, paths: Optional[set[Path]] = None) -> dict:
+        """Ingest the sources behind ``paths`` (None = stat-scan everything).
+
+        Returns ``{tool: sessions_written}`` for tools that had changes.
+        An extractor that raises, and every source that failed to parse, is
+        reported through ``on_error`` and skipped; the rest is still ingested.
+        """
+        from .storage.db import upsert_sessions, get_sessions_brief
+        from .storage.sync_state import SyncManifest
+
+        # 每轮重新加载 manifest：其他进程（engram sync / MCP）可能已推进 offset
+        manifest = SyncManifest()
+        written: dict[str, int] = {}
+        ids: list[str] = []
+
+        def _track(sessions):
+            for s in sessions:
+                ids.append(s["id"])
+                yield s
+
+        for extractor in self.extractors:
+            sources = None if paths is None else self._sources_for(extractor, paths)
+            if sources == []:
+                continue
+            try:
+                stats = upsert_sessions(_track(extractor.extract_sessions(manifest, sources=sources)),
+                                        manifest=manifest)
+            except Exception as e:
+                self._error(extractor.name, e)
+                continue
+            if stats["sessions"]:
+                written[extractor.name] = stats["sessions"]
+        for failure in manifest.failures:
+            # 解析失败的源文件没有标记 manifest，下一轮还会重试
+            self._error(f"{failure['tool']} {failure['source']}", RuntimeError(failure["error"]))
+
+        if written:
+            from .storage.embed_queue import drain
+            from .extractor_facts import auto_extract_from_new_sessions
+            from .context_gen import update_context_files
+            try:
+                # 用库里的完整会话行提炼（追加写入的 session dict 只含新消息）
+                auto_extract_from_new_sessions(get_sessions_brief(ids))
+                drain()
+                update_context_files()
+            except Exception as e:
+                self._error("post-ingest", e)
+            if self.on_ingest:
+                self.on_ingest(written)
+        return written
+
+    def _debounce_loop(self):
+        while not self._stop.is_set():
+            self._event.wait()  # 阻塞等待，空闲时零 CPU
+            if self._stop.is_set():
+                return
+            while True:
+                with self._lock:
+                    remaining = self._last_event + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+            with self._lock:
+                self._event.clear()
+                paths, self._paths = self._paths, set()
+            if paths:
+                self.flush(paths)
+
+    def _start_observer(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return None
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                watcher.notify(event.src_path)
+                dest = getattr(event, "dest_path", "")
+                if dest:
+                    watcher.notify(dest)
+
+        observer = Observer()
+        handler = _Handler()
+        scheduled = 0
+        for extractor in self.extractors:
+            for root in extractor.watch_paths():
+                if root and root.exists():
+                    observer.schedule(handler, str(root), recursive=True)
+                    scheduled += 1
+        if not scheduled:
+            return None
+        observer.start()
+        return observer
+
+    def run(self) -> str:
+        """Catch up once, then watch until :meth:`stop`. Returns the mode used."""
+        self.flush()
+        observer = self._start_observer()
+        if observer is None:
+            while not self._stop.wait(self.poll_interval):
+                self.flush()
+            return "poll"
+        loop = threading.Thread(target=self._debounce_loop, daemon=True)
+        loop.start()
+        try:
+            while not self._stop.wait(3600):
+                pass
+        finally:
+            observer.stop()
+            observer.join()
+            self._event.set()
+        return "events"
+
+    @staticmethod
+    def has_native_events() -> bool:
+        try:
+            import watchdog  # noqa: F401
+            return True
+        except ImportError:
+            return False
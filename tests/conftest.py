@@ -0,0 +1,70 @@
+"""Shared fixtures: every test runs against its own throwaway ~/.engram."""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def engram_home(tmp_path, monkeypatch):
+    """Point HOME, the tool log directories and every engram data path at ``tmp_path``."""
+    from engram import config, context_gen
+    from engram.extractors import claude_code, openclaw
+    from engram.storage import db, embedders, memory_db, shards, vector_index
+
+    data = tmp_path / ".engram"
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(config, "CONFIG_PATH", data / "config.json")
+    monkeypatch.setattr(db, "DB_PATH", data / "engram.db")
+    monkeypatch.setattr(memory_db, "MEMORY_DB", data / "memory.db")
+    monkeypatch.setattr(shards, "SHARD_DIR", data / "shards")
+    monkeypatch.setattr(shards, "_writers", {})
+    monkeypatch.setattr(shards, "_readers", {})
+    monkeypatch.setattr(vector_index, "VECTORS_DIR", data / "vectors")
+    monkeypatch.setattr(vector_index, "_indexes", {})
+    monkeypatch.setattr(embedders, "_embedder", None)
+    monkeypatch.setattr(context_gen, "CONTEXT_FILE", data / "context.md")
+    monkeypatch.setattr(context_gen, "CORE_FILE", data / "core.md")
+    monkeypatch.setattr(context_gen, "PROJECT_CONTEXT_DIR", data / "projects")
+    monkeypatch.setattr(claude_code, "CLAUDE_DIR", tmp_path / ".claude" / "projects")
+    monkeypatch.setattr(openclaw, "OPENCLAW_DIR", tmp_path / ".openclaw" / "agents")
+    yield tmp_path
+    db.close_db()
+    memory_db.close_mem_db()
+    shards.close_all()
+
+
+@pytest.fixture
+def engram_db(engram_home):
+    """An initialized engram.db, as every command sees it after ``init_db()``."""
+    from engram.storage.db import init_db
+    init_db()
+    return engram_home
+
+
+@pytest.fixture
+def write_config(engram_home):
+    """Write config.json for the test's engram home."""
+    def write(**values):
+        path = engram_home / ".engram" / "config.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(values))
+    return write
+
+
+def make_session(sid: str, n_messages: int = 2, **fields) -> dict:
+    """A session dict shaped like the extractors' output."""
+    session = {
+        "id": sid,
+        "source_tool": "claude_code",
+        "source_path": f"/tmp/{sid}.jsonl",
+        "project": "/home/dev/engram",
+        "title": f"session {sid} about sqlite indexes",
+        "summary": "",
+        "created_at": "2026-01-15T10:00:00+00:00",
+        "tags": [],
+        "messages": [{"role": "user" if i % 2 == 0 else "assistant",
+                      "content": f"message {i} of {sid}", "timestamp": ""}
+                     for i in range(n_messages)],
+    }
+    session.update(fields)
+    return session
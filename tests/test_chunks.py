@@ -0,0 +1,57 @@
+"""Chunk rows locate their text in messages; the vectors live only in the chunks index."""
+from engram.storage.chunks import chunk_messages, joined_text
+from engram.storage.db import get_db, upsert_sessions
+
+from conftest import make_session
+
+
+def _long_session(sid):
+    session = make_session(sid, n_messages=4)
+    bodies = ["  short opener  ", "", "the walrus parser " * 120, "closing note about the manifest " * 40]
+    for m, body in zip(session["messages"], bodies):
+        m["content"] = body
+    return session
+
+
+def test_offsets_rebuild_every_chunk():
+    messages = _long_session("x")["messages"]
+    chunks = chunk_messages(messages)
+    assert len(chunks) > 5
+    for index, offset, text in chunks:
+        rows = [(m["content"],) for m in messages[index:]]
+        assert joined_text(rows, offset + len(text))[offset:offset + len(text)] == text
+
+
+def test_chunk_rows_store_positions_only(engram_home, write_config):
+    from engram.storage.db import init_db
+    from engram.storage.embed_queue import drain
+    from engram.storage.vector import vector_search_chunks
+    write_config(embedding_backend="hashing", vector_engine="numpy")
+    init_db()
+    upsert_sessions([_long_session("long"), make_session("other", title="unrelated")])
+    stats = drain()
+    assert stats["chunks"] > 5
+
+    conn = get_db()
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(embeddings)")}
+    assert not {"chunk", "embedding"} & columns
+    assert conn.execute("SELECT COUNT(*) FROM embeddings WHERE char_length IS NULL").fetchone()[0] == 0
+
+    hits = vector_search_chunks("closing note about the manifest", limit=2)
+    best = next(h for h in hits if h["session_id"] == "long")
+    assert best["chunk"] and "closing note about the manifest" in best["chunk"]
+    assert best["message_offset"] in (2, 3)
+
+
+def test_embedding_cache_is_read_in_slices(engram_home, write_config, monkeypatch):
+    from engram.storage import retention
+    from engram.storage.db import init_db
+    from engram.storage.vector import embed_texts
+    write_config(embedding_backend="hashing")
+    init_db()
+    monkeypatch.setattr(retention, "ID_SLICE", 3)
+    texts = [f"text {i}" for i in range(8)]
+    first = embed_texts(texts)
+    assert get_db().execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] == 8
+    # Every vector now comes from the cache, across several slices
+    assert embed_texts(texts + ["text 0"]) == first + first[:1]
@@ -0,0 +1,50 @@
+"""engram compact: dictionary-compressed message bodies read back unchanged."""
+import pytest
+
+pytest.importorskip("zstandard")
+
+from engram.storage import compression
+from engram.storage.db import get_db, get_session, search_sessions, upsert_sessions
+
+from conftest import make_session
+
+TOPICS = ["sqlite page cache", "zstd dictionary training", "vector index compaction", "fts5 trigram tokenizer"]
+
+
+def _sessions(n):
+    for i in range(n):
+        session = make_session(f"z{i}", n_messages=4)
+        for j, m in enumerate(session["messages"]):
+            m["content"] = (f"Session {i} turn {j}: we looked at the {TOPICS[(i + j) % 4]} again and "
+                            f"decided to keep the batch size at {100 + i} rows because the WAL stays small "
+                            f"and checkpoints finish before the next sync starts.")
+        yield session
+
+
+def test_compact_round_trip(engram_db, write_config):
+    upsert_sessions(_sessions(80), embed=False)
+    before = get_session("z7")["messages"]
+
+    stats = compression.compact()
+    assert stats["rows"] == 320
+    assert stats["bytes_after"] < stats["bytes_before"]
+    conn = get_db()
+    assert conn.execute("SELECT COUNT(*) FROM messages WHERE typeof(content) = 'text'").fetchone()[0] == 0
+    assert get_session("z7")["messages"] == before
+    assert "z7" in {s["id"] for s in search_sessions("batch size at 107")}
+
+    # New rows are compressed once compression is switched on
+    write_config(message_compression="zstd")
+    upsert_sessions(_sessions(81), embed=False)
+    assert conn.execute("SELECT typeof(content) FROM messages WHERE session_id = 'z80'").fetchone()[0] == "blob"
+
+    stats = compression.decompress_all()
+    assert stats["rows"] == 324
+    assert conn.execute("SELECT COUNT(*) FROM messages WHERE typeof(content) = 'blob'").fetchone()[0] == 0
+    assert get_session("z7")["messages"] == before
+
+
+def test_compact_needs_enough_messages(engram_db):
+    upsert_sessions(_sessions(3), embed=False)
+    with pytest.raises(ValueError):
+        compression.compact()
@@ -0,0 +1,175 @@
+"""Every extractor end to end through extract_sessions(), with and without a manifest."""
+import json
+import shutil
+import sqlite3
+
+import pytest
+
+from engram.extractors import ALL_EXTRACTORS
+
+
+def _jsonl(path, entries):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as fh:
+        for entry in entries:
+            fh.write(json.dumps(entry) + "\n")
+
+
+def _claude_code(home):
+    _jsonl(home / ".claude" / "projects" / "-home-dev-engram" / "a1.jsonl", [
+        {"role": "user", "content": "why is sync slow", "timestamp": "2026-03-01T09:00:00Z"},
+        {"role": "assistant", "content": [{"type": "text", "text": "one commit per session"}],
+         "timestamp": "2026-03-01T09:00:05Z"},
+    ])
+
+
+def _openclaw(home):
+    _jsonl(home / ".openclaw" / "agents" / "main" / "sessions" / "b2.jsonl", [
+        {"type": "session", "cwd": "/home/dev/engram", "timestamp": "2026-03-01T09:00:00Z"},
+        {"type": "message", "message": {"role": "user", "content": "add a tail reader"}},
+        {"type": "message", "message": {"role": "assistant", "content": [{"type": "text", "text": "done"}]}},
+    ])
+
+
+def _opencode(home):
+    base = home / ".local" / "share" / "opencode" / "storage"
+    files = {
+        base / "session" / "global" / "ses_c3.json":
+            {"id": "ses_c3", "title": "trigram search", "directory": "/home/dev/engram",
+             "time": {"created": 1772355600000}},
+        base / "message" / "ses_c3" / "msg_1.json": {"id": "msg_1", "role": "user", "time": {"created": 1772355600000}},
+        base / "message" / "ses_c3" / "msg_2.json": {"id": "msg_2", "role": "assistant"},
+        base / "part" / "msg_1" / "prt_1.json": {"type": "text", "text": "index CJK text"},
+        base / "part" / "msg_2" / "prt_1.json": {"type": "text", "text": "use the trigram tokenizer"},
+    }
+    for path, body in files.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(body))
+
+
+def _cursor(home):
+    db_path = home / ".config" / "Cursor" / "User" / "workspaceStorage" / "d4e5f6" / "state.vscdb"
+    db_path.parent.mkdir(parents=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")  # as Cursor itself leaves it
+    conn.execute("CREATE TABLE ItemTable (key TEXT PRIMARY KEY, value TEXT)")
+    chat = {"tabs": [{"bubbles": [{"type": "user", "text": "explain the WAL"}, {"type": "ai", "text": "write-ahead log"}]}]}
+    conn.execute("INSERT INTO ItemTable VALUES ('workbench.panel.aichat.view.aichat.chatdata', ?)", (json.dumps(chat),))
+    conn.commit()
+    conn.close()
+
+
+FIXTURES = {"claude_code": _claude_code, "openclaw": _openclaw, "opencode": _opencode, "cursor": _cursor}
+
+
+@pytest.fixture(params=[e.name for e in ALL_EXTRACTORS])
+def extractor(request, engram_home):
+    FIXTURES[request.param](engram_home)
+    return next(e for e in ALL_EXTRACTORS if e.name == request.param)
+
+
+def test_extract_sessions(extractor):
+    assert extractor.is_available()
+    sessions = list(extractor.extract_sessions())
+    assert len(sessions) == 1
+    session = sessions[0]
+    assert session["source_tool"] == extractor.name
+    assert [m["role"] for m in session["messages"]] == ["user", "assistant"]
+    assert all(m["content"] for m in session["messages"])
+
+
+def test_extract_sessions_with_manifest(engram_db, extractor):
+    from engram.storage.db import upsert_sessions
+    from engram.storage.sync_state import SyncManifest
+
+    manifest = SyncManifest()
+    stats = upsert_sessions(extractor.extract_sessions(manifest), manifest=manifest)
+    assert stats["sessions"] == 1
+    assert stats["messages"] == 2
+
+    # Unchanged sources are skipped on the next run
+    manifest = SyncManifest()
+    assert list(extractor.extract_sessions(manifest)) == []
+    assert manifest.skipped == 1
+
+
+def test_sources_are_parsed_outside_the_write_transaction(engram_db):
+    from engram.storage.db import get_db, upsert_sessions
+    from conftest import make_session
+    seen = []
+
+    def parse():
+        for i in range(5):
+            seen.append(get_db().in_transaction)
+            yield make_session(f"s{i}")
+    stats = upsert_sessions(parse(), batch_size=2)
+    assert stats["sessions"] == 5
+    assert seen == [False] * 5
+
+
+def _sync(extractor):
+    from engram.storage.db import upsert_sessions
+    from engram.storage.sync_state import SyncManifest
+    manifest = SyncManifest()
+    return upsert_sessions(extractor.extract_sessions(manifest), manifest=manifest)
+
+
+@pytest.mark.parametrize("name", ["claude_code", "openclaw"])
+def test_tail_append_adds_only_new_messages(engram_db, name):
+    from engram.storage.db import get_session
+    FIXTURES[name](engram_db)
+    extractor = next(e for e in ALL_EXTRACTORS if e.name == name)
+    source = next(extractor.iter_sources())
+    _sync(extractor)
+    sid = extractor.make_session_id(name, str(source))
+    assert get_session(sid)["message_count"] == 2
+
+    if name == "claude_code":
+        new = [{"role": "user", "content": "and the manifest?"}, {"role": "assistant", "content": "stat first"}]
+    else:
+        new = [{"type": "message", "message": {"role": "user", "content": "and the manifest?"}},
+               {"type": "message", "message": {"role": "assistant", "content": "stat first"}}]
+    _jsonl(source, new)
+    # A line still being written (no newline yet) waits for the next run
+    with open(source, "a") as fh:
+        fh.write('{"role": "user", "content": "half')
+
+    stats = _sync(extractor)
+    assert stats["messages"] == 2
+    session = get_session(sid)
+    assert session["message_count"] == 4
+    assert [m["content"] for m in session["messages"]][-2:] == ["and the manifest?", "stat first"]
+    # The first user message still titles the session
+    assert session["title"] in ("why is sync slow", "add a tail reader")
+
+
+def test_tail_restarts_after_rewrite(engram_db):
+    from engram.storage.db import get_session
+    _claude_code(engram_db)
+    extractor = next(e for e in ALL_EXTRACTORS if e.name == "claude_code")
+    source = next(extractor.iter_sources())
+    _sync(extractor)
+
+    source.write_text(json.dumps({"role": "user", "content": "a different conversation"}) + "\n")
+    _sync(extractor)
+    session = get_session(extractor.make_session_id("claude_code", str(source)))
+    assert [m["content"] for m in session["messages"]] == ["a different conversation"]
+
+
+def test_failed_source_is_retried(engram_db):
+    from engram.storage.sync_state import SyncManifest
+    extractor = next(e for e in ALL_EXTRACTORS if e.name == "cursor")
+    db_path = engram_db / ".config" / "Cursor" / "User" / "workspaceStorage" / "d4e5f6" / "state.vscdb"
+    db_path.parent.mkdir(parents=True)
+    db_path.write_bytes(b"not a database" * 100)
+
+    assert _sync(extractor)["sessions"] == 0
+    manifest = SyncManifest()
+    assert list(extractor.extract_sessions(manifest)) == []
+    assert [f["source"] for f in manifest.failures] == [str(db_path)]
+    # Not marked done: the source is checked again, not skipped as unchanged
+    assert manifest.skipped == 0
+
+    shutil.rmtree(db_path.parent)
+    _cursor(engram_db)
+    assert _sync(extractor)["sessions"] == 1
@@ -0,0 +1,93 @@
+"""since / until / project filters: parsing in session_filter() and results of list_sessions()."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from engram.storage.db import filter_time, normalize_project, session_filter
+
+from conftest import make_session
+
+
+def test_empty_filter():
+    assert session_filter(None) == ("1", {})
+    assert session_filter({"tool": None, "since": "", "project": None}) == ("1", {})
+
+
+def test_tool_and_dates():
+    where, params = session_filter({"tool": "cursor", "since": "2026-01-01", "until": "2026-01-31"}, alias="x")
+    assert where == "x.source_tool = :f_tool AND x.started_at >= :f_since AND x.started_at <= :f_until"
+    assert params == {"f_tool": "cursor", "f_since": "2026-01-01 00:00:00", "f_until": "2026-01-31 23:59:59"}
+
+
+@pytest.mark.parametrize("value, delta", [("30m", timedelta(minutes=30)), ("12h", timedelta(hours=12)),
+                                          ("7d", timedelta(days=7)), ("2w", timedelta(weeks=2))])
+def test_relative_since(value, delta):
+    since = datetime.strptime(session_filter({"since": value})[1]["f_since"], "%Y-%m-%d %H:%M:%S")
+    expected = datetime.now(timezone.utc).replace(tzinfo=None) - delta
+    assert abs((since - expected).total_seconds()) < 5
+
+
+def test_iso_times_are_converted_to_utc():
+    assert filter_time("2026-03-01T12:00:00+08:00") == "2026-03-01 04:00:00"
+    assert filter_time("2026-03-01T12:00:00Z") == "2026-03-01 12:00:00"
+
+
+@pytest.mark.parametrize("value", ["yesterday", "7 days", "2026-13-01", "-3d"])
+def test_bad_time_raises(value):
+    with pytest.raises(ValueError):
+        session_filter({"since": value})
+
+
+def test_project_name_vs_path():
+    where, params = session_filter({"project": "engram"})
+    assert where == "s.project_name = :f_project" and params == {"f_project": "engram"}
+    where, params = session_filter({"project": "C:\\code\\engram\\"})
+    assert where == "s.project_path = :f_project" and params == {"f_project": "C:/code/engram"}
+
+
+def test_project_prefix():
+    where, params = session_filter({"project_prefix": "/home/dev/"})
+    assert params == {"f_prefix": "/home/dev"}
+    assert "s.project_path >= :f_prefix || '/'" in where
+
+
+def test_normalize_project():
+    assert normalize_project("") is None
+    assert normalize_project("/") == "/"
+    assert normalize_project("~/code/x/").endswith("/code/x")
+
+
+def test_list_sessions_filters(engram_home):
+    from engram.storage.db import list_sessions, upsert_sessions
+    upsert_sessions([
+        make_session("a", project="/home/dev/engram", created_at="2026-01-10T09:00:00Z"),
+        make_session("b", project="/home/dev/engram/web", created_at="2026-02-10T09:00:00Z"),
+        make_session("c", project="/home/dev/engram-old", created_at="2026-03-10T09:00:00Z", source_tool="cursor"),
+        make_session("d", project="/srv/other", created_at="2026-03-20T09:00:00Z"),
+    ], embed=False)
+
+    def ids(**kw):
+        return sorted(s["id"] for s in list_sessions(**kw))
+
+    assert ids(project="engram") == ["a"]
+    assert ids(project="/home/dev/engram/") == ["a"]
+    assert ids(project_prefix="/home/dev/engram") == ["a", "b"]
+    assert ids(project_prefix="/home/dev") == ["a", "b", "c"]
+    assert ids(since="2026-02-01") == ["b", "c", "d"]
+    assert ids(since="2026-02-01", until="2026-03-10") == ["b", "c"]
+    assert ids(tool="cursor", project_prefix="/home") == ["c"]
+    with pytest.raises(ValueError):
+        list_sessions(since="yesterday")
+
+
+def test_list_sessions_skip_noise(engram_db):
+    from engram.storage.db import list_sessions, upsert_sessions
+    upsert_sessions([
+        make_session("real", project="/home/dev/engram"),
+        make_session("hb", title="HEARTBEAT_OK", project="/home/dev/engram"),
+        make_session("home", project="/home/dev/.openclaw/workspace"),
+    ], embed=False)
+    assert {s["id"] for s in list_sessions()} == {"real", "hb", "home"}
+    listed = list_sessions(skip_noise=True)
+    assert [(s["id"], s["project_name"]) for s in listed] == [("real", "engram")]
+    assert list_sessions(skip_noise=True, since="2999-01-01 00:00:00") == []
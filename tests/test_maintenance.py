@@ -0,0 +1,47 @@
+"""engram optimize: FTS merges, incremental vacuum and the automatic trigger."""
+import sqlite3
+
+from engram.storage import maintenance
+from engram.storage.db import get_db, search_sessions, transaction, upsert_sessions
+
+from conftest import make_session
+
+
+def test_optimize_converts_to_incremental_vacuum(engram_home):
+    from engram.storage.db import DB_PATH, init_db
+    # A file created before auto_vacuum=INCREMENTAL was the default
+    DB_PATH.parent.mkdir(parents=True)
+    old = sqlite3.connect(DB_PATH)
+    old.execute("CREATE TABLE engram_meta (key TEXT PRIMARY KEY, value TEXT)")
+    old.close()
+    init_db()
+    assert get_db().execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    upsert_sessions([make_session(f"s{i}", title=f"walrus {i}") for i in range(30)], embed=False)
+    with transaction() as conn:
+        conn.execute("DELETE FROM messages WHERE session_id NOT IN ('s0', 's1')")
+        conn.execute("DELETE FROM sessions WHERE id NOT IN ('s0', 's1')")
+
+    reports = {r["db"]: r for r in maintenance.optimize()}
+    assert set(reports) == {"engram.db", "memory.db"}
+    report = reports["engram.db"]
+    assert report["vacuumed"] and report["fts_tables"] >= 4
+    assert report["wal_after"] == 0
+    conn = get_db()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == maintenance.AUTO_VACUUM_INCREMENTAL
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    # Session FTS rows still point at the right sessions after VACUUM renumbered rowids
+    assert {s["id"] for s in search_sessions("walrus")} == {"s0", "s1"}
+
+    # Once converted, later runs only vacuum incrementally
+    assert not {r["db"]: r for r in maintenance.optimize()}["engram.db"]["vacuumed"]
+
+
+def test_due(engram_db, write_config):
+    write_config(auto_optimize_sessions=3)
+    upsert_sessions([make_session("a"), make_session("b")], embed=False)
+    assert maintenance.due() is None
+    upsert_sessions([make_session("c")], embed=False)
+    assert maintenance.due() == "3 sessions written since last optimize"
+
+    write_config(auto_optimize_sessions=3, auto_optimize=False)
+    assert maintenance.due() is None
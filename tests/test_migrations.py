@@ -0,0 +1,141 @@
+"""The schema migration chain: fresh databases and upgrades from the first release."""
+import sqlite3
+
+import pytest
+
+from engram.storage.db import MIGRATIONS, get_db, get_session, init_db, search_sessions, upsert_sessions
+from engram.storage.migrations import migrate, user_version
+
+from conftest import make_session
+
+# engram.db as the first release created it (minus the sqlite-vec table, which needs the extension)
+BASELINE_SCHEMA = """
+CREATE TABLE sessions (
+    id TEXT PRIMARY KEY, source_tool TEXT NOT NULL, source_path TEXT, project TEXT, title TEXT,
+    summary TEXT, message_count INTEGER DEFAULT 0, created_at TEXT,
+    imported_at TEXT DEFAULT (datetime('now')), tags TEXT DEFAULT '[]'
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL REFERENCES sessions(id),
+    role TEXT NOT NULL, content TEXT NOT NULL, timestamp TEXT, has_images INTEGER DEFAULT 0
+);
+CREATE VIRTUAL TABLE sessions_fts USING fts5(id UNINDEXED, title, summary);
+CREATE VIRTUAL TABLE messages_fts USING fts5(session_id UNINDEXED, content);
+CREATE TABLE memories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, content TEXT NOT NULL, source_tool TEXT,
+    source_session_id TEXT, tags TEXT DEFAULT '[]', created_at TEXT DEFAULT (datetime('now'))
+);
+CREATE VIRTUAL TABLE memories_fts USING fts5(id UNINDEXED, content);
+CREATE TABLE embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, message_id INTEGER, chunk TEXT NOT NULL,
+    embedding BLOB, source_type TEXT DEFAULT 'message'
+);
+"""
+
+INDEXES = {"idx_messages_session", "idx_sessions_imported", "idx_sessions_tool_imported", "idx_embeddings_session",
+           "idx_sessions_listed", "idx_sessions_started", "idx_sessions_tool_started", "idx_sessions_project_path",
+           "idx_sessions_project_name", "idx_sessions_noise"}
+COLUMNS = {"content_hash", "shard", "is_noise", "project_name", "project_path", "started_at"}
+
+
+def _names(conn, kind):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def _check_current(conn):
+    assert user_version(conn) == len(MIGRATIONS)
+    assert INDEXES <= _names(conn, "index")
+    assert COLUMNS <= {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}
+    assert {"sessions_fts_ai", "sessions_fts_ad", "sessions_fts_au", "messages_fts_ai", "messages_fts_ad",
+            "memories_fts_ai"} <= _names(conn, "trigger")
+    assert {"sessions_tri", "messages_tri", "memories_tri", "zstd_dicts"} <= _names(conn, "table")
+    assert "messages_text" in _names(conn, "view")
+
+
+def test_fresh_database(engram_home):
+    init_db()
+    conn = get_db()
+    _check_current(conn)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+    upsert_sessions([make_session("fresh", title="zeppelin docking procedures")], embed=False)
+    assert conn.execute("SELECT COUNT(*) FROM sessions_fts WHERE sessions_fts MATCH 'zeppelin'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'fresh'").fetchone()[0] == 2
+    # CJK and mid-word substrings go through the trigram tables
+    upsert_sessions([make_session("cjk", title="修复向量索引的内存泄漏")], embed=False)
+    assert [s["id"] for s in search_sessions("内存泄漏")] == ["cjk"]
+    assert [s["id"] for s in search_sessions("量索")] == ["cjk"]
+
+
+def test_upgrade_from_baseline(engram_home):
+    path = engram_home / ".engram" / "engram.db"
+    path.parent.mkdir(parents=True)
+    old = sqlite3.connect(path)
+    old.executescript(BASELINE_SCHEMA)
+    old.execute("INSERT INTO sessions (id, source_tool, project, title, summary, message_count, created_at,"
+                " imported_at) VALUES ('old1', 'claude_code', '/home/dev/engram/', 'tune the walrus parser',"
+                " 'done', 2, '2025-06-01T08:30:00Z', '2025-06-02 10:00:00')")
+    old.execute("INSERT INTO sessions (id, source_tool, project, title, imported_at)"
+                " VALUES ('old2', 'openclaw', '', 'HEARTBEAT_OK', '2025-06-03 10:00:00')")
+    old.executemany("INSERT INTO messages (session_id, role, content) VALUES ('old1', ?, ?)",
+                    [("user", "the walrus operator breaks"), ("assistant", "quote it")])
+    old.execute("INSERT INTO sessions_fts (id, title, summary) VALUES ('old1', 'tune the walrus parser', 'done')")
+    old.executemany("INSERT INTO embeddings (session_id, message_id, chunk, embedding, source_type)"
+                    " VALUES ('old1', 1, ?, x'00', 'chunk')", [("operator breaks\nquote it",), ("since rewritten",)])
+    old.commit()
+    old.close()
+
+    init_db()
+    conn = get_db()
+    _check_current(conn)
+    assert {"byte_offset", "head_hash", "cursor"} <= {r[1] for r in conn.execute("PRAGMA table_info(sync_state)")}
+    assert "message_offset" in {r[1] for r in conn.execute("PRAGMA table_info(embeddings)")}
+
+    # Chunk rows keep their position instead of a copy of the text and the vector
+    from engram.storage.chunks import chunk_text
+    assert not {"chunk", "embedding"} & {r[1] for r in conn.execute("PRAGMA table_info(embeddings)")}
+    chunks = [tuple(r) for r in conn.execute("SELECT id, char_offset, char_length FROM embeddings ORDER BY id")]
+    assert chunks == [(1, 11, 24), (2, None, None)]
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'embeddings'").fetchone()[0] == 2
+    assert chunk_text(conn, "old1", 1, 11, 24) == "operator breaks\nquote it"
+
+    row = dict(conn.execute("SELECT * FROM sessions WHERE id = 'old1'").fetchone())
+    assert row["project_path"] == "/home/dev/engram"
+    assert row["project_name"] == "engram"
+    assert row["started_at"] == "2025-06-01 08:30:00"
+    assert row["is_noise"] == 0 and row["shard"] is None
+    row = dict(conn.execute("SELECT * FROM sessions WHERE id = 'old2'").fetchone())
+    assert row["is_noise"] == 1 and row["project_name"] is None
+    assert row["started_at"] == "2025-06-03 10:00:00"  # no created_at: falls back to imported_at
+
+    # FTS tables were rebuilt over the existing rows
+    assert conn.execute("SELECT COUNT(*) FROM sessions_fts WHERE sessions_fts MATCH 'walrus'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'walrus'").fetchone()[0] == 1
+    assert [s["id"] for s in search_sessions("walrus")] == ["old1"]
+    assert [m["content"] for m in get_session("old1")["messages"]] == ["the walrus operator breaks", "quote it"]
+
+    # Old rows and new writes coexist
+    upsert_sessions([make_session("new1", title="walrus follow-up")], embed=False)
+    assert {s["id"] for s in search_sessions("walrus")} == {"old1", "new1"}
+
+
+def test_migrate_resumes_and_is_idempotent(engram_home):
+    path = engram_home / "partial.db"
+    conn = sqlite3.connect(path)
+    steps = ["CREATE TABLE t (a INTEGER)", "ALTER TABLE t ADD COLUMN b TEXT", "CREATE INDEX idx_t_b ON t(b)"]
+    assert migrate(conn, steps[:2]) == 2
+    assert migrate(conn, steps) == 3
+    assert migrate(conn, steps) == 3
+    assert {r[1] for r in conn.execute("PRAGMA table_info(t)")} == {"a", "b"}
+    assert "idx_t_b" in _names(conn, "index")
+    conn.close()
+
+
+def test_failed_step_rolls_back(engram_home):
+    conn = sqlite3.connect(engram_home / "failing.db")
+    steps = ["CREATE TABLE t (a INTEGER)", "CREATE TABLE u (x); INSERT INTO nope VALUES (1)"]
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn, steps)
+    assert user_version(conn) == 1
+    assert "u" not in _names(conn, "table")
+    conn.close()
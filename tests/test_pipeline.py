@@ -0,0 +1,35 @@
+"""The parallel pipeline writes the same sessions as a serial sync."""
+from engram.extractors import ALL_EXTRACTORS
+from engram.pipeline import run_pipeline
+from engram.storage.db import get_db
+from engram.storage.sync_state import SyncManifest
+
+from test_extractors import FIXTURES
+
+
+def test_pipeline_matches_serial_sync(engram_db):
+    for make in FIXTURES.values():
+        make(engram_db)
+    result = run_pipeline(ALL_EXTRACTORS, SyncManifest(), jobs=2, queue_depth=2, batch_size=1)
+    assert result["errors"] == 0
+    assert result["parsed"] == {name: 1 for name in FIXTURES}
+    assert result["write"]["sessions"] == 4
+    assert get_db().execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 8
+
+    # Every source was marked done: a second run parses nothing
+    manifest = SyncManifest()
+    assert run_pipeline(ALL_EXTRACTORS, manifest, jobs=2)["parsed"] == {name: 0 for name in FIXTURES}
+    assert manifest.skipped == 4
+
+
+def test_pipeline_reports_failed_source(engram_db):
+    db_path = engram_db / ".config" / "Cursor" / "User" / "workspaceStorage" / "d4e5f6" / "state.vscdb"
+    db_path.parent.mkdir(parents=True)
+    db_path.write_bytes(b"not a database" * 100)
+    cursor = [e for e in ALL_EXTRACTORS if e.name == "cursor"]
+
+    result = run_pipeline(cursor, SyncManifest(), jobs=2)
+    assert [f["source"] for f in result["failures"]] == [str(db_path)]
+    manifest = SyncManifest()
+    assert run_pipeline(cursor, manifest, jobs=2)["errors"] == 1
+    assert manifest.skipped == 0
@@ -0,0 +1,79 @@
+"""delete_sessions() and the engram prune rules."""
+import pytest
+
+from engram.storage import retention
+from engram.storage.db import delete_sessions, get_db, get_session, init_db, upsert_sessions
+
+from conftest import make_session
+
+
+def _count(sql, *args):
+    return get_db().execute(sql, args).fetchone()[0]
+
+
+@pytest.mark.parametrize("layout", ["single", "sharded"])
+def test_delete_sessions_leaves_tombstones(engram_home, write_config, layout):
+    write_config(storage_layout=layout)
+    init_db()
+    upsert_sessions([make_session("keep", 3), make_session("drop", 4, title="drop me: tombstone test")])
+    assert _count("SELECT COUNT(*) FROM pending_embeddings") == 2
+
+    stats = delete_sessions(["drop", "drop", "missing"])
+    assert stats == {"sessions": 1, "messages": 4}
+    assert get_session("drop") is None
+    assert get_session("keep")["message_count"] == 3
+    assert len(get_session("keep")["messages"]) == 3
+    assert _count("SELECT COUNT(*) FROM pending_embeddings WHERE session_id = 'drop'") == 0
+    assert _count("SELECT COUNT(*) FROM sessions_fts WHERE sessions_fts MATCH 'tombstone'") == 0
+    assert _count("SELECT COUNT(*) FROM pruned_sessions WHERE id = 'drop'") == 1
+    # Ids that were not there are not tombstoned
+    assert _count("SELECT COUNT(*) FROM pruned_sessions WHERE id = 'missing'") == 0
+    assert upsert_sessions([make_session("missing", 2)])["sessions"] == 1
+
+    # A re-sync does not bring it back; known sessions still update
+    stats = upsert_sessions([make_session("drop", 5), make_session("keep", 6)])
+    assert stats["sessions"] == 1
+    assert get_session("drop") is None
+    assert get_session("keep")["message_count"] == 6
+
+    # sync --full (force) re-imports it and drops the tombstone
+    assert upsert_sessions([make_session("drop", 5)], force=True)["sessions"] == 1
+    assert get_session("drop")["message_count"] == 5
+    assert _count("SELECT COUNT(*) FROM pruned_sessions") == 0
+
+
+def test_delete_sessions_batches(engram_db):
+    upsert_sessions([make_session(f"s{i}") for i in range(7)], embed=False)
+    progress = []
+    delete_sessions([f"s{i}" for i in range(7)], batch_size=3, on_progress=lambda d, t: progress.append((d, t)))
+    assert progress == [(3, 7), (6, 7), (7, 7)]
+    assert _count("SELECT COUNT(*) FROM sessions") == 0
+    assert _count("SELECT COUNT(*) FROM messages") == 0
+
+
+def test_noise_rule_only_deletes_pattern_matches(engram_db):
+    upsert_sessions([
+        make_session("hb", title="Read HEARTBEAT.md and report"),
+        make_session("cron", title="A cron job nightly-backup just completed"),
+        make_session("short", title="fix bug"),  # is_noise (too short) but a real session
+        make_session("real", title="refactor the sync manifest"),
+    ], embed=False)
+    assert _count("SELECT COUNT(*) FROM sessions WHERE is_noise = 1") == 3
+
+    plan = retention.prune({"noise": True}, dry_run=True)
+    assert plan["matched"] == {"noise": 2} and plan["dry_run"]
+    assert _count("SELECT COUNT(*) FROM sessions") == 4
+
+    retention.prune({"noise": True})
+    assert sorted(r[0] for r in get_db().execute("SELECT id FROM sessions")) == ["real", "short"]
+
+
+def test_age_and_cap_rules(engram_db):
+    upsert_sessions([
+        make_session("old", created_at="2020-01-01T00:00:00Z"),
+        make_session("a", created_at="2026-01-01T00:00:00Z", source_tool="cursor"),
+        make_session("b", created_at="2026-02-01T00:00:00Z", source_tool="cursor"),
+        make_session("c", created_at="2026-03-01T00:00:00Z", source_tool="cursor"),
+    ], embed=False)
+    found = retention.candidates(get_db(), {"max_age_days": 365, "max_per_tool": {"cursor": 2}})
+    assert found == {"max_age_days": ["old"], "max_per_tool": ["a"]}
@@ -0,0 +1,46 @@
+"""Month-sharded message storage: migration, routing and fan-out reads."""
+from engram.storage import shards
+from engram.storage.db import get_db, get_session, search_sessions, upsert_sessions
+
+from conftest import make_session
+
+
+def test_shard_key():
+    assert shards.shard_key("2026-01-15T10:00:00+00:00") == "2026-01"
+    assert shards.shard_key(1772355600000) == "2026-03"
+    assert shards.shard_key(1772355600) == "2026-03"
+    assert shards.shard_key("") == shards.UNDATED
+    assert shards.shard_key(None) == shards.UNDATED
+
+
+def test_enable_moves_messages_and_routes_new_sessions(engram_db):
+    upsert_sessions([make_session("jan", title="walrus parser"),
+                     make_session("mar", created_at="2026-03-02T08:00:00Z"),
+                     make_session("nodate", created_at=None)], embed=False)
+    before = get_session("jan")["messages"]
+
+    stats = shards.enable()
+    assert stats == {"sessions": 3, "messages": 6, "shards": 3}
+    assert shards.enabled()
+    conn = get_db()
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 0
+    assert dict(conn.execute("SELECT id, shard FROM sessions").fetchall()) == {
+        "jan": "2026-01", "mar": "2026-03", "nodate": shards.UNDATED}
+    assert get_session("jan")["messages"] == before
+    assert [s["id"] for s in search_sessions("walrus")] == ["jan"]
+    assert "mar" in {s["id"] for s in search_sessions("message of mar")}
+
+    # New sessions go straight to their month's shard
+    upsert_sessions([make_session("feb", created_at="2026-02-10T00:00:00Z")], embed=False)
+    assert conn.execute("SELECT shard FROM sessions WHERE id = 'feb'").fetchone()[0] == "2026-02"
+    assert {st["shard"]: st["messages"] for st in shards.stats()} == {
+        "2026-03": 2, "2026-02": 2, "2026-01": 2, shards.UNDATED: 2}
+    assert len(get_session("feb")["messages"]) == 2
+
+
+def test_freeze_takes_cold_shards_out_of_wal(engram_db):
+    upsert_sessions([make_session("old", created_at="2020-05-01T00:00:00Z")], embed=False)
+    shards.enable()
+    assert shards.freeze() == ["2020-05"]
+    assert {st["shard"]: st["journal"] for st in shards.stats()} == {"2020-05": "delete"}
+    assert len(get_session("old")["messages"]) == 2
@@ -0,0 +1,172 @@
+"""The VectorIndex contract, run against every engine that can load here."""
+import numpy as np
+import pytest
+
+from engram.storage import vector_index
+from engram.storage.db import get_db, transaction
+
+
+def _vec(i: int, dim: int) -> bytes:
+    v = np.zeros(dim, dtype=np.float32)
+    v[i % dim] = 1.0
+    v[(i + 1) % dim] = 0.5
+    return v.tobytes()
+
+
+@pytest.fixture(params=["numpy", "sqlite-vec"])
+def index(request, engram_home, write_config):
+    write_config(vector_engine=request.param)
+    from engram.storage.db import init_db
+    if request.param == "sqlite-vec" and not vector_index.sqlite_vec_available(get_db()):
+        pytest.skip("sqlite-vec extension not loadable")
+    init_db()
+    return vector_index.get_index("sessions")
+
+
+def test_add_search_remove(index):
+    from engram.storage.embedders import get_embedder
+    dim = get_embedder().dim
+    with transaction() as conn:
+        index.add(conn, [(f"s{i}", _vec(i, dim)) for i in range(20)])
+        assert index.count(conn) == 20
+        hits = index.search(conn, _vec(7, dim), 3)
+        assert hits[0][0] == "s7" and hits[0][1] == pytest.approx(0.0, abs=1e-4)
+        assert [d for _, d in hits] == sorted(d for _, d in hits)
+
+        index.add(conn, [("s7", _vec(12, dim))])  # replace
+        assert index.count(conn) == 20
+        assert {k for k, _ in index.search(conn, _vec(12, dim), 2)} == {"s7", "s12"}
+
+        index.remove(conn, ["s7", "s12"])
+        assert index.count(conn) == 18
+        assert "s7" not in {k for k, _ in index.search(conn, _vec(12, dim), 5)}
+
+        index.clear(conn)
+        assert index.count(conn) == 0
+        assert index.search(conn, _vec(1, dim), 3) == []
+
+
+def test_numpy_compaction_keeps_vectors(engram_home, write_config, monkeypatch):
+    write_config(vector_engine="numpy")
+    from engram.storage.db import init_db
+    init_db()
+    monkeypatch.setattr(vector_index, "COMPACT_MIN", 4)
+    index = vector_index.get_index("sessions")
+    dim = index.dim
+    with transaction() as conn:
+        for _ in range(5):  # every round replaces all rows, leaving dead ones behind
+            index.add(conn, [(f"s{i}", _vec(i, dim)) for i in range(6)])
+        assert index._generation(conn) > 0
+        assert index._rows_in(index._path(index._generation(conn))) <= 12
+        assert index.search(conn, _vec(3, dim), 1)[0][0] == "s3"
+    # Superseded generations are deleted by the next compaction
+    assert len(list(index.directory.glob("sessions.*.f32"))) <= 2
+
+
+@pytest.mark.parametrize("quantization, dims", [("int8", None), ("binary", None), ("int8", 128)])
+def test_quantized_search_reranks_on_floats(engram_home, write_config, quantization, dims):
+    write_config(vector_engine="numpy", vector_quantization=quantization, vector_dims=dims)
+    from engram.storage.db import init_db
+    init_db()
+    index = vector_index.get_index("sessions")
+    dim = index.dim
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((300, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    with transaction() as conn:
+        index.add(conn, [(f"s{i}", v.tobytes()) for i, v in enumerate(vectors)])
+        query = vectors[42] + 0.01 * rng.standard_normal(dim).astype(np.float32)
+        hits = index.search(conn, query.tobytes(), 5)
+        # Distances come from the float rerank, not the codes
+        assert hits[0][0] == "s42"
+        assert hits[0][1] == pytest.approx(float(np.linalg.norm(query - vectors[42])), rel=1e-4)
+        st = index.stats(conn)
+    assert st["quantization"] == quantization
+    assert 0 < st["code_bytes"] < st["float_bytes"]
+    assert st["recall"] >= 0.8
+
+
+def test_unknown_quantization():
+    with pytest.raises(ValueError):
+        vector_index.NumpyIndex("sessions", quantization="int4")
+
+
+def test_ivf_probes_lists_after_train(engram_home, write_config):
+    write_config(vector_engine="numpy", ann_min_rows=100, ann_nprobe=4)
+    from engram.storage.db import init_db
+    init_db()
+    index = vector_index.get_index("sessions")
+    dim = index.dim
+    rng = np.random.default_rng(2)
+    vectors = rng.standard_normal((400, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    with transaction() as conn:
+        index.add(conn, [(f"s{i}", v.tobytes()) for i, v in enumerate(vectors)])
+        assert index.stats(conn)["ann_active"] is False
+        assert index.train(conn, nlist=16) == {"vectors": 400, "nlist": 16}
+        hits = index.search(conn, vectors[7].tobytes(), 3)
+        assert hits[0][0] == "s7"
+        st = index.stats(conn)
+    assert st["ann_lists"] == 16
+    assert st["ann_active"] is True
+    assert st["recall"] is not None
+
+
+def test_auto_picks_numpy_for_numpy_only_settings(engram_home, write_config, monkeypatch):
+    monkeypatch.setattr(vector_index, "sqlite_vec_available", lambda conn: True)
+    conn = get_db()
+    write_config()
+    assert vector_index.engine_name(conn) == "sqlite-vec"
+    write_config(vector_quantization="none")
+    assert vector_index.engine_name(conn) == "sqlite-vec"
+    write_config(vector_quantization="int8")
+    assert vector_index.engine_name(conn) == "numpy"
+    assert vector_index.ignored_settings(conn) == []
+
+
+def test_ignored_settings_with_explicit_sqlite_vec(engram_home, write_config):
+    write_config(vector_engine="sqlite-vec", vector_quantization="int8", ann_nprobe=4)
+    assert vector_index.ignored_settings(get_db()) == ["vector_quantization", "ann_nprobe"]
+    write_config(vector_engine="sqlite-vec", vector_quantization="none")
+    assert vector_index.ignored_settings(get_db()) == []
+
+
+def test_engine_switch_requeues_sessions(engram_db, write_config):
+    from engram.storage.db import init_db, upsert_sessions
+    from conftest import make_session
+    write_config(vector_engine="numpy")
+    init_db()
+    upsert_sessions([make_session("a"), make_session("b")], embed=False)
+    with transaction() as conn:
+        conn.execute("DELETE FROM pending_embeddings")
+    init_db()
+    assert get_db().execute("SELECT COUNT(*) FROM pending_embeddings").fetchone()[0] == 0
+
+    # Vectors written by another engine are not in this one: re-embed everything
+    with transaction() as conn:
+        conn.execute("UPDATE engram_meta SET value = 'sqlite-vec' WHERE key = 'vector_engine'")
+    init_db()
+    conn = get_db()
+    assert conn.execute("SELECT COUNT(*) FROM pending_embeddings").fetchone()[0] == 2
+    assert conn.execute("SELECT value FROM engram_meta WHERE key = 'vector_engine'").fetchone()[0] == "numpy"
+
+
+def test_reindex_is_a_no_op_on_sqlite_vec(engram_home, write_config):
+    from typer.testing import CliRunner
+    from engram.cli import app
+    if not vector_index.sqlite_vec_available(get_db()):
+        pytest.skip("sqlite-vec extension not loadable")
+    write_config(vector_engine="sqlite-vec", ann_nprobe=4)
+    result = CliRunner().invoke(app, ["reindex"])
+    assert result.exit_code == 0
+    assert "ann_nprobe" in result.output
+
+
+def test_reindex_trains_under_auto_with_ivf_settings(engram_home, write_config):
+    from typer.testing import CliRunner
+    from engram.cli import app
+    write_config(ann_min_rows=10)
+    result = CliRunner().invoke(app, ["reindex"])
+    assert result.exit_code == 0, result.output
+    assert vector_index.engine_name(get_db()) == "numpy"
+    assert "sessions: 0 vectors" in result.output
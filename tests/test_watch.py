@@ -0,0 +1,70 @@
+"""SessionWatcher ingests only the sources behind changed files, and keeps going when one extractor fails."""
+from engram.extractors.claude_code import ClaudeCodeExtractor
+from engram.extractors.openclaw import OpenClawExtractor
+from engram.storage.db import get_db
+
+from test_extractors import _claude_code, _jsonl, _openclaw
+
+
+def test_catch_up_then_changed_paths(engram_db):
+    _claude_code(engram_db)
+    _openclaw(engram_db)
+    from engram.watch import SessionWatcher
+    claude, openclaw = ClaudeCodeExtractor(), OpenClawExtractor()
+    watcher = SessionWatcher([claude, openclaw])
+    assert watcher.flush() == {"claude_code": 1, "openclaw": 1}
+    assert watcher.flush() == {}
+
+    source = next(claude.iter_sources())
+    _jsonl(source, [{"role": "user", "content": "one more question"}])
+    other = engram_db / ".claude" / "projects" / "notes.txt"
+    other.write_text("not a session log")
+    assert watcher.flush({source, other}) == {"claude_code": 1}
+    assert get_db().execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 5
+
+
+def test_source_for_path(engram_home):
+    claude = ClaudeCodeExtractor()
+    log = claude.watch_paths()[0] / "-home-dev-engram" / "a1.jsonl"
+    assert claude.source_for_path(log) == log
+    assert claude.source_for_path(log.with_suffix(".json")) is None
+
+
+class _Broken(ClaudeCodeExtractor):
+    name = "broken"
+
+    def extract_sessions(self, manifest=None, sources=None):
+        raise TypeError("parse_source() takes 2 positional arguments but 3 were given")
+
+
+def test_flush_skips_failing_extractor(engram_db):
+    _claude_code(engram_db)
+    from engram.watch import SessionWatcher
+    errors = []
+    watcher = SessionWatcher([_Broken(), ClaudeCodeExtractor()], on_error=lambda stage, e: errors.append(stage))
+    assert watcher.flush() == {"claude_code": 1}
+    assert errors == ["broken"]
+
+
+def test_flush_survives_post_ingest_failure(engram_db, monkeypatch):
+    import engram.context_gen
+    _claude_code(engram_db)
+
+    def fail():
+        raise OSError("disk full")
+    monkeypatch.setattr(engram.context_gen, "update_context_files", fail)
+    from engram.watch import SessionWatcher
+    errors = []
+    watcher = SessionWatcher([ClaudeCodeExtractor()], on_error=lambda stage, e: errors.append(stage))
+    assert watcher.flush() == {"claude_code": 1}
+    assert errors == ["post-ingest"]
+
+
+def test_sessions_brief_is_read_in_slices(engram_db, monkeypatch):
+    from engram.storage import retention
+    from engram.storage.db import get_sessions_brief, upsert_sessions
+    from conftest import make_session
+    monkeypatch.setattr(retention, "ID_SLICE", 2)
+    upsert_sessions([make_session(f"s{i}") for i in range(5)], embed=False)
+    brief = get_sessions_brief([f"s{i}" for i in range(5)] + ["s0", "missing"])
+    assert sorted(s["id"] for s in brief) == [f"s{i}" for i in range(5)]